@@ -62,10 +62,33 @@ def create_app() -> Flask:
         from .models.payment import Payment, PaymentApplication  # noqa: F401
         from .models.variant import ProductVariant, VariantPriceTier  # noqa: F401
         from .models.weekly_offer import WeeklyOffer  # noqa: F401
+        from .models.order_ledger import OrderLedger  # noqa: F401
+        from .models.customer_balance import CustomerBalance, CustomerOrderBalance  # noqa: F401
+        from .models.vendor_commission_daily import VendorCommissionDaily  # noqa: F401
+        from .models.excess_inventory import ExcessInventory  # noqa: F401
+        from .models.parse_job import ParseJob, ParseJobItem  # noqa: F401
+        from .models.order_version import OrderVersion  # noqa: F401
+        from .models.kpi_daily import KpiDaily, KpiCustomerDaily, KpiProductDaily, KpiDirtyDay, KpiRefreshState  # noqa: F401
         # Social media models
         from .social.models import InstagramContent, WhatsAppMessage, ContentTemplate, SocialSchedule, StoryTemplate, StoryContent, StoryGeneration  # noqa: F401
         db.create_all()
 
+        # Tablas derivadas mantenidas en cada commit (ver services/change_tracker)
+        from .services.change_tracker import install_change_tracking
+        from .services import order_ledger  # noqa: F401
+        from .services import customer_balances  # noqa: F401
+        # después del ledger: las comisiones diarias se calculan desde sus filas
+        from .services import vendor_commissions  # noqa: F401
+        from .services import excess_inventory  # noqa: F401
+        from .services import price_book  # noqa: F401
+        from .services import order_versions  # noqa: F401
+        # después del ledger: anota los días de los pedidos cuyo ledger cambió
+        from .services import kpi_facts  # noqa: F401
+        # invalida la caché de respuestas después de cada commit
+        from .services.response_cache import init_response_cache
+        install_change_tracking()
+        init_response_cache(app)
+
         from .api.auth import auth_bp
         from .api.products import products_bp
         from .api.backup import backup_bp
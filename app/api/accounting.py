@@ -1,4 +1,8 @@
+from datetime import datetime, timedelta
+from itertools import islice
+
 from flask import Blueprint, jsonify, request
+from sqlalchemy import and_, func, or_
 
 from ..db import db
 from ..models.order import Order
@@ -9,11 +13,30 @@ from ..models.order_item import OrderItem
 from ..models.purchase import Purchase
 from ..models.variant import VariantPriceTier
 from ..models.catalog_price import CatalogPrice
+from ..models.customer_balance import CustomerBalance, CustomerOrderBalance
+from ..models.excess_inventory import ExcessInventory
+from ..models.order_ledger import OrderLedger
+from ..models.product import Product
+from ..services.accounting_engine import build_orders_summary
+from ..services.conversions import recalc_conversions as recalc_order_conversions
+from ..services.customer_balances import charge_amount
+from ..services.order_ledger import ledger_summary
+from ..services.purchase_coverage import EXCESS_EPSILON, load_coverage
+from ..services.response_cache import cache_stats, cache_tags, cached_response, customer_tags, order_tags
+from ..services.vendor_commissions import commissions_by_vendor
+from ..utils.pagination import (
+    NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, keyset_filter, ndjson_response, page_limit, wants_ndjson,
+)
 from .auth import require_token
 
 
 accounting_bp = Blueprint("accounting", __name__)
 
+# Paginación de /accounting/orders y tamaño de lote al enviar NDJSON
+_ORDERS_PAGE_SIZE = 200
+_ORDERS_MAX_PAGE_SIZE = 1000
+_STREAM_BATCH_SIZE = 100
+
 
 def _sum_billed(charges: list[Charge]) -> float:
     return sum(max(0.0, (c.total or 0.0) - (c.discount_amount or 0.0)) for c in charges)
@@ -27,397 +50,149 @@ def _sum_paid_for_charge_ids(charge_ids: list[int]) -> float:
 
 
 @accounting_bp.get("/accounting/orders")
+@cached_response
 def orders_summary():
     """
     Resumen de contabilidad por pedido.
     
     Query params:
     - include_details=1 : Incluye desglose por cliente y producto
+    - limit=N : Pedidos por página (por defecto 200, máximo 1000)
+    - cursor=X : Continúa desde el header X-Next-Cursor de la página anterior
+    
+    Con Accept: application/x-ndjson se envía una fila por línea a medida
+    que se calcula, recorriendo todos los pedidos (o hasta limit) por lotes.
     
     Lógica simplificada:
     1. FACTURADO = suma de charges activos (no cancelados)
     2. COSTO = suma de price_total de cada Purchase
     3. COMPRADO/FALTANTE = comparación de cantidades pedidas vs compradas
     
+    Sin include_details las filas se leen de order_ledger (una consulta por
+    página más la de vendedores) y cada página trae solo pedidos con
+    facturación. El detalle por cliente y producto se calcula en
+    services/accounting_engine con un número constante de consultas para
+    toda la ventana de pedidos.
+    
     Los vendedores solo ven sus propias órdenes.
     """
     # Retrocompatibilidad: funciona con o sin autenticación
     user = getattr(request, 'current_user', None)
     include_details = request.args.get('include_details') == '1'
     
-    query = Order.query
+    ndjson = wants_ndjson()
+    try:
+        limit = page_limit(None if ndjson else _ORDERS_PAGE_SIZE, None if ndjson else _ORDERS_MAX_PAGE_SIZE)
+        after = decode_cursor(request.args["cursor"], (datetime, int)) if request.args.get("cursor") else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if include_details:
+        query = Order.query
+    else:
+        query = (
+            db.session.query(Order, OrderLedger)
+            .join(OrderLedger, OrderLedger.order_id == Order.id)
+            .filter(OrderLedger.billed > 0)
+        )
     
     # Si es vendedor, filtrar solo sus órdenes
     if user and user.role == 'vendor':
         query = query.filter(Order.vendor_id == user.id)
     
-    orders = query.order_by(Order.created_at.desc()).limit(200).all()
-    result = []
+    if after:
+        query = query.filter(keyset_filter((Order.created_at, Order.id), after, descending=True))
+    query = query.order_by(Order.created_at.desc(), Order.id.desc())
     
-    for o in orders:
-        # Obtener items del pedido
-        items = OrderItem.query.filter_by(order_id=o.id).all()
-        
-        # Obtener compras del pedido
-        purchases = Purchase.query.filter_by(order_id=o.id).all()
-        
-        # ===== 1. CÁLCULO DE FACTURADO =====
-        # USAR CHARGES en lugar de OrderItems para tener el monto real facturado (considerando cancelaciones)
-        # Usamos SOLO order_id (no original_order_id) para que solo aparezca en el pedido ACTUAL
-        charges = Charge.query.filter(
-            Charge.order_id == o.id
-        ).filter(
-            Charge.status != 'cancelled'  # No contar cargos cancelados
-        ).all()
-        
-        billed_total = 0.0
-        billed_by_customer = {}
-        
-        for charge in charges:
-            # Cantidad a cobrar
-            qty_to_bill = charge.charged_qty if charge.charged_qty is not None else None
-            if qty_to_bill is None:
-                # Si no hay charged_qty en el cargo, intentar tomar la conversión desde el OrderItem
-                try:
-                    if charge.order_item_id:
-                        oi = OrderItem.query.get(charge.order_item_id)
-                        if oi and oi.charged_qty is not None:
-                            qty_to_bill = float(oi.charged_qty or 0.0)
-                except Exception:
-                    qty_to_bill = None
-            if qty_to_bill is None:
-                # Fallback final: usar la cantidad original del cargo (puede estar en unidad pedida)
-                qty_to_bill = float(charge.qty or 0.0)
-            
-            # Precio de venta por unidad
-            unit_price = float(charge.unit_price or 0.0)
-            
-            # Monto facturado
-            charge_billed = qty_to_bill * unit_price
-            billed_total += charge_billed
-            
-            # Acumular por cliente
-            customer_id = charge.customer_id
-            billed_by_customer[customer_id] = billed_by_customer.get(customer_id, 0.0) + charge_billed
-        
-        # ===== 2. CÁLCULO DE COSTO =====
-        total_cost = 0.0
-        for purchase in purchases:
-            if purchase.price_total is not None:
-                total_cost += float(purchase.price_total or 0.0)
-            else:
-                # Si no hay price_total, calcular desde price_per_unit × cantidad en charged_unit
-                unit = purchase.charged_unit or "kg"
-                qty = float(purchase.qty_kg or 0.0) if unit == "kg" else float(purchase.qty_unit or 0.0)
-                total_cost += float(purchase.price_per_unit or 0.0) * qty
-        
-        # ===== 3. ESTADO DE COMPRA (completo/incompleto/exceso) =====
-        # Cantidades necesarias por producto (según lo pedido)
-        needed_by_product = {}
-        for item in items:
-            pid = item.product_id
-            unit = item.unit or "kg"
-            if pid not in needed_by_product:
-                needed_by_product[pid] = {"kg": 0.0, "unit": 0.0}
-            needed_by_product[pid][unit] = needed_by_product[pid].get(unit, 0.0) + float(item.qty or 0.0)
-        
-        # Cantidades compradas por producto
-        purchased_by_product = {}
-        for purchase in purchases:
-            pid = purchase.product_id
-            if pid not in purchased_by_product:
-                purchased_by_product[pid] = {"kg": 0.0, "unit": 0.0}
-            
-            # Sumar kg comprados (incluyendo equivalencia)
-            if purchase.qty_kg:
-                purchased_by_product[pid]["kg"] += float(purchase.qty_kg or 0.0)
-            if purchase.eq_qty_kg is not None:
-                purchased_by_product[pid]["kg"] += float(purchase.eq_qty_kg or 0.0)
-            
-            # Sumar unidades compradas (incluyendo equivalencia)
-            if purchase.qty_unit:
-                purchased_by_product[pid]["unit"] += float(purchase.qty_unit or 0.0)
-            if purchase.eq_qty_unit is not None:
-                purchased_by_product[pid]["unit"] += float(purchase.eq_qty_unit or 0.0)
-        
-        # Determinar estado (complete/incomplete/over)
-        status = "complete"
-        has_excess = False
-        bought_tags = []
-        missing_tags = []
-        
-        for pid, needed in needed_by_product.items():
-            purchased = purchased_by_product.get(pid, {"kg": 0.0, "unit": 0.0})
-            
-            need_kg = float(needed.get("kg", 0.0) or 0.0)
-            need_unit = float(needed.get("unit", 0.0) or 0.0)
-            got_kg = float(purchased.get("kg", 0.0) or 0.0)
-            got_unit = float(purchased.get("unit", 0.0) or 0.0)
-            
-            # Verificar si está completo
-            kg_ok = (need_kg == 0 or got_kg >= need_kg)
-            unit_ok = (need_unit == 0 or got_unit >= need_unit)
-            
-            if not (kg_ok and unit_ok):
-                status = "incomplete"
-            
-            # Verificar si hay exceso
-            if (need_kg > 0 and got_kg > need_kg) or (need_unit > 0 and got_unit > need_unit):
-                has_excess = True
-            
-            # Tags de comprado/faltante
-            if got_kg > 0 or got_unit > 0:
-                bought_tags.append({"product_id": pid, "kg": got_kg, "unit": got_unit})
-            
-            missing_kg = max(0.0, need_kg - got_kg)
-            missing_unit = max(0.0, need_unit - got_unit)
-            if missing_kg > 0 or missing_unit > 0:
-                missing_tags.append({"product_id": pid, "kg": missing_kg, "unit": missing_unit})
-        
-        if status == "complete" and has_excess:
-            status = "over"
-        
-        # ===== 4. PAGADO =====
-        # Usar los mismos charges que se usaron para calcular billed
-        charge_ids = [c.id for c in charges]
-        paid = _sum_paid_for_charge_ids(charge_ids)
-        
-        # ===== 5. DETALLES (si se solicita) =====
-        customers_detail = []
-        if include_details:
-            from ..models.customer import Customer
-            from ..models.product import Product
-            
-            # Agrupar charges por cliente
-            charges_by_customer = {}
-            for charge in charges:
-                if charge.customer_id not in charges_by_customer:
-                    charges_by_customer[charge.customer_id] = []
-                charges_by_customer[charge.customer_id].append(charge)
-            
-            for customer_id, cust_charges in charges_by_customer.items():
-                customer = Customer.query.get(customer_id)
-                cust_billed = billed_by_customer.get(customer_id, 0.0)
-                
-                # Agrupar por producto
-                products_detail = []
-                charges_by_product = {}
-                for charge in cust_charges:
-                    if charge.product_id not in charges_by_product:
-                        charges_by_product[charge.product_id] = []
-                    charges_by_product[charge.product_id].append(charge)
-                
-                for product_id, prod_charges in charges_by_product.items():
-                    product = Product.query.get(product_id)
-                    
-                    # Sumar cantidad y monto total para este producto
-                    total_qty = sum(
-                        (c.charged_qty if c.charged_qty is not None else c.qty) 
-                        for c in prod_charges
-                    )
-                    total_billed = sum(
-                        (c.charged_qty if c.charged_qty is not None else c.qty) * c.unit_price
-                        for c in prod_charges
-                    )
-                    
-                    # Estado de compra del producto
-                    purchased = purchased_by_product.get(product_id, {"kg": 0.0, "unit": 0.0})
-                    needed = needed_by_product.get(product_id, {"kg": 0.0, "unit": 0.0})
-                    
-                    # Usar la unidad del primer charge para determinar status
-                    unit = prod_charges[0].unit
-                    if unit == 'kg':
-                        purchase_ok = purchased.get("kg", 0) >= needed.get("kg", 0)
-                        has_excess = purchased.get("kg", 0) > needed.get("kg", 0)
-                    else:
-                        purchase_ok = purchased.get("unit", 0) >= needed.get("unit", 0)
-                        has_excess = purchased.get("unit", 0) > needed.get("unit", 0)
-                    
-                    products_detail.append({
-                        "product_id": product_id,
-                        "product_name": product.name if product else f"Producto #{product_id}",
-                        "qty": total_qty,
-                        "unit": unit,
-                        "unit_price": prod_charges[0].unit_price,  # Asumimos mismo precio
-                        "total_billed": total_billed,
-                        "purchase_status": "complete" if purchase_ok else ("over" if has_excess else "incomplete"),
-                        "charges": [c.to_dict() for c in prod_charges]
-                    })
-                
-                customers_detail.append({
-                    "customer_id": customer_id,
-                    "customer_name": customer.name if customer else f"Cliente #{customer_id}",
-                    "billed": cust_billed,
-                    "products": products_detail
-                })
-        
-        # ===== 6. COMISIONES DE VENDEDORES =====
-        vendor_commission_amount = 0.0
-        vendor_commission_pct = 0.0
-        kivi_amount = 0.0
-        vendor_info = None
-        
-        # Si el pedido tiene un vendedor asignado, calcular su comisión
-        if o.vendor_id:
-            from ..models.user import User
-            vendor = User.query.get(o.vendor_id)
-            if vendor:
-                profit_amount = max(0.0, billed_total - total_cost)
-                vendor_commission_pct = vendor.commission_rate * 100  # Convertir a porcentaje para display
-                vendor_commission_amount = profit_amount * vendor.commission_rate
-                kivi_amount = profit_amount - vendor_commission_amount
-                vendor_info = {
-                    "vendor_id": vendor.id,
-                    "vendor_name": vendor.name,
-                    "commission_rate": vendor.commission_rate
-                }
-        else:
-            # Si no hay vendedor, toda la utilidad es para Kivi
-            profit_amount = max(0.0, billed_total - total_cost)
-            kivi_amount = profit_amount
-        
-        # ===== 7. RESULTADO =====
-        profit_pct = (profit_amount / billed_total * 100.0) if billed_total > 0 else 0.0
-        
-        # Solo incluir pedidos con facturación > 0
-        if billed_total > 0:
-            row = {
-            "order": o.to_dict(),
-                "billed": billed_total,
-            "paid": paid,
-                "due": max(0.0, billed_total - paid),
-            "purchase_status": status,
-            "cost": total_cost,
-            "profit_amount": profit_amount,
-            "profit_pct": profit_pct,
-                # Comisiones de vendedor
-                "vendor_commission_amount": vendor_commission_amount,
-                "vendor_commission_pct": vendor_commission_pct,
-                "kivi_amount": kivi_amount,
-                "vendor_info": vendor_info,
-                "bought_money": 0.0,  # No usado en frontend
-                "missing_money": 0.0,  # No usado en frontend
-            "bought_tags": bought_tags,
-            "missing_tags": missing_tags,
-            "billed_by_customer": billed_by_customer,
-            }
-            
-            if include_details:
-                row["customers"] = customers_detail
-                # Incluir detalles de compras con información de productos
-                from ..models.product import Product
-                purchases_detail = []
-                for purchase in purchases:
-                    product = Product.query.get(purchase.product_id)
-                    purchases_detail.append({
-                        **purchase.to_dict(),
-                        "product_name": product.name if product else f"Producto #{purchase.product_id}"
-                    })
-                row["purchases"] = purchases_detail
-            
-            result.append(row)
+    if ndjson:
+        if limit:
+            query = query.limit(limit)
+        return ndjson_response(_stream_orders_summary(query, include_details))
     
-    return jsonify(result)
-@accounting_bp.post("/accounting/recalc-conversions")
-def recalc_conversions():
-    """
-    Recalcular charged_qty/charged_unit para todos los OrderItems y Charges de un pedido
-    usando las equivalencias anotadas en las compras (eq_qty_kg, eq_qty_unit).
+    rows = query.limit(limit).all()
+    orders = rows if include_details else [order for order, _ in rows]
+    cache_tags("orders:new", "table:users", "table:customers", "table:products", *order_tags(o.id for o in orders))
+    if not include_details:
+        # la página filtra por facturado > 0: cualquier pedido que pase a tener facturación puede entrar en ella
+        cache_tags("orders:any")
+    response = jsonify(_orders_summary_rows(rows, include_details))
+    if len(orders) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(orders[-1].created_at, orders[-1].id)
+    return response
 
-    Parámetros:
-      - order_id: int (requerido) en querystring o JSON
-    """
-    order_id = request.args.get('order_id', type=int)
-    if not order_id and request.is_json:
-        body = request.get_json(silent=True) or {}
-        order_id = body.get('order_id')
-    if not order_id:
-        return jsonify({"error": "order_id requerido"}), 400
 
-    order = Order.query.get(order_id)
-    if not order:
-        return jsonify({"error": "Pedido no encontrado"}), 404
+def _orders_summary_rows(rows, include_details: bool) -> list:
+    """Filas de una página: pedidos (con detalle, en vivo) o pares (pedido, ledger)."""
+    if include_details:
+        return build_orders_summary(rows, include_details=True)
+    return ledger_summary(rows)
 
-    # Ratios observados por producto
-    purchases = Purchase.query.filter_by(order_id=order_id).all()
-    ratios = {}
-    for p in purchases:
-        pid = p.product_id
-        charged_unit = p.charged_unit or 'kg'
-        units_per_kg = None
-        try:
-            if charged_unit == 'kg':
-                u = float(p.qty_unit or 0.0)
-                kg_eq = float(p.eq_qty_kg or 0.0) if p.eq_qty_kg is not None else 0.0
-                if u > 0 and kg_eq > 0:
-                    units_per_kg = u / kg_eq
-            else:
-                kg = float(p.qty_kg or 0.0)
-                u_eq = float(p.eq_qty_unit or 0.0) if p.eq_qty_unit is not None else 0.0
-                if kg > 0 and u_eq > 0:
-                    units_per_kg = u_eq / kg
-        except Exception:
-            pass
 
-        r = ratios.get(pid) or {}
-        # Mantener la primera equivalencia válida que encontremos
-        if units_per_kg and units_per_kg > 0 and not r.get('units_per_kg'):
-            r['units_per_kg'] = units_per_kg
-        # Registrar la unidad de cobro observada (última prevalece)
-        r['charged_unit'] = charged_unit
-        ratios[pid] = r
+def _stream_orders_summary(query, include_details: bool):
+    """Filas de contabilidad leyendo los pedidos por lotes desde un cursor del servidor."""
+    rows_iter = iter(query.yield_per(_STREAM_BATCH_SIZE))
+    while True:
+        rows = list(islice(rows_iter, _STREAM_BATCH_SIZE))
+        if not rows:
+            return
+        yield from _orders_summary_rows(rows, include_details)
 
-    # Actualizar OrderItems
-    items = OrderItem.query.filter_by(order_id=order_id).all()
-    for it in items:
-        r = ratios.get(it.product_id)
-        if not r:
-            continue
-        charged_unit = r.get('charged_unit') or (it.charged_unit or it.unit or 'kg')
-        it.charged_unit = charged_unit
-        qty_original = float(it.qty or 0.0)
-        if (it.unit or 'kg') == charged_unit:
-            it.charged_qty = qty_original
-        else:
-            ratio = r.get('units_per_kg')
-            if ratio and ratio > 0:
-                if charged_unit == 'kg' and (it.unit or 'kg') == 'unit':
-                    it.charged_qty = qty_original / ratio
-                elif charged_unit == 'unit' and (it.unit or 'kg') == 'kg':
-                    it.charged_qty = qty_original * ratio
-                else:
-                    it.charged_qty = qty_original
-            else:
-                it.charged_qty = qty_original
 
-    db.session.flush()
+@accounting_bp.post("/accounting/recalc-conversions")
+def recalc_conversions():
+    """
+    Recalcular charged_qty/charged_unit para todos los OrderItems y Charges de
+    uno o varios pedidos usando las equivalencias anotadas en las compras
+    (eq_qty_kg, eq_qty_unit). Todo se aplica en una sola transacción (ver
+    services/conversions).
+
+    Parámetros (querystring o JSON):
+      - order_id: int, un pedido (respuesta con ratios e items del pedido)
+      - order_ids: lista de ints, o
+      - date_from / date_to: YYYY-MM-DD, pedidos creados en el rango (inclusive)
+    Con order_ids o fechas la respuesta trae el delta de facturado por pedido.
+    """
+    body = (request.get_json(silent=True) or {}) if request.is_json else {}
+    order_id = request.args.get('order_id', type=int) or body.get('order_id')
+    order_ids = body.get('order_ids') or request.args.getlist('order_ids', type=int)
+    date_from = request.args.get('date_from') or body.get('date_from')
+    date_to = request.args.get('date_to') or body.get('date_to')
+
+    if order_id:
+        order = Order.query.get(order_id)
+        if not order:
+            return jsonify({"error": "Pedido no encontrado"}), 404
+        result = recalc_order_conversions([order_id])
+        db.session.commit()
+        return jsonify({
+            'order_id': order_id,
+            'ratios': result['ratios'][order_id],
+            'items': result['items'].get(order_id, []),
+            'deltas': result['orders'].get(order_id),
+        })
 
-    # Actualizar Charges vinculados
-    for it in items:
-        try:
-            charges = Charge.query.filter(Charge.order_item_id == it.id).all()
-            for ch in charges:
-                ch.charged_qty = it.charged_qty
-                qty_to_charge = ch.charged_qty if ch.charged_qty is not None else float(ch.qty or 0.0)
-                ch.total = qty_to_charge * float(ch.unit_price or 0.0)
-        except Exception:
-            pass
+    if not order_ids and not (date_from or date_to):
+        return jsonify({"error": "order_id, order_ids o date_from/date_to requerido"}), 400
 
-    db.session.commit()
+    query = db.session.query(Order.id)
+    try:
+        if order_ids:
+            query = query.filter(Order.id.in_([int(i) for i in order_ids]))
+        if date_from:
+            query = query.filter(Order.created_at >= datetime.strptime(date_from, '%Y-%m-%d'))
+        if date_to:
+            query = query.filter(Order.created_at < datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1))
+    except (TypeError, ValueError):
+        return jsonify({"error": "order_ids deben ser enteros y las fechas YYYY-MM-DD"}), 400
+    ids = [oid for (oid,) in query.order_by(Order.id.asc()).all()]
 
+    result = recalc_order_conversions(ids)
+    db.session.commit()
+    orders = list(result['orders'].values())
     return jsonify({
-        'order_id': order_id,
-        'ratios': ratios,
-        'items': [
-            {
-                'id': it.id,
-                'product_id': it.product_id,
-                'qty': it.qty,
-                'unit': it.unit,
-                'charged_qty': it.charged_qty,
-                'charged_unit': it.charged_unit
-            } for it in items
-        ]
+        'order_ids': ids,
+        'orders': orders,
+        'billed_delta': sum(o['billed_delta'] for o in orders),
     })
 
 
@@ -478,129 +253,91 @@ def update_charge_quantity(charge_id):
     return jsonify(charge.to_dict())
 
 
+def _product_names(product_ids) -> dict:
+    ids = {pid for pid in product_ids if pid is not None}
+    if not ids:
+        return {}
+    from ..models.product import Product
+    return dict(db.session.query(Product.id, Product.name).filter(Product.id.in_(ids)).all())
+
+
+def _excess_rows(order_id, coverage, names, only_excess=True) -> list:
+    """Excedentes (comprado - pedido, en la unidad de cobro) de un pedido, redondeados para la respuesta."""
+    return [
+        {
+            "order_id": order_id,
+            "product_id": e["product_id"],
+            "product_name": names.get(e["product_id"]) or f"Producto #{e['product_id']}",
+            "excess_qty": round(e["excess_qty"], 2),
+            "unit": e["unit"],
+            "needed_qty": round(e["needed_qty"], 2),
+            "purchased_qty": round(e["purchased_qty"], 2),
+            "reassigned_qty": 0.0  # Sin reasignaciones en el cálculo
+        }
+        for e in coverage.excesses(order_id, only_excess=only_excess)
+    ]
+
+
 @accounting_bp.get("/accounting/excess")
+@cached_response
 def calculate_excess():
     """
     Calcular excedentes simples: diferencia entre lo comprado y lo pedido
     (en la unidad de cobro, con conversiones aplicadas)
+    
+    Lee la tabla excess_inventory (ver services/excess_inventory), que se
+    mantiene al escribir compras e items.
     """
     orders = Order.query.order_by(Order.created_at.desc()).limit(50).all()
-    result = []
+    order_ids = [o.id for o in orders]
+    cache_tags("orders:new", "orphans", "table:products", *order_tags(order_ids))
+    
+    # Filas con excedente de esos pedidos y compras SIN order_id (excedentes que no corresponden a un pedido)
+    rows = (
+        db.session.query(ExcessInventory, Product.name)
+        .outerjoin(Product, Product.id == ExcessInventory.product_id)
+        .filter(or_(
+            and_(ExcessInventory.order_id.in_(order_ids), ExcessInventory.excess > EXCESS_EPSILON),
+            ExcessInventory.order_id.is_(None),
+        ))
+        .order_by(ExcessInventory.first_purchase_id.asc())
+        .all()
+    )
+    by_order = {}
+    for row, product_name in rows:
+        by_order.setdefault(row.order_id, []).append({
+            "order_id": row.order_id,
+            "product_id": row.product_id,
+            "product_name": product_name or f"Producto #{row.product_id}",
+            "excess_qty": round(row.excess, 2),
+            "unit": row.unit,
+            "needed_qty": round(row.needed, 2),
+            "purchased_qty": round(row.purchased, 2),
+            "reassigned_qty": 0.0  # Sin reasignaciones en el cálculo
+        })
     
+    result = []
     for o in orders:
-        # Obtener items y compras del pedido
-        items = OrderItem.query.filter_by(order_id=o.id).all()
-        purchases = Purchase.query.filter_by(order_id=o.id).all()
-        
-        if not purchases:
-            continue
-        
-        # Agrupar lo pedido por producto en la unidad de cobro
-        needed_by_product = {}
-        for item in items:
-            pid = item.product_id
-            charged_unit = item.charged_unit or item.unit or "kg"
-            charged_qty = item.charged_qty if item.charged_qty is not None else float(item.qty or 0.0)
-            
-            if pid not in needed_by_product:
-                needed_by_product[pid] = {"unit": charged_unit, "qty": 0.0}
-            needed_by_product[pid]["qty"] += charged_qty
-        
-        # Agrupar lo comprado por producto en la unidad de cobro
-        purchased_by_product = {}
-        for purchase in purchases:
-            pid = purchase.product_id
-            charged_unit = purchase.charged_unit or "kg"
-            
-            if pid not in purchased_by_product:
-                purchased_by_product[pid] = {"unit": charged_unit, "qty": 0.0}
-            
-            # Sumar la cantidad comprada en la unidad de cobro
-            if charged_unit == "kg":
-                purchased_by_product[pid]["qty"] += float(purchase.qty_kg or 0.0)
-                if purchase.eq_qty_kg:
-                    purchased_by_product[pid]["qty"] += float(purchase.eq_qty_kg or 0.0)
-            else:  # unit
-                purchased_by_product[pid]["qty"] += float(purchase.qty_unit or 0.0)
-                if purchase.eq_qty_unit:
-                    purchased_by_product[pid]["qty"] += float(purchase.eq_qty_unit or 0.0)
-        
-        # Calcular excedentes: comprado - pedido (simple)
-        excesses = []
-        for pid, purchased in purchased_by_product.items():
-            needed = needed_by_product.get(pid, {"unit": purchased["unit"], "qty": 0.0})
-            
-            # Excedente simple = comprado - pedido
-            excess_qty = purchased["qty"] - needed["qty"]
-            
-            if excess_qty > 0.01:  # Solo si hay excedente
-                from ..models.product import Product
-                product = Product.query.get(pid)
-                excesses.append({
-                    "order_id": o.id,
-                    "product_id": pid,
-                    "product_name": product.name if product else f"Producto #{pid}",
-                    "excess_qty": round(excess_qty, 2),
-                    "unit": purchased["unit"],
-                    "needed_qty": round(needed["qty"], 2),
-                    "purchased_qty": round(purchased["qty"], 2),
-                    "reassigned_qty": 0.0  # Sin reasignaciones en el cálculo
-                })
-        
+        excesses = by_order.get(o.id)
         if excesses:
             result.append({
                 "order": o.to_dict(),
                 "excesses": excesses
             })
     
-    # Obtener compras SIN order_id (compras de excedente que no corresponden a un pedido)
-    orphan_purchases = Purchase.query.filter(Purchase.order_id.is_(None)).all()
-    
-    # Agrupar por producto
-    if orphan_purchases:
-        orphan_by_product = {}
-        for purchase in orphan_purchases:
-            pid = purchase.product_id
-            charged_unit = purchase.charged_unit or "kg"
-            
-            if pid not in orphan_by_product:
-                orphan_by_product[pid] = {"unit": charged_unit, "qty": 0.0}
-            
-            if charged_unit == "kg":
-                orphan_by_product[pid]["qty"] += float(purchase.qty_kg or 0.0)
-                if purchase.eq_qty_kg:
-                    orphan_by_product[pid]["qty"] += float(purchase.eq_qty_kg or 0.0)
-            else:  # unit
-                orphan_by_product[pid]["qty"] += float(purchase.qty_unit or 0.0)
-                if purchase.eq_qty_unit:
-                    orphan_by_product[pid]["qty"] += float(purchase.eq_qty_unit or 0.0)
-        
-        # Crear una entrada especial para excedentes sin pedido
-        orphan_excesses = []
-        for pid, purchased in orphan_by_product.items():
-            from ..models.product import Product
-            product = Product.query.get(pid)
-            orphan_excesses.append({
-                "order_id": None,
-                "product_id": pid,
-                "product_name": product.name if product else f"Producto #{pid}",
-                "excess_qty": round(purchased["qty"], 2),
-                "unit": purchased["unit"],
-                "needed_qty": 0.0,
-                "purchased_qty": round(purchased["qty"], 2),
-                "reassigned_qty": 0.0
-            })
-        
-        if orphan_excesses:
-            result.append({
-                "order": {"id": None, "title": "Excedentes sin pedido", "status": "excedentes"},
-                "excesses": orphan_excesses
-            })
+    # Entrada especial para excedentes sin pedido: todo lo comprado es excedente
+    orphan_excesses = by_order.get(None)
+    if orphan_excesses:
+        result.append({
+            "order": {"id": None, "title": "Excedentes sin pedido", "status": "excedentes"},
+            "excesses": orphan_excesses
+        })
     
     return jsonify(result)
 
 
 @accounting_bp.get("/accounting/excess/debug")
+@cached_response
 def debug_excess():
     """
     Debug del cálculo de excedentes para ver exactamente qué está pasando
@@ -612,6 +349,7 @@ def debug_excess():
     order = Order.query.get(int(order_id))
     if not order:
         return jsonify({"error": "Pedido no encontrado"}), 404
+    cache_tags(*order_tags([order.id]))
     
     # Obtener items y compras del pedido
     items = OrderItem.query.filter_by(order_id=order.id).all()
@@ -643,34 +381,8 @@ def debug_excess():
             "charged_unit": purchase.charged_unit
         })
     
-    # Agrupar lo pedido
-    needed_by_product = {}
-    for item in items:
-        pid = item.product_id
-        charged_unit = item.charged_unit or item.unit or "kg"
-        charged_qty = item.charged_qty if item.charged_qty is not None else float(item.qty or 0.0)
-        
-        if pid not in needed_by_product:
-            needed_by_product[pid] = {"unit": charged_unit, "qty": 0.0}
-        needed_by_product[pid]["qty"] += charged_qty
-    
-    # Agrupar lo comprado
-    purchased_by_product = {}
-    for purchase in purchases:
-        pid = purchase.product_id
-        charged_unit = purchase.charged_unit or "kg"
-        
-        if pid not in purchased_by_product:
-            purchased_by_product[pid] = {"unit": charged_unit, "qty": 0.0}
-        
-        if charged_unit == "kg":
-            purchased_by_product[pid]["qty"] += float(purchase.qty_kg or 0.0)
-            if purchase.eq_qty_kg:
-                purchased_by_product[pid]["qty"] += float(purchase.eq_qty_kg or 0.0)
-        else:  # unit
-            purchased_by_product[pid]["qty"] += float(purchase.qty_unit or 0.0)
-            if purchase.eq_qty_unit:
-                purchased_by_product[pid]["qty"] += float(purchase.eq_qty_unit or 0.0)
+    # Lo pedido y lo comprado en la unidad de cobro
+    needed_by_product, purchased_by_product = load_coverage([order.id]).charged(order.id)
     
     return jsonify({
         "order": order.to_dict(),
@@ -682,11 +394,13 @@ def debug_excess():
 
 
 @accounting_bp.get("/accounting/debug/orders")
+@cached_response
 def debug_orders():
     """
     Debug simple para ver todos los pedidos y sus items
     """
     orders = Order.query.order_by(Order.created_at.desc()).limit(10).all()
+    cache_tags("orders:new", *order_tags(o.id for o in orders))
     result = []
     
     for order in orders:
@@ -728,73 +442,20 @@ def debug_orders():
 
 
 @accounting_bp.get("/accounting/excess/simple")
+@cached_response
 def calculate_excess_simple():
     """
     Calcular excedentes simples: solo diferencia entre lo comprado y lo pedido
     (sin considerar reasignaciones)
     """
     orders = Order.query.order_by(Order.created_at.desc()).limit(50).all()
+    cache_tags("orders:new", "table:products", *order_tags(o.id for o in orders))
+    coverage = load_coverage([o.id for o in orders])
+    names = _product_names(coverage.product_ids)
     result = []
     
     for o in orders:
-        # Obtener items y compras del pedido
-        items = OrderItem.query.filter_by(order_id=o.id).all()
-        purchases = Purchase.query.filter_by(order_id=o.id).all()
-        
-        if not purchases:
-            continue
-        
-        # Agrupar lo pedido por producto
-        needed_by_product = {}
-        for item in items:
-            pid = item.product_id
-            charged_unit = item.charged_unit or item.unit or "kg"
-            charged_qty = item.charged_qty if item.charged_qty is not None else float(item.qty or 0.0)
-            
-            if pid not in needed_by_product:
-                needed_by_product[pid] = {"unit": charged_unit, "qty": 0.0}
-            needed_by_product[pid]["qty"] += charged_qty
-        
-        # Agrupar lo comprado por producto
-        purchased_by_product = {}
-        for purchase in purchases:
-            pid = purchase.product_id
-            charged_unit = purchase.charged_unit or "kg"
-            
-            if pid not in purchased_by_product:
-                purchased_by_product[pid] = {"unit": charged_unit, "qty": 0.0}
-            
-            if charged_unit == "kg":
-                purchased_by_product[pid]["qty"] += float(purchase.qty_kg or 0.0)
-                if purchase.eq_qty_kg:
-                    purchased_by_product[pid]["qty"] += float(purchase.eq_qty_kg or 0.0)
-            else:  # unit
-                purchased_by_product[pid]["qty"] += float(purchase.qty_unit or 0.0)
-                if purchase.eq_qty_unit:
-                    purchased_by_product[pid]["qty"] += float(purchase.eq_qty_unit or 0.0)
-        
-        # Calcular excedentes: comprado - pedido (sin reasignaciones)
-        excesses = []
-        for pid, purchased in purchased_by_product.items():
-            needed = needed_by_product.get(pid, {"unit": purchased["unit"], "qty": 0.0})
-            
-            # Excedente simple = comprado - pedido
-            excess_qty = purchased["qty"] - needed["qty"]
-            
-            if excess_qty > 0.01:  # Solo si hay excedente
-                from ..models.product import Product
-                product = Product.query.get(pid)
-                excesses.append({
-                    "order_id": o.id,
-                    "product_id": pid,
-                    "product_name": product.name if product else f"Producto #{pid}",
-                    "excess_qty": round(excess_qty, 2),
-                    "unit": purchased["unit"],
-                    "needed_qty": round(needed["qty"], 2),
-                    "purchased_qty": round(purchased["qty"], 2),
-                    "reassigned_qty": 0.0  # Sin reasignaciones
-                })
-        
+        excesses = _excess_rows(o.id, coverage, names)
         if excesses:
             result.append({
                 "order": o.to_dict(),
@@ -805,6 +466,7 @@ def calculate_excess_simple():
 
 
 @accounting_bp.get("/accounting/excess/test")
+@cached_response
 def test_excess_calculation():
     """
     Test específico del cálculo de excedentes para el pedido 7
@@ -813,57 +475,24 @@ def test_excess_calculation():
     order = Order.query.get(order_id)
     if not order:
         return jsonify({"error": "Pedido 7 no encontrado"}), 404
+    cache_tags("table:products", *order_tags([order.id]))
     
-    # Obtener items y compras del pedido
-    items = OrderItem.query.filter_by(order_id=order.id).all()
-    purchases = Purchase.query.filter_by(order_id=order.id).all()
-    
-    # Agrupar lo pedido por producto
-    needed_by_product = {}
-    for item in items:
-        pid = item.product_id
-        charged_unit = item.charged_unit or item.unit or "kg"
-        charged_qty = item.charged_qty if item.charged_qty is not None else float(item.qty or 0.0)
-        
-        if pid not in needed_by_product:
-            needed_by_product[pid] = {"unit": charged_unit, "qty": 0.0}
-        needed_by_product[pid]["qty"] += charged_qty
-    
-    # Agrupar lo comprado por producto
-    purchased_by_product = {}
-    for purchase in purchases:
-        pid = purchase.product_id
-        charged_unit = purchase.charged_unit or "kg"
-        
-        if pid not in purchased_by_product:
-            purchased_by_product[pid] = {"unit": charged_unit, "qty": 0.0}
-        
-        if charged_unit == "kg":
-            purchased_by_product[pid]["qty"] += float(purchase.qty_kg or 0.0)
-            if purchase.eq_qty_kg:
-                purchased_by_product[pid]["qty"] += float(purchase.eq_qty_kg or 0.0)
-        else:  # unit
-            purchased_by_product[pid]["qty"] += float(purchase.qty_unit or 0.0)
-            if purchase.eq_qty_unit:
-                purchased_by_product[pid]["qty"] += float(purchase.eq_qty_unit or 0.0)
+    coverage = load_coverage([order.id])
+    needed_by_product, purchased_by_product = coverage.charged(order.id)
+    names = _product_names(purchased_by_product.keys())
     
     # Calcular excedentes
     excesses = []
-    for pid, purchased in purchased_by_product.items():
-        needed = needed_by_product.get(pid, {"unit": purchased["unit"], "qty": 0.0})
-        excess_qty = purchased["qty"] - needed["qty"]
-        
-        from ..models.product import Product
-        product = Product.query.get(pid)
-        
+    for e in coverage.excesses(order.id, only_excess=False):
+        pid = e["product_id"]
         excesses.append({
             "product_id": pid,
-            "product_name": product.name if product else f"Producto #{pid}",
-            "needed_qty": round(needed["qty"], 2),
-            "purchased_qty": round(purchased["qty"], 2),
-            "excess_qty": round(excess_qty, 2),
-            "unit": purchased["unit"],
-            "has_excess": excess_qty > 0.01
+            "product_name": names.get(pid) or f"Producto #{pid}",
+            "needed_qty": round(e["needed_qty"], 2),
+            "purchased_qty": round(e["purchased_qty"], 2),
+            "excess_qty": round(e["excess_qty"], 2),
+            "unit": e["unit"],
+            "has_excess": e["excess_qty"] > EXCESS_EPSILON
         })
     
     return jsonify({
@@ -877,11 +506,20 @@ def test_excess_calculation():
 
 @accounting_bp.get("/accounting/vendors/commissions")
 @require_token
+@cached_response
 def vendors_commissions_summary():
     """
     Resumen de comisiones a pagar a vendedores.
     Solo accesible para admin.
     
+    Se sirve desde la tabla vendor_commission_daily (ver
+    services/vendor_commissions): suma los días del rango y calcula utilidad
+    y comisión sobre los totales.
+    
+    Query params:
+    - date_from, date_to (YYYY-MM-DD, ambos días inclusive)
+    - period=mtd|ytd : mes o año en curso hasta hoy (si no se entregan fechas)
+    
     Retorna un resumen por vendedor con:
     - Total facturado
     - Total costos
@@ -897,59 +535,40 @@ def vendors_commissions_summary():
     
     date_from = request.args.get("date_from")
     date_to = request.args.get("date_to")
+    period = (request.args.get("period") or "").strip().lower()
     
     from ..models.user import User
     from datetime import datetime
     
-    # Obtener todos los vendedores
-    vendors = User.query.filter_by(role='vendor', active=True).all()
+    date_from_obj = None
+    date_to_obj = None
+    if date_from:
+        try:
+            date_from_obj = datetime.strptime(date_from, '%Y-%m-%d').date()
+        except:
+            pass
+    if date_to:
+        try:
+            date_to_obj = datetime.strptime(date_to, '%Y-%m-%d').date()
+        except:
+            pass
+    
+    if period in ("mtd", "ytd"):
+        today = datetime.utcnow().date()
+        if date_from_obj is None:
+            date_from_obj = today.replace(day=1) if period == "mtd" else today.replace(month=1, day=1)
+        if date_to_obj is None:
+            date_to_obj = today
+    
+    # Totales por vendedor sumando días pre-agregados (una consulta agrupada)
+    cache_tags("orders:any", "table:users")
+    totals = commissions_by_vendor(date_from_obj, date_to_obj)
+    vendors = {v.id: v for v in User.query.filter(User.id.in_([t[0] for t in totals])).all()} if totals else {}
     
     result = []
     
-    for vendor in vendors:
-        # Obtener órdenes del vendedor
-        query = Order.query.filter(Order.vendor_id == vendor.id, Order.status == 'emitido')
-        
-        # Aplicar filtros de fecha si existen
-        if date_from:
-            try:
-                date_from_obj = datetime.strptime(date_from, '%Y-%m-%d')
-                query = query.filter(Order.created_at >= date_from_obj)
-            except:
-                pass
-        
-        if date_to:
-            try:
-                date_to_obj = datetime.strptime(date_to, '%Y-%m-%d')
-                query = query.filter(Order.created_at <= date_to_obj)
-            except:
-                pass
-        
-        orders = query.all()
-        
-        if not orders:
-            continue
-        
-        # Calcular totales para este vendedor
-        total_billed = 0.0
-        total_cost = 0.0
-        
-        for order in orders:
-            # Facturado
-            charges = Charge.query.filter(
-                Charge.order_id == order.id,
-                Charge.status != 'cancelled'
-            ).all()
-            
-            for charge in charges:
-                qty = charge.charged_qty if charge.charged_qty is not None else (charge.qty or 0)
-                total_billed += qty * (charge.unit_price or 0)
-            
-            # Costos
-            purchases = Purchase.query.filter_by(order_id=order.id).all()
-            for purchase in purchases:
-                if purchase.price_total:
-                    total_cost += purchase.price_total
+    for vendor_id, num_orders, total_billed, total_cost in totals:
+        vendor = vendors[vendor_id]
         
         # Calcular utilidad y comisiones
         profit = max(0.0, total_billed - total_cost)
@@ -961,7 +580,7 @@ def vendors_commissions_summary():
             "vendor_name": vendor.name,
             "vendor_email": vendor.email,
             "commission_rate": vendor.commission_rate,
-            "num_orders": len(orders),
+            "num_orders": num_orders,
             "total_billed": round(total_billed, 2),
             "total_cost": round(total_cost, 2),
             "total_profit": round(profit, 2),
@@ -976,72 +595,123 @@ def vendors_commissions_summary():
 
 
 @accounting_bp.get("/accounting/customers")
+@cached_response
 def customers_summary():
     """
     Resumen de contabilidad por cliente.
     
-    Usa charged_qty del Charge (que se actualiza cuando se registra la compra)
-    para calcular correctamente el monto facturado considerando conversiones.
+    Lee los saldos materializados en customer_balances (ver
+    services/customer_balances), que usan charged_qty del Charge para
+    considerar conversiones.
+    
+    Query params:
+    - include_orders=1 : Incluye desglose por pedido y producto
+    - min_due=X : Solo clientes con deuda >= X
+    - limit=N : Paginación por nombre; si la página viene llena se
+      retorna el header X-Next-Cursor
+    - cursor=X : Continúa desde X-Next-Cursor (offset=M sigue aceptándose)
+    
+    Con Accept: application/x-ndjson se envía un cliente por línea.
     """
     include_orders = bool((request.args.get("include_orders") or "").strip().lower() in ("1","true","yes"))
-    customers = Customer.query.order_by(Customer.name.asc()).all()
+    try:
+        min_due = float(request.args["min_due"]) if request.args.get("min_due") else None
+        limit = page_limit(None)
+        offset = int(request.args.get("offset") or 0)
+        after = decode_cursor(request.args["cursor"], (str, int)) if request.args.get("cursor") else None
+    except ValueError:
+        return jsonify({"error": "min_due, limit, offset o cursor inválidos"}), 400
+
+    query = (
+        db.session.query(Customer, CustomerBalance)
+        .outerjoin(CustomerBalance, CustomerBalance.customer_id == Customer.id)
+    )
+    if min_due is not None:
+        query = query.filter(func.coalesce(CustomerBalance.due, 0.0) >= min_due)
+    if after:
+        query = query.filter(keyset_filter((Customer.name, Customer.id), after))
+    query = query.order_by(Customer.name.asc(), Customer.id.asc())
+    if offset:
+        query = query.offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+
+    if wants_ndjson():
+        return ndjson_response(_stream_customer_rows(query, include_orders))
+
+    rows = query.all()
+    cache_tags("table:customers", *customer_tags(c.id for c, _ in rows))
+    if include_orders:
+        cache_tags("table:orders", "table:products")
+    if min_due is not None:
+        cache_tags("customers:any")
+    response = jsonify(_customer_rows(rows, include_orders))
+    if limit is not None and len(rows) == limit:
+        last = rows[-1][0]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.name, last.id)
+    return response
+
+
+def _stream_customer_rows(query, include_orders: bool):
+    rows_iter = iter(query.yield_per(_STREAM_BATCH_SIZE))
+    while True:
+        rows = list(islice(rows_iter, _STREAM_BATCH_SIZE))
+        if not rows:
+            return
+        yield from _customer_rows(rows, include_orders)
+
+
+def _customer_rows(rows, include_orders: bool) -> list:
+    """Filas del resumen por cliente para una página de (Customer, CustomerBalance)."""
+    orders_by_customer = {}
+    if include_orders and rows:
+        customer_ids = [c.id for c, _ in rows]
+        for ob in (
+            CustomerOrderBalance.query
+            .filter(CustomerOrderBalance.customer_id.in_(customer_ids))
+            .order_by(CustomerOrderBalance.customer_id.asc(), CustomerOrderBalance.position.asc())
+            .all()
+        ):
+            o = ob.to_dict()
+            o["products"] = []
+            orders_by_customer.setdefault(ob.customer_id, {})[ob.order_id or 0] = o
+        charges = (
+            db.session.query(Charge, Product.name)
+            .outerjoin(Product, Product.id == Charge.product_id)
+            .filter(Charge.customer_id.in_(customer_ids))
+            .order_by(Charge.id.asc())
+            .all()
+        )
+        for ch, product_name in charges:
+            o = orders_by_customer.get(ch.customer_id, {}).get(ch.order_id or 0)
+            if o is None:
+                continue
+            o["products"].append({
+                "charge_id": ch.id,
+                "product_id": ch.product_id,
+                "product_name": product_name or "Desconocido",
+                "qty": ch.qty,
+                "charged_qty": ch.charged_qty,
+                "unit": ch.unit,
+                "unit_price": ch.unit_price,
+                "total": charge_amount(ch.charged_qty, ch.qty, ch.unit_price, ch.discount_amount),
+            })
+
     result = []
-    for c in customers:
-        charges = Charge.query.filter(Charge.customer_id == c.id).all()
-        
-        # Calcular facturado usando charged_qty (que incluye conversiones) si está disponible
-        billed = 0.0
-        for ch in charges:
-            qty_to_charge = ch.charged_qty if ch.charged_qty is not None else float(ch.qty or 0.0)
-            billed += max(0.0, (qty_to_charge * float(ch.unit_price or 0.0)) - (ch.discount_amount or 0.0))
-        
-        charge_ids = [ch.id for ch in charges]
-        paid = _sum_paid_for_charge_ids(charge_ids)
-        
+    for c, balance in rows:
         row = {
             "customer": c.to_dict(),
-            "billed": billed,
-            "paid": paid,
-            "due": max(0.0, billed - paid),
+            "billed": balance.billed if balance else 0.0,
+            "paid": balance.paid if balance else 0.0,
+            "due": balance.due if balance else 0.0,
         }
-        
         if include_orders:
-            orders = {}
-            for ch in charges:
-                o = orders.setdefault(ch.order_id or 0, {
-                    "order_id": ch.order_id, 
-                    "billed": 0.0, 
-                    "paid": 0.0,
-                    "products": []
-                })
-                # Usar charged_qty para el cálculo por pedido también
-                qty_to_charge = ch.charged_qty if ch.charged_qty is not None else float(ch.qty or 0.0)
-                o["billed"] += max(0.0, (qty_to_charge * float(ch.unit_price or 0.0)) - (ch.discount_amount or 0.0))
-                
-                # Agregar detalle del producto
-                from ..models.product import Product
-                product = Product.query.get(ch.product_id) if ch.product_id else None
-                o["products"].append({
-                    "charge_id": ch.id,
-                    "product_id": ch.product_id,
-                    "product_name": product.name if product else "Desconocido",
-                    "qty": ch.qty,
-                    "charged_qty": ch.charged_qty,
-                    "unit": ch.unit,
-                    "unit_price": ch.unit_price,
-                    "total": max(0.0, (qty_to_charge * float(ch.unit_price or 0.0)) - (ch.discount_amount or 0.0))
-                })
-            
-            apps = PaymentApplication.query.filter(PaymentApplication.charge_id.in_(charge_ids)).all() if charge_ids else []
-            paid_by_charge = {}
-            for a in apps:
-                paid_by_charge[a.charge_id] = (paid_by_charge.get(a.charge_id) or 0.0) + (a.amount or 0.0)
-            for ch in charges:
-                orders[ch.order_id or 0]["paid"] += paid_by_charge.get(ch.id, 0.0)
-            row["orders"] = list(orders.values())
-        
+            row["orders"] = list(orders_by_customer.get(c.id, {}).values())
         result.append(row)
-    return jsonify(result)
-
+    return result
 
 
+@accounting_bp.get("/accounting/cache/stats")
+def response_cache_stats():
+    """Aciertos y fallos de la caché de respuestas de este proceso (ver services/response_cache)."""
+    return jsonify(cache_stats())
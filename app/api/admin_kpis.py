@@ -1,17 +1,14 @@
 """
 API para KPIs y Analytics (Admin)
 """
+import heapq
+
 from flask import Blueprint, jsonify, request
 from datetime import datetime, timedelta
-from sqlalchemy import func, and_
 
-from ..db import db
-from ..models.order import Order
-from ..models.order_item import OrderItem
-from ..models.customer import Customer
-from ..models.purchase import Purchase
-from ..models.charge import Charge
-from ..models.product import Product
+from ..services.cohorts import PERIODS, customer_stats, retention_curves
+from ..services.kpi_facts import product_totals
+from ..services.kpi_overview import ticket_overview
 from .auth import require_token
 
 
@@ -44,183 +41,18 @@ def get_kpis_overview():
     try:
         date_from, date_to = parse_date_params()
         
-        # Filtro base de órdenes
-        orders_query = Order.query
-        if date_from:
-            orders_query = orders_query.filter(func.date(Order.created_at) >= date_from)
-        if date_to:
-            orders_query = orders_query.filter(func.date(Order.created_at) <= date_to)
-        
-        orders = orders_query.all()
-        order_ids = [o.id for o in orders]
-        
-        # 1. TICKET PROMEDIO
-        if orders:
-            # Total facturado desde charges
-            charges = Charge.query.filter(
-                Charge.order_id.in_(order_ids),
-                Charge.status != 'cancelled'
-            ).all()
-            
-            total_billed = sum(
-                (c.charged_qty or c.qty or 0) * (c.unit_price or 0)
-                for c in charges
-            )
-            
-            # Total costos desde purchases
-            purchases = Purchase.query.filter(
-                Purchase.order_id.in_(order_ids)
-            ).all()
-            
-            total_costs = 0
-            for p in purchases:
-                if p.price_total:
-                    total_costs += float(p.price_total)
-                else:
-                    # Calcular desde price_per_unit
-                    unit = p.charged_unit or 'kg'
-                    qty = float(p.qty_kg or 0) if unit == 'kg' else float(p.qty_unit or 0)
-                    total_costs += float(p.price_per_unit or 0) * qty
-            
-            # Utilidad
-            utilidad = total_billed - total_costs
-            
-            # Desglose por cliente
-            customer_totals = {}
-            for c in charges:
-                if c.customer_id:
-                    customer_id = c.customer_id
-                    amount = (c.charged_qty or c.qty or 0) * (c.unit_price or 0)
-                    
-                    if customer_id not in customer_totals:
-                        customer_totals[customer_id] = {
-                            'customer_id': customer_id,
-                            'total': 0,
-                            'num_pedidos': set()
-                        }
-                    
-                    customer_totals[customer_id]['total'] += amount
-                    customer_totals[customer_id]['num_pedidos'].add(c.order_id)
-            
-            # Obtener nombres de clientes
-            customer_breakdown = []
-            for cid, data in customer_totals.items():
-                customer = Customer.query.get(cid)
-                customer_breakdown.append({
-                    'customer_id': cid,
-                    'customer_name': customer.name if customer else f'Cliente {cid}',
-                    'total': round(data['total'], 2),
-                    'num_pedidos': len(data['num_pedidos']),
-                    'promedio_por_pedido': round(data['total'] / len(data['num_pedidos']), 2) if len(data['num_pedidos']) > 0 else 0
-                })
-            
-            # Ordenar por total descendente
-            customer_breakdown.sort(key=lambda x: x['total'], reverse=True)
-            
-            num_clientes = len(customer_totals)
-            
-            ticket_promedio = {
-                'total': round(total_billed, 2),
-                'utilidad': round(utilidad, 2),
-                'costos': round(total_costs, 2),
-                'num_pedidos': len(orders),
-                'num_clientes': num_clientes,
-                'promedio_por_pedido': round(total_billed / len(orders), 2) if len(orders) > 0 else 0,
-                'promedio_por_cliente': round(total_billed / num_clientes, 2) if num_clientes > 0 else 0,
-                'margen_utilidad_porcentaje': round((utilidad / total_billed * 100), 2) if total_billed > 0 else 0,
-                'desglose_clientes': customer_breakdown
-            }
-        else:
-            ticket_promedio = {
-                'total': 0,
-                'utilidad': 0,
-                'costos': 0,
-                'num_pedidos': 0,
-                'num_clientes': 0,
-                'promedio_por_pedido': 0,
-                'promedio_por_cliente': 0,
-                'margen_utilidad_porcentaje': 0,
-                'desglose_clientes': []
-            }
+        # 1. TICKET PROMEDIO (hechos diarios, ver services/kpi_facts)
+        ticket_promedio = ticket_overview(date_from, date_to)
         
-        # 2. TASA DE RECOMPRA
+        # 2. TASA DE RECOMPRA y 3. CLIENTES: una pasada por el historial de cada cliente (ver services/cohorts)
         recompra_days = int(request.args.get('recompra_days', 15))
-        
-        # Clientes con sus pedidos en el periodo
-        query = db.session.query(
-            Charge.customer_id,
-            func.count(func.distinct(Charge.order_id)).label('num_orders')
-        ).join(Order, Charge.order_id == Order.id).filter(
-            Charge.status != 'cancelled',
-            Charge.customer_id.isnot(None)
-        )
-        
-        if date_from:
-            query = query.filter(func.date(Order.created_at) >= date_from)
-        if date_to:
-            query = query.filter(func.date(Order.created_at) <= date_to)
-        
-        customers_with_orders = query.group_by(Charge.customer_id).all()
-        
-        total_customers = len(customers_with_orders)
-        recompra_customers = len([c for c in customers_with_orders if c.num_orders > 1])
-        
-        tasa_recompra = {
-            'plazo_dias': recompra_days,
-            'total_clientes': total_customers,
-            'recompraron': recompra_customers,
-            'tasa_porcentaje': round((recompra_customers / total_customers * 100), 2) if total_customers > 0 else 0
-        }
-        
-        # 3. CLIENTES ACTIVOS
         activo_days = int(request.args.get('activo_days', 15))
         fecha_limite = datetime.now().date() - timedelta(days=activo_days)
-        
-        # Clientes con pedidos recientes
-        clientes_activos = db.session.query(
-            func.count(func.distinct(Charge.customer_id))
-        ).join(Order, Charge.order_id == Order.id).filter(
-            func.date(Order.created_at) >= fecha_limite,
-            Charge.status != 'cancelled',
-            Charge.customer_id.isnot(None)
-        ).scalar() or 0
-        
-        # Total de clientes (alguna vez)
-        total_clientes_historico = db.session.query(
-            func.count(func.distinct(Charge.customer_id))
-        ).filter(
-            Charge.customer_id.isnot(None)
-        ).scalar() or 0
-        
-        # Nuevos este mes
         inicio_mes = datetime.now().replace(day=1).date()
         
-        # Clientes que compraron este mes
-        clientes_este_mes = set(
-            c.customer_id for c in Charge.query.join(Order, Charge.order_id == Order.id).filter(
-                func.date(Order.created_at) >= inicio_mes,
-                Charge.customer_id.isnot(None)
-            ).all()
-        )
-        
-        # Clientes que compraron antes de este mes
-        clientes_antes_mes = set(
-            c.customer_id for c in Charge.query.join(Order, Charge.order_id == Order.id).filter(
-                func.date(Order.created_at) < inicio_mes,
-                Charge.customer_id.isnot(None)
-            ).all()
-        )
-        
-        # Nuevos = compraron este mes pero NO antes
-        nuevos_mes = len(clientes_este_mes - clientes_antes_mes)
-        
-        clientes_stats = {
-            'activos': clientes_activos,
-            'filtro_dias': activo_days,
-            'total_historico': total_clientes_historico,
-            'nuevos_mes': nuevos_mes,
-            'tasa_actividad_porcentaje': round((clientes_activos / total_clientes_historico * 100), 2) if total_clientes_historico > 0 else 0
-        }
+        stats = customer_stats(date_from, date_to, recompra_days, fecha_limite, inicio_mes)
+        tasa_recompra = stats['tasa_recompra']
+        clientes_stats = {**stats['clientes'], 'filtro_dias': activo_days}
         
         return jsonify({
             'ticket_promedio': ticket_promedio,
@@ -239,76 +71,76 @@ def get_kpis_overview():
         return jsonify({'error': str(e)}), 500
 
 
+@admin_kpis_bp.get("/admin/kpis/cohortes")
+@require_token
+def get_cohort_retention():
+    """Curvas de retención por cohorte de primer pedido (?periodo=month|week, ?max_periodos=12)"""
+    try:
+        date_from, date_to = parse_date_params()
+        period = request.args.get('periodo', 'month')
+        if period not in PERIODS:
+            return jsonify({'error': f"periodo debe ser uno de {', '.join(PERIODS)}"}), 400
+        max_periods = max(1, min(int(request.args.get('max_periodos', 12)), 104))
+        
+        return jsonify({
+            'periodo': period,
+            'max_periodos': max_periods,
+            'cohortes': retention_curves(period, date_from, date_to, max_periods),
+            'rango': {
+                'desde': date_from.isoformat() if date_from else None,
+                'hasta': date_to.isoformat() if date_to else None
+            }
+        })
+    
+    except Exception as e:
+        print(f"Error en get_cohort_retention: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+
 @admin_kpis_bp.get("/admin/kpis/productos-top")
 @require_token
 def get_top_products():
-    """Productos más vendidos con filtros por utilidad, unidades o monto"""
+    """
+    Productos más vendidos con filtros por utilidad, unidades, monto o margen
+    (?sort_by=revenue|quantity|profit|margin, ?limit=10, ?category=fruta)
+    """
     try:
         limit = int(request.args.get('limit', 10))
-        sort_by = request.args.get('sort_by', 'revenue')  # 'revenue', 'quantity', 'profit'
+        sort_by = request.args.get('sort_by', 'revenue')  # 'revenue', 'quantity', 'profit', 'margin'
+        category = request.args.get('category') or None
         date_from, date_to = parse_date_params()
         
-        # Obtener datos agregados por producto
-        query = db.session.query(
-            Charge.product_id,
-            func.sum(Charge.charged_qty).label('total_qty'),
-            func.sum(Charge.charged_qty * Charge.unit_price).label('total_revenue')
-        ).join(Order, Charge.order_id == Order.id).filter(
-            Charge.status != 'cancelled',
-            Charge.product_id.isnot(None),
-            Charge.charged_qty.isnot(None),
-            Charge.unit_price.isnot(None)
-        )
-        
-        if date_from:
-            query = query.filter(func.date(Order.created_at) >= date_from)
-        if date_to:
-            query = query.filter(func.date(Order.created_at) <= date_to)
-        
-        products_data = query.group_by(Charge.product_id).all()
-        
-        # Calcular costos por producto
-        costs_query = db.session.query(
-            Purchase.product_id,
-            func.sum(Purchase.price_total).label('total_cost')
-        ).join(Order, Purchase.order_id == Order.id).filter(
-            Purchase.product_id.isnot(None)
-        )
+        # Ventas y costos por producto con nombre y categoría (hechos diarios, ver services/kpi_facts)
+        totals = product_totals(date_from, date_to, category=category)
         
-        if date_from:
-            costs_query = costs_query.filter(func.date(Order.created_at) >= date_from)
-        if date_to:
-            costs_query = costs_query.filter(func.date(Order.created_at) <= date_to)
-        
-        costs_data = {row.product_id: float(row.total_cost or 0) for row in costs_query.group_by(Purchase.product_id).all()}
-        
-        # Construir resultado con utilidad
-        result = []
-        for product_id, qty, revenue in products_data:
-            product = Product.query.get(product_id)
-            if product:
-                cost = costs_data.get(product_id, 0)
-                profit = float(revenue or 0) - cost
-                
-                result.append({
-                    'product_id': product_id,
-                    'product_name': product.name,
-                    'cantidad_vendida': round(float(qty or 0), 2),
-                    'ingresos_totales': round(float(revenue or 0), 2),
-                    'costos_totales': round(cost, 2),
-                    'utilidad': round(profit, 2)
-                })
-        
-        # Ordenar según el criterio solicitado
+        # Top N con un heap (igual que ordenar todo y cortar, empates en orden de id);
+        # solo se serializan los elegidos
         if sort_by == 'quantity':
-            result.sort(key=lambda x: x['cantidad_vendida'], reverse=True)
+            key = lambda t: round(t.qty, 2)
         elif sort_by == 'profit':
-            result.sort(key=lambda x: x['utilidad'], reverse=True)
+            key = lambda t: round(t.profit, 2)
+        elif sort_by == 'margin':
+            # sin ingresos no hay margen: al final
+            key = lambda t: (t.margin is not None, round(t.margin or 0, 2))
         else:  # revenue (default)
-            result.sort(key=lambda x: x['ingresos_totales'], reverse=True)
-        
-        # Limitar resultados
-        result = result[:limit]
+            key = lambda t: round(t.revenue, 2)
+        top = heapq.nlargest(max(limit, 0), totals, key=key)
+        
+        result = [
+            {
+                'product_id': t.product_id,
+                'product_name': t.name,
+                'categoria': t.category,
+                'cantidad_vendida': round(t.qty, 2),
+                'ingresos_totales': round(t.revenue, 2),
+                'costos_totales': round(t.cost, 2),
+                'utilidad': round(t.profit, 2),
+                'margen_porcentaje': round(t.margin, 2) if t.margin is not None else None,
+            }
+            for t in top
+        ]
         
         return jsonify(result)
     
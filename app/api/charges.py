@@ -2,6 +2,7 @@ from flask import Blueprint, jsonify, request
 
 from ..db import db
 from ..models.charge import Charge
+from ..models.excess_inventory import ExcessInventory
 from ..models.order_item import OrderItem
 from .auth import require_token
 
@@ -135,10 +136,15 @@ def reassign_excess():
         db.session.add(charge)
         db.session.commit()
         
+        # El nuevo item descuenta el excedente: la fila de excess_inventory del
+        # pedido se recalculó al confirmar (ver services/excess_inventory)
+        remaining = ExcessInventory.query.filter_by(order_id=order_id, product_id=product_id).first()
+        
         return jsonify({
             "message": "Excedente reasignado correctamente",
             "order_item": order_item.to_dict(),
-            "charge": charge.to_dict()
+            "charge": charge.to_dict(),
+            "remaining_excess": remaining.to_dict() if remaining else None
         }), 201
         
     except Exception as e:
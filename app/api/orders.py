@@ -1,3 +1,5 @@
+import hashlib
+
 from flask import Blueprint, jsonify, request
 from datetime import date
 from typing import Optional
@@ -6,21 +8,29 @@ from ..db import db
 from ..models.customer import Customer
 from ..models.product import Product
 from ..models.order import Order
-from ..models.catalog_price import CatalogPrice
 from ..models.order_item import OrderItem
-from ..models.purchase import Purchase
 from ..models.charge import Charge
-from ..models.variant import VariantPriceTier
+from ..models.parse_job import ParseJob
+from ..services.customer_matcher import annotate_customer, resolve_customers
+from ..services.draft_confirmation import confirm_draft
+from ..services.order_items import add_item_charges, add_order_items
 from ..services.order_parser import parse_orders_text
-from ..utils.text_match import similarity_score, normalize_text
+from ..services.order_versions import order_version
+from ..services.parse_jobs import fail_if_stale, follow_job, job_items, submit_parse_job
+from ..services.product_matcher import annotate_parsed_item, product_index, suggest_products
+from ..services.purchase_coverage import load_coverage
+from ..services.response_cache import cache_tags, cached_response, order_tags
+from ..utils.pagination import (
+    NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, ndjson_response, page_limit, wants_ndjson,
+)
+from ..utils.server_timing import ServerTiming
 from .auth import require_token
 
 
 orders_bp = Blueprint("orders", __name__)
 
-
-def _score_name(query: str, name: str) -> int:
-    return similarity_score(query, name)
+_PARSE_JOB_PAGE_SIZE = 500
+_PARSE_JOB_MAX_PAGE_SIZE = 5000
 
 
 def _get_draft(create: bool = False, user=None) -> Optional[Order]:
@@ -62,8 +72,18 @@ def list_orders():
 
 
 @orders_bp.get("/orders/<int:order_id>")
+@cached_response
 def order_detail(order_id: int):
-    order = Order.query.get_or_404(order_id)
+    """
+    Detalle del pedido para la pantalla de compras. Responde con ETag
+    (versión del pedido + contenido): con If-None-Match vigente se responde
+    304, desde la caché de respuestas sin consultar la base.
+    """
+    return _order_detail_response(Order.query.get_or_404(order_id))
+
+
+def _order_detail_response(order: Order):
+    order_id = order.id
     items = OrderItem.query.filter_by(order_id=order_id).all()
     customer_ids = {it.customer_id for it in items}
     product_ids = {it.product_id for it in items}
@@ -122,30 +142,10 @@ def order_detail(order_id: int):
             "totals": info["totals"],
         })
 
-    # compras acumuladas por producto y unidad
-    # Usar charged_unit para determinar en qué unidad se compró
-    purchases = Purchase.query.filter_by(order_id=order_id).all()
-    purchased_by_product = {}
-    for p in purchases:
-        d = purchased_by_product.setdefault(p.product_id, {"kg": 0.0, "unit": 0.0, "g": 0.0})
-        charged_unit = p.charged_unit or "kg"
-        
-        if charged_unit == "kg":
-            # Se cobra en kg: sumar qty_kg directamente
-            if p.qty_kg:
-                d["kg"] += p.qty_kg
-            # Si hay unidades compradas, sumarlas convertidas a kg (usando eq_qty_kg)
-            if p.qty_unit and p.eq_qty_kg:
-                d["kg"] += p.eq_qty_kg
-        elif charged_unit == "unit":
-            # Se cobra en unidades: sumar qty_unit directamente
-            if p.qty_unit:
-                d["unit"] += p.qty_unit
-            # Si hay kg comprados, sumarlos convertidos a unidades (usando eq_qty_unit)
-            if p.qty_kg and p.eq_qty_unit:
-                d["unit"] += p.eq_qty_unit
-
-    return jsonify({
+    # compras acumuladas por producto según su unidad de cobro (cantidad + equivalencias)
+    purchased_by_product = load_coverage([order_id]).purchased_by_charged_unit(order_id)
+
+    response = jsonify({
         "order": order.to_dict(),
         "items": [i for i in items_detailed],
         "by_product": by_product,
@@ -155,6 +155,11 @@ def order_detail(order_id: int):
         "customers": customers,
         "products": products,
     })
+    # nombres de clientes y productos: sus cambios no tocan la versión del pedido
+    cache_tags("table:customers", "table:products", *order_tags([order_id]))
+    digest = hashlib.sha1(response.get_data()).hexdigest()[:16]
+    response.set_etag(f"{order_id}-{order_version(order_id)}-{digest}")
+    return response
 
 
 @orders_bp.get("/orders/draft")
@@ -166,173 +171,99 @@ def get_draft():
 
 
 @orders_bp.get("/orders/draft/detail")
+@cached_response
 def draft_detail():
     # Retrocompatibilidad: funciona con o sin autenticación
     user = getattr(request, 'current_user', None)
     d = _get_draft(create=True, user=user)
-    return order_detail(d.id)
+    # un pedido nuevo puede pasar a ser el borrador vigente
+    cache_tags("orders:new")
+    return _order_detail_response(d)
 
 
 @orders_bp.post("/orders/parse")
 def parse_orders():
     data = request.get_json(silent=True) or {}; text = data.get("text") or ""
     parsed = parse_orders_text(text)
-    all_products = Product.query.all()
-    canon = {normalize_text(p.name): p for p in all_products}
-    def annotate(it):
-        name = (it.get("product") or "").strip()
-        if not name:
-            return {**it, "match_status": "none"}
-        nname = normalize_text(name)
-        if nname in canon:
-            p = canon[nname]
-            return {**it, "match_status": "exact", "product_id": p.id}
-        ranked = sorted((( _score_name(name, p.name), p ) for p in all_products), key=lambda x: -x[0])
-        suggestions = [{"id": p.id, "name": p.name, "score": s} for s, p in ranked if s >= 70][:5]
-        if suggestions:
-            return {**it, "match_status": "similar", "suggestions": suggestions}
-        return {**it, "match_status": "none"}
-    items = [annotate(it) for it in parsed]
+    # Encabezados "pedido X" resueltos una vez por cliente, en memoria
+    customers = resolve_customers(it["customer"] for it in parsed)
+    products = product_index()
+    items = [annotate_customer(annotate_parsed_item(it, products), customers.get(it["customer"].strip())) for it in parsed]
     return jsonify({"items": items})
 
 
+@orders_bp.post("/orders/parse-jobs")
+@require_token
+def create_parse_job():
+    """
+    Igual que /orders/parse, pero en segundo plano para textos grandes
+    (exportaciones de WhatsApp completas). Responde 202 con el job; el
+    progreso y los items se consultan en GET /orders/parse-jobs/<id>.
+    """
+    user = getattr(request, 'current_user', None)
+    data = request.get_json(silent=True) or {}; text = data.get("text") or ""
+    job = submit_parse_job(text, user)
+    response = jsonify(job.to_dict())
+    response.headers["Location"] = f"/api/orders/parse-jobs/{job.id}"
+    return response, 202
+
+
+@orders_bp.get("/orders/parse-jobs/<int:job_id>")
+def get_parse_job(job_id: int):
+    """
+    Estado de un job de parseo y sus items ya procesados.
+
+    Query params:
+    - limit=N : Items por página (por defecto 500, máximo 5000)
+    - cursor=X : Continúa desde el header X-Next-Cursor de la respuesta anterior
+      (sirve para pedir solo los items nuevos mientras el job corre)
+
+    Con Accept: application/x-ndjson se envía un item por línea a medida que
+    el job los guarda, hasta que termina o pasan PARSE_JOB_STREAM_SECONDS; la
+    última línea es {"job": {...}, "next_cursor": ...} y, si el job sigue
+    corriendo, se vuelve a pedir con ?cursor=next_cursor.
+    """
+    job = fail_if_stale(ParseJob.query.get_or_404(job_id))
+    ndjson = wants_ndjson()
+    try:
+        limit = page_limit(None if ndjson else _PARSE_JOB_PAGE_SIZE, None if ndjson else _PARSE_JOB_MAX_PAGE_SIZE)
+        after = decode_cursor(request.args["cursor"], (int,))[0] if request.args.get("cursor") else -1
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if ndjson:
+        return ndjson_response(follow_job(job.id, after))
+
+    rows = job_items(job.id, after, limit)
+    response = jsonify({**job.to_dict(), "items": [r.to_dict() for r in rows]})
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1].position if rows else after)
+    return response
+
+
 @orders_bp.post("/orders/validate")
 def validate_orders():
     data = request.get_json(silent=True) or {}; items = data.get("items") or []
     result = {"resolved": [], "ambiguous": []}
-    all_products = Product.query.all()
     for it in items:
         name = (it.get("product") or "").strip()
         if not name: continue
         exact = Product.query.filter(Product.name.ilike(name)).first()
         if exact:
             result["resolved"].append({**it, "product_id": exact.id, "matched_name": exact.name}); continue
-        ranked = sorted((( _score_name(name, p.name), p ) for p in all_products), key=lambda x: -x[0])
-        suggestions = [{"id": p.id, "name": p.name, "score": s} for s, p in ranked if s >= 70][:5]
+        suggestions = suggest_products(name, min_score=70, limit=5)
         result["ambiguous"].append({**it, "suggestions": suggestions})
     return jsonify(result)
 
 
-def _create_product_with_kivi(product_name: str, sale_price: float, default_unit: str) -> Product:
-    """Crea un producto con precio de catálogo y variante kivi automática"""
-    product = Product(name=product_name, default_unit=default_unit)
-    db.session.add(product)
-    db.session.flush()
-    
-    # Agregar precio de catálogo
-    db.session.add(CatalogPrice(
-        product_id=product.id, 
-        date=date.today(), 
-        sale_price=sale_price, 
-        unit=default_unit
-    ))
-    
-    # Crear variante kivi automáticamente
-    try:
-        from ..models.variant import ProductVariant, VariantPriceTier
-        db.session.flush()
-        kivi_variant = ProductVariant(product_id=product.id, label='kivi', active=True)
-        db.session.add(kivi_variant)
-        db.session.flush()
-        kivi_tier = VariantPriceTier(
-            product_id=product.id,
-            variant_id=kivi_variant.id,
-            min_qty=1.0,
-            unit=default_unit,
-            sale_price=sale_price
-        )
-        db.session.add(kivi_tier)
-    except Exception:
-        pass
-    
-    return product
-
-
-def _add_items(order: Order, items: list[dict], user=None) -> None:
-    for it in items:
-        customer_name = (it.get("customer") or "").strip()
-        product_id = it.get("product_id"); product_name = (it.get("product") or "").strip(); variant_id = it.get("variant_id")
-        create_if_missing = bool(it.get("create_if_missing"))
-        variant_id = it.get("variant_id")
-        sale_unit_price = it.get("sale_unit_price")
-        if not customer_name: continue
-        customer = Customer.query.filter_by(name=customer_name).first()
-        if not customer:
-            # Si es vendedor, asignar automáticamente el cliente a él
-            vendor_id = order.vendor_id if order.vendor_id else (user.id if user and user.role == 'vendor' else None)
-            customer = Customer(name=customer_name, vendor_id=vendor_id); db.session.add(customer); db.session.flush()
-        product = Product.query.get(product_id) if product_id else Product.query.filter(Product.name.ilike(product_name)).first()
-        if not product and create_if_missing and product_name:
-            # Requiere precio de venta inicial
-            try:
-                sale_price = float(it.get("sale_price")) if it.get("sale_price") is not None else None
-            except (TypeError, ValueError):
-                sale_price = None
-            if sale_price is None or sale_price <= 0:
-                # no se puede crear sin precio de venta
-                continue
-            default_unit = (it.get("default_unit") or it.get("unit") or "kg")
-            product = _create_product_with_kivi(product_name, sale_price, default_unit)
-        if not product: continue
-        db.session.add(OrderItem(order_id=order.id, customer_id=customer.id, product_id=product.id, qty=float(it.get("qty") or 0), unit=(it.get("unit") or "kg"), notes=it.get("notes"), variant_id=(int(variant_id) if variant_id else None), sale_unit_price=(float(sale_unit_price) if sale_unit_price is not None else None)))
-
-
 @orders_bp.post("/orders/draft/items")
 @require_token
 def add_items_to_current_draft():
     user = getattr(request, 'current_user', None)
     d = _get_draft(create=True, user=user)
     data = request.get_json(silent=True) or {}; items = data.get("items") or []
-    inserted = 0
-    skipped = []
-    for idx, it in enumerate(items):
-        line_idx = it.get("line_index", idx)
-        customer_name = (it.get("customer") or "").strip()
-        if not customer_name:
-            skipped.append({"index": line_idx, "reason": "missing_customer"})
-            continue
-        customer = Customer.query.filter_by(name=customer_name).first()
-        if not customer:
-            # Si el draft tiene vendor_id, asignar automáticamente el cliente a ese vendedor
-            vendor_id = d.vendor_id if d.vendor_id else (user.id if user and user.role == 'vendor' else None)
-            customer = Customer(name=customer_name, vendor_id=vendor_id); db.session.add(customer); db.session.flush()
-
-        product_id = it.get("product_id"); product_name = (it.get("product") or "").strip(); variant_id = it.get("variant_id"); sale_unit_price = it.get("sale_unit_price")
-        create_if_missing = bool(it.get("create_if_missing"))
-        product = Product.query.get(product_id) if product_id else Product.query.filter(Product.name.ilike(product_name)).first()
-        if not product and not create_if_missing:
-            skipped.append({"index": line_idx, "reason": "unresolved_product", "product": product_name})
-            continue
-        if not product and create_if_missing and product_name:
-            # Requiere precio de venta inicial cuando se crea desde pedidos
-            try:
-                sale_price = float(it.get("sale_price")) if it.get("sale_price") is not None else None
-            except (TypeError, ValueError):
-                sale_price = None
-            if sale_price is None or sale_price <= 0:
-                skipped.append({"index": line_idx, "reason": "missing_sale_price", "product": product_name})
-                continue
-            default_unit = (it.get("default_unit") or it.get("unit") or "kg")
-            product = _create_product_with_kivi(product_name, sale_price, default_unit)
-
-        if not product:
-            skipped.append({"index": line_idx, "reason": "empty_product_name"})
-            continue
-
-        # charged_unit por defecto desde el producto reconocido/creado
-        charged_unit = (it.get("charged_unit") or getattr(product, 'default_unit', None) or it.get("unit") or "kg")
-        charged_qty = None
-        try:
-            if charged_unit and (it.get("unit") or "kg") != charged_unit:
-                # si r viene desde frontend, úsalo; de lo contrario, deja None
-                charged_qty = float(it.get("charged_qty")) if it.get("charged_qty") is not None else None
-        except Exception:
-            charged_qty = None
-        db.session.add(OrderItem(order_id=d.id, customer_id=customer.id, product_id=product.id, qty=float(it.get("qty") or 0), unit=(it.get("unit") or "kg"), charged_unit=charged_unit, charged_qty=charged_qty, notes=it.get("notes"), variant_id=(int(variant_id) if variant_id else None), sale_unit_price=(float(sale_unit_price) if sale_unit_price is not None else None)))
-        inserted += 1
-
+    added, skipped = add_order_items(d, items, user)
     db.session.commit()
-    return jsonify({"ok": True, "order": d.to_dict(), "inserted": inserted, "skipped": skipped})
+    return jsonify({"ok": True, "order": d.to_dict(), "inserted": len(added), "skipped": skipped})
 
 
 @orders_bp.post("/orders/draft/confirm")
@@ -340,52 +271,12 @@ def add_items_to_current_draft():
 def confirm_current_draft():
     user = getattr(request, 'current_user', None)
     d = _get_draft(create=True, user=user)
-    # Generar cargos si aún no existen para este pedido
-    existing = Charge.query.filter(Charge.order_id == d.id).first()
-    if not existing:
-        items = OrderItem.query.filter_by(order_id=d.id).all()
-        for it in items:
-            # Resolver precio: si viene fijado, usarlo; si no, determinar por variante en charged_unit
-            unit_price = float(it.sale_unit_price) if (it.sale_unit_price is not None) else 0.0
-            if unit_price <= 0:
-                variant_id = it.variant_id
-                q = VariantPriceTier.query.filter(VariantPriceTier.product_id == it.product_id, VariantPriceTier.unit == (it.charged_unit or it.unit or "kg"))
-                if variant_id is not None:
-                    q = q.filter((VariantPriceTier.variant_id == variant_id) | (VariantPriceTier.variant_id.is_(None)))
-                tiers = q.order_by(VariantPriceTier.min_qty.desc()).all()
-                for t in tiers:
-                    if float(it.qty or 0) >= float(t.min_qty or 0):
-                        unit_price = float(t.sale_price or 0.0)
-                        break
-            if unit_price <= 0:
-                c = (
-                    CatalogPrice.query.filter(CatalogPrice.product_id == it.product_id)
-                    .order_by(CatalogPrice.date.desc())
-                    .first()
-                )
-                unit_price = float(c.sale_price) if c else 0.0
-            # Cantidad a cobrar: usar charged_qty si existe (si ya se compró), si no usar qty como placeholder
-            q_charge = float(it.charged_qty) if (getattr(it, 'charged_qty', None) is not None) else float(it.qty or 0)
-            total = q_charge * float(unit_price or 0)
-            db.session.add(Charge(
-                customer_id=it.customer_id, 
-                order_id=d.id,
-                original_order_id=d.id,  # pedido original
-                order_item_id=it.id, 
-                product_id=it.product_id, 
-                qty=float(it.qty or 0),  # cantidad pedida original
-                charged_qty=float(it.charged_qty) if (it.charged_qty is not None) else None,  # cantidad a cobrar (puede ser None inicialmente)
-                unit=(it.charged_unit or it.unit or "kg"), 
-                unit_price=unit_price or 0.0, 
-                discount_amount=0.0, 
-                discount_reason=None, 
-                status="pending", 
-                total=total
-            ))
-        db.session.flush()
-    d.status = "emitido"
-    db.session.commit()
-    return jsonify(d.to_dict())
+    # Emite el borrador y genera sus cargos si aún no existen (una sola vez aunque se confirme en paralelo)
+    timing = ServerTiming()
+    confirm_draft(d, timing)
+    with timing.measure("commit"):
+        db.session.commit()
+    return timing.apply(jsonify(d.to_dict()))
 
 
 @orders_bp.post("/orders")
@@ -413,7 +304,7 @@ def create_order():
     order = Order(notes=notes, status="emitido", vendor_id=vendor_id)
     db.session.add(order)
     db.session.flush()
-    _add_items(order, items, user)
+    add_order_items(order, items, user, charged_units=False)
     db.session.commit()
     order.title = f"Pedido Nro {order.id} - {date.today().isoformat()}"
     db.session.commit()
@@ -429,127 +320,14 @@ def add_items_to_order(order_id: int):
     data = request.get_json(silent=True) or {}
     items = data.get("items") or []
     
-    inserted = 0
-    skipped = []
-    
-    for idx, it in enumerate(items):
-        line_idx = it.get("line_index", idx)
-        customer_name = (it.get("customer") or "").strip()
-        
-        if not customer_name:
-            skipped.append({"index": line_idx, "reason": "missing_customer"})
-            continue
-            
-        customer = Customer.query.filter_by(name=customer_name).first()
-        if not customer:
-            # Si el pedido tiene vendor_id, asignar automáticamente el cliente a ese vendedor
-            vendor_id = order.vendor_id if order.vendor_id else (user.id if user and user.role == 'vendor' else None)
-            customer = Customer(name=customer_name, vendor_id=vendor_id)
-            db.session.add(customer)
-            db.session.flush()
-        
-        product_id = it.get("product_id")
-        product_name = (it.get("product") or "").strip()
-        variant_id = it.get("variant_id")
-        sale_unit_price = it.get("sale_unit_price")
-        create_if_missing = bool(it.get("create_if_missing"))
-        
-        product = Product.query.get(product_id) if product_id else Product.query.filter(Product.name.ilike(product_name)).first()
-        
-        if not product and not create_if_missing:
-            skipped.append({"index": line_idx, "reason": "unresolved_product", "product": product_name})
-            continue
-            
-        if not product and create_if_missing and product_name:
-            try:
-                sale_price = float(it.get("sale_price")) if it.get("sale_price") is not None else None
-            except (TypeError, ValueError):
-                sale_price = None
-                
-            if sale_price is None or sale_price <= 0:
-                skipped.append({"index": line_idx, "reason": "missing_sale_price", "product": product_name})
-                continue
-                
-            default_unit = (it.get("default_unit") or it.get("unit") or "kg")
-            product = _create_product_with_kivi(product_name, sale_price, default_unit)
-        
-        if not product:
-            skipped.append({"index": line_idx, "reason": "empty_product_name"})
-            continue
-        
-        # Crear el OrderItem
-        charged_unit = (it.get("charged_unit") or getattr(product, 'default_unit', None) or it.get("unit") or "kg")
-        charged_qty = None
-        try:
-            if charged_unit and (it.get("unit") or "kg") != charged_unit:
-                charged_qty = float(it.get("charged_qty")) if it.get("charged_qty") is not None else None
-        except Exception:
-            charged_qty = None
-            
-        order_item = OrderItem(
-            order_id=order.id,
-            customer_id=customer.id,
-            product_id=product.id,
-            qty=float(it.get("qty") or 0),
-            unit=(it.get("unit") or "kg"),
-            charged_unit=charged_unit,
-            charged_qty=charged_qty,
-            notes=it.get("notes"),
-            variant_id=(int(variant_id) if variant_id else None),
-            sale_unit_price=(float(sale_unit_price) if sale_unit_price is not None else None)
-        )
-        db.session.add(order_item)
-        db.session.flush()
-        
-        # Si el pedido está emitido, crear el cargo automáticamente
-        if order.status == "emitido":
-            unit_price = float(sale_unit_price) if (sale_unit_price is not None) else 0.0
-            
-            if unit_price <= 0:
-                variant_id = it.get("variant_id")
-                q = VariantPriceTier.query.filter(
-                    VariantPriceTier.product_id == product.id,
-                    VariantPriceTier.unit == charged_unit
-                )
-                if variant_id is not None:
-                    q = q.filter((VariantPriceTier.variant_id == variant_id) | (VariantPriceTier.variant_id.is_(None)))
-                tiers = q.order_by(VariantPriceTier.min_qty.desc()).all()
-                for t in tiers:
-                    if float(it.get("qty") or 0) >= float(t.min_qty or 0):
-                        unit_price = float(t.sale_price or 0.0)
-                        break
-            
-            if unit_price <= 0:
-                c = (
-                    CatalogPrice.query.filter(CatalogPrice.product_id == product.id)
-                    .order_by(CatalogPrice.date.desc())
-                    .first()
-                )
-                unit_price = float(c.sale_price) if c else 0.0
-            
-            q_charge = float(charged_qty) if (charged_qty is not None) else float(it.get("qty") or 0)
-            total = q_charge * float(unit_price or 0)
-            
-            db.session.add(Charge(
-                customer_id=customer.id,
-                order_id=order.id,
-                original_order_id=order.id,
-                order_item_id=order_item.id,
-                product_id=product.id,
-                qty=float(it.get("qty") or 0),
-                charged_qty=charged_qty,
-                unit=charged_unit,
-                unit_price=unit_price or 0.0,
-                discount_amount=0.0,
-                discount_reason=None,
-                status="pending",
-                total=total
-            ))
-        
-        inserted += 1
+    added, skipped = add_order_items(order, items, user)
+
+    # Si el pedido está emitido, crear los cargos automáticamente
+    if order.status == "emitido":
+        add_item_charges(order, added)
     
     db.session.commit()
-    return jsonify({"ok": True, "order": order.to_dict(), "inserted": inserted, "skipped": skipped})
+    return jsonify({"ok": True, "order": order.to_dict(), "inserted": len(added), "skipped": skipped})
 
 
 @orders_bp.delete("/orders/<int:order_id>/items/<int:item_id>")
@@ -5,6 +5,8 @@ from ..db import db
 from ..models.product import Product
 from ..models.variant import ProductVariant
 from ..models.catalog_price import CatalogPrice
+from ..services.latest_prices import latest_catalog_prices, latest_costs
+from ..services.product_matcher import candidate_products
 from .auth import require_token
 
 
@@ -20,31 +22,23 @@ def capitalize_name(name: str) -> str:
 
 @products_bp.get("/products")
 def list_products():
-    from ..models.purchase import Purchase
     items = Product.query.order_by(Product.name.asc()).all()
+    # Último precio de catálogo (Precio/Unidad de la tabla) y último costo de compras, una consulta cada uno
+    catalog = latest_catalog_prices()
+    costs = latest_costs()
     result = []
     for p in items:
         row = p.to_dict()
-        # Adjuntar último precio de catálogo para mostrar en la tabla (Precio/Unidad)
-        c = CatalogPrice.query.filter(CatalogPrice.product_id == p.id).order_by(CatalogPrice.date.desc()).first()
+        c = catalog.get(p.id)
         if c:
             row["catalog"] = [{"sale_price": c.sale_price, "unit": c.unit, "date": (c.date.isoformat() if c.date else None)}]
         else:
             row["catalog"] = []
-        
-        # Adjuntar último costo registrado en compras
-        latest_purchase = Purchase.query.filter(
-            Purchase.product_id == p.id,
-            Purchase.price_per_unit.isnot(None)
-        ).order_by(Purchase.created_at.desc()).first()
-        
-        if latest_purchase:
-            row["latest_cost"] = latest_purchase.price_per_unit
-            row["latest_cost_unit"] = latest_purchase.charged_unit
-        else:
-            row["latest_cost"] = None
-            row["latest_cost_unit"] = None
-        
+
+        cost = costs.get(p.id)
+        row["latest_cost"] = cost.price_per_unit if cost else None
+        row["latest_cost_unit"] = cost.charged_unit if cost else None
+
         result.append(row)
     return jsonify(result)
 
@@ -65,9 +59,10 @@ def suggest_products():
         inter = len(a & b)
         union = len(a | b) or 1
         return int(60 * inter / union)
-    items = Product.query.all()
-    ranked = sorted([(score(p.name), p) for p in items], key=lambda x: -x[0])
-    return jsonify([{"id": p.id, "name": p.name, "score": s} for s, p in ranked if s >= 60][:5])
+    # score >= 60 implica igualdad, substring o mismos tokens, que en
+    # similarity_score valen 80 o más: basta con los candidatos del índice
+    ranked = sorted([(score(name), pid, name) for pid, name in candidate_products(q, min_score=80)], key=lambda x: -x[0])
+    return jsonify([{"id": pid, "name": name, "score": s} for s, pid, name in ranked if s >= 60][:5])
 
 
 @products_bp.post("/products")
@@ -4,8 +4,8 @@ from datetime import datetime
 from ..db import db
 from ..models.purchase import Purchase
 from ..models.price_history import PriceHistory
-from ..models.catalog_price import CatalogPrice
 from ..models.order_item import OrderItem
+from ..services.latest_prices import latest_sale_price
 from .auth import require_token
 
 purchases_bp = Blueprint("purchases", __name__)
@@ -75,12 +75,7 @@ def create_purchase():
     # Guardar precio histórico automático: costo y venta actual
     current_sale = None
     try:
-        c = (
-            CatalogPrice.query.filter(CatalogPrice.product_id == product_id)
-            .order_by(CatalogPrice.date.desc())
-            .first()
-        )
-        current_sale = c.sale_price if c else None
+        current_sale = latest_sale_price(product_id)
     except Exception:
         current_sale = None
     ph = PriceHistory(product_id=product_id, cost=price_per_unit, sale=current_sale, unit=charged_unit)
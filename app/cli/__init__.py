@@ -1,3 +1,5 @@
 def register_cli(app):
     from .admin import register_admin_commands
+    from .accounting import register_accounting_commands
     register_admin_commands(app)
+    register_accounting_commands(app)
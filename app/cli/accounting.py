@@ -0,0 +1,59 @@
+import click
+
+
+def register_accounting_commands(app):
+    @app.cli.command("ledger-rebuild")
+    @click.option("--batch-size", default=500, show_default=True, help="Pedidos por lote")
+    def ledger_rebuild(batch_size):
+        """Reconstruye la tabla order_ledger desde charges, purchases y pagos."""
+        from ..services.order_ledger import rebuild_order_ledger
+        total = rebuild_order_ledger(batch_size=batch_size)
+        click.echo(f"Ledger reconstruido: {total} pedidos.")
+
+    @app.cli.command("ledger-verify")
+    @click.option("--batch-size", default=500, show_default=True, help="Pedidos por lote")
+    @click.option("--show", default=20, show_default=True, help="Diferencias a mostrar")
+    def ledger_verify(batch_size, show):
+        """Compara order_ledger con el recálculo en vivo."""
+        from ..services.order_ledger import verify_order_ledger
+        mismatches = verify_order_ledger(batch_size=batch_size)
+        if not mismatches:
+            click.echo("Ledger OK: sin diferencias.")
+            return
+        for m in mismatches[:show]:
+            click.echo(f"Pedido {m['order_id']}: {m['field']} ledger={m['ledger']} vivo={m['live']}")
+        click.echo(f"{len(mismatches)} diferencias. Ejecuta `flask ledger-rebuild` para corregir.")
+        raise SystemExit(1)
+
+    @app.cli.command("customer-balances-rebuild")
+    @click.option("--batch-size", default=500, show_default=True, help="Clientes por lote")
+    def customer_balances_rebuild(batch_size):
+        """Reconstruye los saldos por cliente desde charges y pagos."""
+        from ..services.customer_balances import rebuild_customer_balances
+        total = rebuild_customer_balances(batch_size=batch_size)
+        click.echo(f"Saldos reconstruidos: {total} clientes.")
+
+    @app.cli.command("vendor-commissions-backfill")
+    @click.option("--batch-size", default=500, show_default=True, help="Filas del ledger por lote")
+    def vendor_commissions_backfill(batch_size):
+        """Reconstruye vendor_commission_daily desde order_ledger (correr después de ledger-rebuild)."""
+        from ..services.vendor_commissions import rebuild_vendor_commissions
+        total = rebuild_vendor_commissions(batch_size=batch_size)
+        click.echo(f"Comisiones diarias reconstruidas: {total} días-vendedor.")
+
+    @app.cli.command("excess-rebuild")
+    @click.option("--batch-size", default=500, show_default=True, help="Pedidos por lote")
+    def excess_rebuild(batch_size):
+        """Reconstruye excess_inventory desde items y compras."""
+        from ..services.excess_inventory import rebuild_excess_inventory
+        total = rebuild_excess_inventory(batch_size=batch_size)
+        click.echo(f"Inventario de excedentes reconstruido: {total} filas.")
+
+    @app.cli.command("kpis-refresh")
+    @click.option("--full", is_flag=True, help="Recalcula todos los días (no solo los anotados)")
+    def kpis_refresh(full):
+        """Refresca los hechos diarios de KPIs de los días escritos desde la última corrida."""
+        from ..services.kpi_facts import refresh_kpi_facts
+        result = refresh_kpi_facts(full=full)
+        kind = "completo" if result["full"] else "incremental"
+        click.echo(f"KPIs diarios ({kind}): {result['days']} días recalculados, marca de agua {result['watermark']}.")
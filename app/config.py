@@ -11,6 +11,19 @@ class AppConfig:
     database_url: str = os.getenv("DATABASE_URL", "sqlite:///local.db")
     secret_token: str = os.getenv("SECRET_TOKEN", "dev-token")
     cors_origin: str = os.getenv("CORS_ORIGIN", "http://localhost:5173")
+    # Caché de respuestas de contabilidad: memory (por proceso), sqlite (compartida entre workers) o none
+    response_cache_backend: str = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+    response_cache_path: str = os.getenv("RESPONSE_CACHE_PATH", "")
+    response_cache_max_entries: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+    response_cache_ttl: int = int(os.getenv("RESPONSE_CACHE_TTL", "300"))
+    # Caché de tramos y precios de catálogo entre requests (segundos; 0 = desactivada)
+    price_book_cache_ttl: int = int(os.getenv("PRICE_BOOK_CACHE_TTL", "0"))
+    # Hilos por proceso para los jobs de parseo de pedidos (POST /orders/parse-jobs)
+    parse_job_workers: int = int(os.getenv("PARSE_JOB_WORKERS", "2"))
+    # Segundos que GET /orders/parse-jobs/<id> en NDJSON espera items nuevos antes de cerrar
+    parse_job_stream_seconds: int = int(os.getenv("PARSE_JOB_STREAM_SECONDS", "5"))
+    # Sin avances en este tiempo un job queued/running se marca failed (proceso reiniciado)
+    parse_job_stale_seconds: int = int(os.getenv("PARSE_JOB_STALE_SECONDS", "600"))
 
     @property
     def cors_origins(self) -> list:
@@ -21,3 +34,11 @@ class AppConfig:
         app.config["SQLALCHEMY_DATABASE_URI"] = self.database_url
         app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
         app.config["SECRET_TOKEN"] = self.secret_token
+        app.config["RESPONSE_CACHE_BACKEND"] = self.response_cache_backend
+        app.config["RESPONSE_CACHE_PATH"] = self.response_cache_path
+        app.config["RESPONSE_CACHE_MAX_ENTRIES"] = self.response_cache_max_entries
+        app.config["RESPONSE_CACHE_TTL"] = self.response_cache_ttl
+        app.config["PRICE_BOOK_CACHE_TTL"] = self.price_book_cache_ttl
+        app.config["PARSE_JOB_WORKERS"] = self.parse_job_workers
+        app.config["PARSE_JOB_STREAM_SECONDS"] = self.parse_job_stream_seconds
+        app.config["PARSE_JOB_STALE_SECONDS"] = self.parse_job_stale_seconds
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from ..db import db
+
+
+class CustomerBalance(db.Model):
+    """Saldo corriente por cliente (mantenido por services/customer_balances)."""
+
+    __tablename__ = "customer_balances"
+
+    customer_id = db.Column(db.Integer, db.ForeignKey("customers.id", ondelete="CASCADE"), primary_key=True)
+    billed = db.Column(db.Float, nullable=False, default=0.0)
+    paid = db.Column(db.Float, nullable=False, default=0.0)
+    due = db.Column(db.Float, nullable=False, default=0.0, index=True)
+    last_activity_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self) -> dict:
+        return {
+            "customer_id": self.customer_id,
+            "billed": self.billed,
+            "paid": self.paid,
+            "due": self.due,
+            "last_activity_at": self.last_activity_at.isoformat() if self.last_activity_at else None,
+        }
+
+
+class CustomerOrderBalance(db.Model):
+    """Facturado y pagado de un cliente en un pedido (order_id NULL = cargos sin pedido)."""
+
+    __tablename__ = "customer_order_balances"
+
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey("customers.id", ondelete="CASCADE"), nullable=False, index=True)
+    order_id = db.Column(db.Integer, db.ForeignKey("orders.id", ondelete="CASCADE"), nullable=True)
+    billed = db.Column(db.Float, nullable=False, default=0.0)
+    paid = db.Column(db.Float, nullable=False, default=0.0)
+    # menor id de cargo del par: orden de aparición del pedido entre los cargos del cliente
+    position = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self) -> dict:
+        return {
+            "order_id": self.order_id,
+            "billed": self.billed,
+            "paid": self.paid,
+        }
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from ..db import db
+
+
+class ExcessInventory(db.Model):
+    """
+    Comprado vs pedido por (pedido, producto) en la unidad de cobro, para los
+    productos con compras (mantenido por services/excess_inventory).
+    order_id NULL = compras de excedente sin pedido.
+    """
+
+    __tablename__ = "excess_inventory"
+
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey("orders.id", ondelete="CASCADE"), nullable=True, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False, index=True)
+    unit = db.Column(db.String(16), nullable=True)
+    needed = db.Column(db.Float, nullable=False, default=0.0)
+    purchased = db.Column(db.Float, nullable=False, default=0.0)
+    excess = db.Column(db.Float, nullable=False, default=0.0)  # purchased - needed (puede ser negativo)
+    # primera compra del producto en el pedido: orden de salida
+    first_purchase_id = db.Column(db.Integer, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self) -> dict:
+        return {
+            "order_id": self.order_id,
+            "product_id": self.product_id,
+            "unit": self.unit,
+            "needed_qty": self.needed,
+            "purchased_qty": self.purchased,
+            "excess_qty": self.excess,
+        }
@@ -0,0 +1,83 @@
+from datetime import datetime
+
+from ..db import db
+
+
+class KpiDaily(db.Model):
+    """Totales por día de creación del pedido para /admin/kpis (mantenido por `flask kpis-refresh`)."""
+
+    __tablename__ = "kpi_daily"
+
+    day = db.Column(db.Date, primary_key=True)
+    num_orders = db.Column(db.Integer, nullable=False, default=0)  # pedidos de cualquier estado
+    billed = db.Column(db.Float, nullable=False, default=0.0)  # cargos no cancelados
+    cost = db.Column(db.Float, nullable=False, default=0.0)  # compras (price_total o price_per_unit * cantidad)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class KpiCustomerDaily(db.Model):
+    """Facturado y pedidos distintos por cliente y día (cargos no cancelados)."""
+
+    __tablename__ = "kpi_customer_daily"
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    customer_id = db.Column(db.Integer, nullable=False, index=True)  # sin FK: puede quedar de un cliente borrado
+    billed = db.Column(db.Float, nullable=False, default=0.0)
+    num_orders = db.Column(db.Integer, nullable=False, default=0)
+    # menor id de cargo: desempate del desglose en el orden en que aparecían los clientes
+    first_charge_id = db.Column(db.Integer, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint("day", "customer_id", name="uq_kpi_customer_daily_day_customer"),
+    )
+
+
+class KpiProductDaily(db.Model):
+    """Cantidad, ingresos y costo por producto y día (criterios de /admin/kpis/productos-top)."""
+
+    __tablename__ = "kpi_product_daily"
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    product_id = db.Column(db.Integer, nullable=False, index=True)
+    num_charges = db.Column(db.Integer, nullable=False, default=0)  # cargos con charged_qty y unit_price
+    qty = db.Column(db.Float, nullable=False, default=0.0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    cost = db.Column(db.Float, nullable=False, default=0.0)  # SUM(price_total) de las compras
+
+    __table_args__ = (
+        db.UniqueConstraint("day", "product_id", name="uq_kpi_product_daily_day_product"),
+    )
+
+
+class KpiDirtyDay(db.Model):
+    """Día con escrituras posteriores al último `flask kpis-refresh` (se anota en cada commit)."""
+
+    __tablename__ = "kpi_dirty_days"
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # ids sin reutilizar al vaciarse la tabla (marca de agua)
+    __table_args__ = {"sqlite_autoincrement": True}
+
+
+class KpiRefreshState(db.Model):
+    """Marca de agua del refresco incremental (una sola fila, id = 1)."""
+
+    __tablename__ = "kpi_refresh_state"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # mayor id de kpi_dirty_days ya procesado
+    watermark = db.Column(db.Integer, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime, nullable=True)
+    full_refreshed_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "watermark": self.watermark,
+            "refreshed_at": self.refreshed_at.isoformat() if self.refreshed_at else None,
+            "full_refreshed_at": self.full_refreshed_at.isoformat() if self.full_refreshed_at else None,
+        }
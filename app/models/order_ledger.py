@@ -0,0 +1,53 @@
+import json
+from datetime import datetime
+
+from ..db import db
+
+
+class OrderLedger(db.Model):
+    """Totales contables materializados por pedido (mantenidos por services/order_ledger)."""
+
+    __tablename__ = "order_ledger"
+
+    order_id = db.Column(db.Integer, db.ForeignKey("orders.id", ondelete="CASCADE"), primary_key=True)
+    # copia de campos del pedido para filtrar sin join
+    vendor_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+    order_status = db.Column(db.String(20), nullable=True)
+    order_created_at = db.Column(db.DateTime, nullable=True, index=True)
+    billed = db.Column(db.Float, nullable=False, default=0.0)
+    cost = db.Column(db.Float, nullable=False, default=0.0)
+    paid = db.Column(db.Float, nullable=False, default=0.0)
+    profit = db.Column(db.Float, nullable=False, default=0.0)  # max(0, billed - cost)
+    commission_rate = db.Column(db.Float, nullable=True)
+    vendor_commission = db.Column(db.Float, nullable=False, default=0.0)
+    kivi_amount = db.Column(db.Float, nullable=False, default=0.0)
+    purchase_status = db.Column(db.String(16), nullable=True)  # complete|incomplete|over
+    # JSON para servir GET /accounting/orders sin recalcular: {customer_id: facturado} y etiquetas de compra
+    billed_by_customer = db.Column(db.Text, nullable=True)
+    bought_tags = db.Column(db.Text, nullable=True)
+    missing_tags = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_order_ledger_vendor_status_created", "vendor_id", "order_status", "order_created_at"),
+    )
+
+    def to_dict(self) -> dict:
+        return {
+            "order_id": self.order_id,
+            "vendor_id": self.vendor_id,
+            "order_status": self.order_status,
+            "order_created_at": self.order_created_at.isoformat() if self.order_created_at else None,
+            "billed": self.billed,
+            "cost": self.cost,
+            "paid": self.paid,
+            "profit": self.profit,
+            "commission_rate": self.commission_rate,
+            "vendor_commission": self.vendor_commission,
+            "kivi_amount": self.kivi_amount,
+            "purchase_status": self.purchase_status,
+            "billed_by_customer": {int(k): v for k, v in json.loads(self.billed_by_customer or "{}").items()},
+            "bought_tags": json.loads(self.bought_tags or "[]"),
+            "missing_tags": json.loads(self.missing_tags or "[]"),
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
@@ -0,0 +1,16 @@
+from datetime import datetime
+
+from ..db import db
+
+
+class OrderVersion(db.Model):
+    """
+    Versión de cada pedido, incrementada en cada commit que toca el pedido o
+    sus items, compras, cargos o pagos (mantenida por services/order_versions).
+    """
+
+    __tablename__ = "order_versions"
+
+    order_id = db.Column(db.Integer, db.ForeignKey("orders.id", ondelete="CASCADE"), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,61 @@
+import json
+from datetime import datetime
+
+from ..db import db
+
+
+class ParseJob(db.Model):
+    """Parseo y matching de productos en segundo plano de un texto de pedidos (services/parse_jobs)."""
+
+    __tablename__ = "parse_jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(16), nullable=False, default="queued")  # queued|running|done|failed
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+    total_lines = db.Column(db.Integer, nullable=False, default=0)
+    processed_lines = db.Column(db.Integer, nullable=False, default=0)
+    items_count = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    # proceso (host:pid) cuyo pool de hilos tiene el job en cola o corriendo
+    worker = db.Column(db.String(128), nullable=True)
+    # latido: lo avanza ese proceso mientras tenga el job; si se detiene, el job quedó huérfano (services/parse_jobs)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "total_lines": self.total_lines,
+            "processed_lines": self.processed_lines,
+            "progress": round(self.processed_lines / self.total_lines, 4) if self.total_lines else (1.0 if self.finished else 0.0),
+            "items_count": self.items_count,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class ParseJobItem(db.Model):
+    """Item parseado y anotado (match_status, product_id, suggestions) de un ParseJob, en orden."""
+
+    __tablename__ = "parse_job_items"
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey("parse_jobs.id", ondelete="CASCADE"), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.Text, nullable=False)  # JSON del item
+
+    __table_args__ = (
+        db.UniqueConstraint("job_id", "position", name="uq_parse_job_items_job_position"),
+    )
+
+    def to_dict(self) -> dict:
+        return {**json.loads(self.data), "position": self.position}
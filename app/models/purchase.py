@@ -1,5 +1,7 @@
 from datetime import datetime
 
+from sqlalchemy import text
+
 from ..db import db
 
 
@@ -24,6 +26,15 @@ class Purchase(db.Model):
     customers = db.Column(db.Text, nullable=True)  # csv simple de clientes incluidos para compra masiva
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # compras de excedente sin pedido (ver migrate_add_orphan_purchase_index.py)
+        db.Index(
+            "ix_purchases_orphan_product", "product_id",
+            postgresql_where=text("order_id IS NULL"),
+            sqlite_where=text("order_id IS NULL"),
+        ),
+    )
+
     def to_dict(self) -> dict:
         return {
             "id": self.id,
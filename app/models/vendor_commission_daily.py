@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from ..db import db
+
+
+class VendorCommissionDaily(db.Model):
+    """Comisiones por vendedor y día de pedidos emitidos (mantenido por services/vendor_commissions)."""
+
+    __tablename__ = "vendor_commission_daily"
+
+    id = db.Column(db.Integer, primary_key=True)
+    vendor_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    num_orders = db.Column(db.Integer, nullable=False, default=0)
+    billed = db.Column(db.Float, nullable=False, default=0.0)
+    cost = db.Column(db.Float, nullable=False, default=0.0)
+    profit = db.Column(db.Float, nullable=False, default=0.0)  # billed - cost (sin truncar, para poder sumar días)
+    commission = db.Column(db.Float, nullable=False, default=0.0)  # max(0, profit) * tasa vigente al calcular
+    kivi_amount = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint("vendor_id", "day", name="uq_vendor_commission_daily_vendor_day"),
+    )
+
+    def to_dict(self) -> dict:
+        return {
+            "vendor_id": self.vendor_id,
+            "day": self.day.isoformat() if self.day else None,
+            "num_orders": self.num_orders,
+            "billed": self.billed,
+            "cost": self.cost,
+            "profit": self.profit,
+            "commission": self.commission,
+            "kivi_amount": self.kivi_amount,
+        }
@@ -0,0 +1,306 @@
+"""
+Motor de contabilidad por pedido basado en conjuntos.
+
+Carga de una sola vez (un número constante de consultas agrupadas) los items,
+compras, cargos, pagos aplicados, clientes, productos y vendedores de una
+ventana de pedidos, y calcula en memoria facturado, costo, pagado, estado de
+compra y comisiones con la misma forma JSON que GET /accounting/orders.
+"""
+from typing import Dict, Iterable, List, Optional
+
+from ..db import db
+from ..models.charge import Charge
+from ..models.customer import Customer
+from ..models.order import Order
+from ..models.order_item import OrderItem
+from ..models.payment import PaymentApplication
+from ..models.product import Product
+from ..models.purchase import Purchase
+from ..models.user import User
+from .purchase_coverage import PurchaseCoverage
+
+
+def _group_by_order(rows) -> Dict[int, list]:
+    grouped: Dict[int, list] = {}
+    for row in rows:
+        grouped.setdefault(row.order_id, []).append(row)
+    return grouped
+
+
+class AccountingContext:
+    """Filas relacionadas a un conjunto de pedidos, agrupadas por pedido."""
+
+    def __init__(self, order_ids: Iterable[int], include_details: bool = False):
+        self.order_ids = list(order_ids)
+        self.include_details = include_details
+        self.items_by_order: Dict[int, List[OrderItem]] = {}
+        self.purchases_by_order: Dict[int, List[Purchase]] = {}
+        self.charges_by_order: Dict[int, List[Charge]] = {}
+        self.paid_by_order: Dict[int, float] = {}
+        self.items_by_id: Dict[int, OrderItem] = {}
+        self.customers: Dict[int, Customer] = {}
+        self.products: Dict[int, Product] = {}
+        self.vendors: Dict[int, User] = {}
+        self.coverage = PurchaseCoverage()
+
+    def load(self, orders: Iterable[Order]) -> "AccountingContext":
+        ids = self.order_ids
+        if not ids:
+            return self
+
+        items = OrderItem.query.filter(OrderItem.order_id.in_(ids)).order_by(OrderItem.id.asc()).all()
+        self.items_by_order = _group_by_order(items)
+        self.items_by_id = {it.id: it for it in items}
+
+        purchases = Purchase.query.filter(Purchase.order_id.in_(ids)).order_by(Purchase.id.asc()).all()
+        self.purchases_by_order = _group_by_order(purchases)
+        self.coverage = PurchaseCoverage().add_items(items).add_purchases(purchases)
+
+        # Usamos SOLO order_id (no original_order_id) y excluimos cancelados
+        charges = (
+            Charge.query.filter(Charge.order_id.in_(ids), Charge.status != 'cancelled')
+            .order_by(Charge.id.asc())
+            .all()
+        )
+        self.charges_by_order = _group_by_order(charges)
+
+        # Pagos aplicados a esos cargos, sumados por pedido en el orden de inserción
+        apps = (
+            db.session.query(Charge.order_id, PaymentApplication.amount)
+            .join(Charge, PaymentApplication.charge_id == Charge.id)
+            .filter(Charge.order_id.in_(ids), Charge.status != 'cancelled')
+            .order_by(PaymentApplication.id.asc())
+            .all()
+        )
+        for order_id, amount in apps:
+            self.paid_by_order[order_id] = self.paid_by_order.get(order_id, 0.0) + (amount or 0.0)
+
+        # Items de otros pedidos referenciados por cargos sin charged_qty (reasignaciones)
+        missing_item_ids = {
+            c.order_item_id for c in charges
+            if c.charged_qty is None and c.order_item_id and c.order_item_id not in self.items_by_id
+        }
+        if missing_item_ids:
+            for it in OrderItem.query.filter(OrderItem.id.in_(missing_item_ids)).all():
+                self.items_by_id[it.id] = it
+
+        vendor_ids = {o.vendor_id for o in orders if o.vendor_id}
+        if vendor_ids:
+            self.vendors = {u.id: u for u in User.query.filter(User.id.in_(vendor_ids)).all()}
+
+        if self.include_details:
+            customer_ids = {c.customer_id for c in charges}
+            product_ids = {c.product_id for c in charges} | {p.product_id for p in purchases}
+            if customer_ids:
+                self.customers = {c.id: c for c in Customer.query.filter(Customer.id.in_(customer_ids)).all()}
+            if product_ids:
+                self.products = {p.id: p for p in Product.query.filter(Product.id.in_(product_ids)).all()}
+        return self
+
+
+def charge_billed_qty(charge: Charge, items_by_id: Dict[int, OrderItem]) -> float:
+    """Cantidad a cobrar: charged_qty del cargo, luego la del OrderItem, luego qty."""
+    if charge.charged_qty is not None:
+        return charge.charged_qty
+    if charge.order_item_id:
+        oi = items_by_id.get(charge.order_item_id)
+        if oi and oi.charged_qty is not None:
+            return float(oi.charged_qty or 0.0)
+    return float(charge.qty or 0.0)
+
+
+def purchase_cost(purchase: Purchase) -> float:
+    """Costo de una compra: price_total o price_per_unit × cantidad en charged_unit."""
+    if purchase.price_total is not None:
+        return float(purchase.price_total or 0.0)
+    unit = purchase.charged_unit or "kg"
+    qty = float(purchase.qty_kg or 0.0) if unit == "kg" else float(purchase.qty_unit or 0.0)
+    return float(purchase.price_per_unit or 0.0) * qty
+
+
+def _customers_detail(charges, billed_by_customer, needed_by_product, purchased_by_product, ctx):
+    charges_by_customer = {}
+    for charge in charges:
+        charges_by_customer.setdefault(charge.customer_id, []).append(charge)
+
+    customers_detail = []
+    for customer_id, cust_charges in charges_by_customer.items():
+        customer = ctx.customers.get(customer_id)
+        charges_by_product = {}
+        for charge in cust_charges:
+            charges_by_product.setdefault(charge.product_id, []).append(charge)
+
+        products_detail = []
+        for product_id, prod_charges in charges_by_product.items():
+            product = ctx.products.get(product_id)
+            total_qty = sum(
+                (c.charged_qty if c.charged_qty is not None else c.qty)
+                for c in prod_charges
+            )
+            total_billed = sum(
+                (c.charged_qty if c.charged_qty is not None else c.qty) * c.unit_price
+                for c in prod_charges
+            )
+            purchased = purchased_by_product.get(product_id, {"kg": 0.0, "unit": 0.0})
+            needed = needed_by_product.get(product_id, {"kg": 0.0, "unit": 0.0})
+            # Usar la unidad del primer charge para determinar status
+            unit = prod_charges[0].unit
+            key = "kg" if unit == 'kg' else "unit"
+            purchase_ok = purchased.get(key, 0) >= needed.get(key, 0)
+            has_excess = purchased.get(key, 0) > needed.get(key, 0)
+            products_detail.append({
+                "product_id": product_id,
+                "product_name": product.name if product else f"Producto #{product_id}",
+                "qty": total_qty,
+                "unit": unit,
+                "unit_price": prod_charges[0].unit_price,  # Asumimos mismo precio
+                "total_billed": total_billed,
+                "purchase_status": "complete" if purchase_ok else ("over" if has_excess else "incomplete"),
+                "charges": [c.to_dict() for c in prod_charges]
+            })
+
+        customers_detail.append({
+            "customer_id": customer_id,
+            "customer_name": customer.name if customer else f"Cliente #{customer_id}",
+            "billed": billed_by_customer.get(customer_id, 0.0),
+            "products": products_detail
+        })
+    return customers_detail
+
+
+def order_totals(order: Order, ctx: AccountingContext) -> dict:
+    """Facturado, costo, pagado, estado de compra y comisiones de un pedido."""
+    purchases = ctx.purchases_by_order.get(order.id, [])
+    charges = ctx.charges_by_order.get(order.id, [])
+
+    # 1. FACTURADO
+    billed_total = 0.0
+    billed_by_customer = {}
+    for charge in charges:
+        charge_billed = charge_billed_qty(charge, ctx.items_by_id) * float(charge.unit_price or 0.0)
+        billed_total += charge_billed
+        billed_by_customer[charge.customer_id] = billed_by_customer.get(charge.customer_id, 0.0) + charge_billed
+
+    # 2. COSTO
+    total_cost = 0.0
+    for purchase in purchases:
+        total_cost += purchase_cost(purchase)
+
+    # 3. ESTADO DE COMPRA
+    status, bought_tags, missing_tags = ctx.coverage.requested_status(order.id)
+    needed_by_product, purchased_by_product = ctx.coverage.requested(order.id)
+
+    # 4. COMISIONES DE VENDEDORES
+    profit_amount = max(0.0, billed_total - total_cost)
+    vendor_commission_amount = 0.0
+    vendor_commission_pct = 0.0
+    kivi_amount = 0.0
+    vendor = None
+    if order.vendor_id:
+        vendor = ctx.vendors.get(order.vendor_id)
+        if vendor:
+            vendor_commission_pct = vendor.commission_rate * 100  # Porcentaje para display
+            vendor_commission_amount = profit_amount * vendor.commission_rate
+            kivi_amount = profit_amount - vendor_commission_amount
+    else:
+        # Si no hay vendedor, toda la utilidad es para Kivi
+        kivi_amount = profit_amount
+
+    return {
+        "billed": billed_total,
+        "billed_by_customer": billed_by_customer,
+        "cost": total_cost,
+        "paid": ctx.paid_by_order.get(order.id, 0.0),
+        "purchase_status": status,
+        "needed_by_product": needed_by_product,
+        "purchased_by_product": purchased_by_product,
+        "bought_tags": bought_tags,
+        "missing_tags": missing_tags,
+        "profit_amount": profit_amount,
+        "vendor": vendor,
+        "vendor_commission_amount": vendor_commission_amount,
+        "vendor_commission_pct": vendor_commission_pct,
+        "kivi_amount": kivi_amount,
+    }
+
+
+def summary_row(order: Order, totals: dict) -> Optional[dict]:
+    """
+    Fila de contabilidad de un pedido (misma forma que GET /accounting/orders)
+    a partir de sus totales (order_totals, o los guardados en order_ledger).
+    Retorna None si el pedido no tiene facturación.
+    """
+    billed_total = totals["billed"]
+
+    # Solo incluir pedidos con facturación > 0
+    if billed_total <= 0:
+        return None
+
+    vendor = totals["vendor"]
+    vendor_info = None
+    if vendor:
+        vendor_info = {
+            "vendor_id": vendor.id,
+            "vendor_name": vendor.name,
+            "commission_rate": vendor.commission_rate
+        }
+    paid = totals["paid"]
+    profit_amount = totals["profit_amount"]
+    profit_pct = (profit_amount / billed_total * 100.0) if billed_total > 0 else 0.0
+    row = {
+        "order": order.to_dict(),
+        "billed": billed_total,
+        "paid": paid,
+        "due": max(0.0, billed_total - paid),
+        "purchase_status": totals["purchase_status"],
+        "cost": totals["cost"],
+        "profit_amount": profit_amount,
+        "profit_pct": profit_pct,
+        "vendor_commission_amount": totals["vendor_commission_amount"],
+        "vendor_commission_pct": totals["vendor_commission_pct"],
+        "kivi_amount": totals["kivi_amount"],
+        "vendor_info": vendor_info,
+        "bought_money": 0.0,  # No usado en frontend
+        "missing_money": 0.0,  # No usado en frontend
+        "bought_tags": totals["bought_tags"],
+        "missing_tags": totals["missing_tags"],
+        "billed_by_customer": totals["billed_by_customer"],
+    }
+    return row
+
+
+def summarize_order(order: Order, ctx: AccountingContext) -> Optional[dict]:
+    """Fila de contabilidad de un pedido calculada en vivo (con detalle si ctx.include_details)."""
+    totals = order_totals(order, ctx)
+    row = summary_row(order, totals)
+    if row is None:
+        return None
+
+    if ctx.include_details:
+        charges = ctx.charges_by_order.get(order.id, [])
+        purchases = ctx.purchases_by_order.get(order.id, [])
+        row["customers"] = _customers_detail(
+            charges, totals["billed_by_customer"], totals["needed_by_product"], totals["purchased_by_product"], ctx
+        )
+        row["purchases"] = [
+            {
+                **purchase.to_dict(),
+                "product_name": (
+                    ctx.products[purchase.product_id].name
+                    if purchase.product_id in ctx.products else f"Producto #{purchase.product_id}"
+                )
+            }
+            for purchase in purchases
+        ]
+    return row
+
+
+def build_orders_summary(orders: List[Order], include_details: bool = False) -> List[dict]:
+    """Calcula las filas de contabilidad de una lista de pedidos en consultas agrupadas."""
+    ctx = AccountingContext([o.id for o in orders], include_details=include_details).load(orders)
+    result = []
+    for order in orders:
+        row = summarize_order(order, ctx)
+        if row is not None:
+            result.append(row)
+    return result
@@ -0,0 +1,221 @@
+"""
+Seguimiento de escrituras contables por transacción.
+
+Un listener de after_flush anota en session.info qué pedidos, clientes y
+productos fueron tocados por escrituras de Order, OrderItem, Charge, Purchase,
+Payment, PaymentApplication y Customer (incluyendo los valores anteriores de
+las FK), además de los vendedores cuyo commission_rate cambió. Al confirmar
+la transacción esos cambios se entregan a los manejadores registrados con
+on_before_commit (dentro de la misma transacción, para mantener tablas
+derivadas) y on_after_commit (ya confirmados, para invalidar cachés).
+
+Las sentencias masivas (insert/update de Core) no pasan por el unit of work:
+quien las use debe anotar los ids afectados con note_changes().
+"""
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session
+
+from ..models.charge import Charge
+from ..models.customer import Customer
+from ..models.order import Order
+from ..models.order_item import OrderItem
+from ..models.payment import Payment, PaymentApplication
+from ..models.purchase import Purchase
+from ..models.user import User
+
+
+_PENDING_KEY = "kivi_pending_changes"
+_COMMITTED_KEY = "kivi_committed_changes"
+
+_before_commit_handlers: List[Callable] = []
+_after_commit_handlers: List[Callable] = []
+
+
+class ChangeSet:
+    """Ids afectados por las escrituras de una transacción."""
+
+    FIELDS = ("order_ids", "customer_ids", "product_ids", "charge_ids", "customer_orders", "orphan_product_ids",
+              "new_order_ids", "vendor_ids", "vendor_days", "order_days", "tables")
+
+    def __init__(self):
+        self.order_ids = set()
+        self.customer_ids = set()
+        self.product_ids = set()
+        # cargos con pagos aplicados: se resuelven a pedido/cliente antes del commit
+        self.charge_ids = set()
+        # (customer_id, order_id) con cargos o pagos aplicados modificados (saldos por pedido)
+        self.customer_orders = set()
+        # productos con compras sin pedido (excedentes huérfanos)
+        self.orphan_product_ids = set()
+        self.new_order_ids = set()
+        # vendedores con commission_rate modificado (comisiones del ledger y diarias)
+        self.vendor_ids = set()
+        # (vendor_id, día) de pedidos cuyo ledger cambió; lo completa services/order_ledger
+        self.vendor_days = set()
+        # días (de creación) de pedidos cuyo ledger cambió; también lo completa services/order_ledger
+        self.order_days = set()
+        # tablas escritas por el unit of work (cualquier modelo)
+        self.tables = set()
+
+    def __bool__(self) -> bool:
+        return any(getattr(self, f) for f in self.FIELDS)
+
+    def update(self, other: "ChangeSet") -> None:
+        for f in self.FIELDS:
+            getattr(self, f).update(getattr(other, f))
+
+    def to_dict(self) -> dict:
+        return {f: sorted(getattr(self, f)) for f in self.FIELDS}
+
+
+# Campo del modelo -> conjunto del ChangeSet donde se anota
+_TRACKED_FIELDS = {
+    Order: (("id", "order_ids"),),
+    OrderItem: (("order_id", "order_ids"), ("customer_id", "customer_ids"), ("product_id", "product_ids")),
+    Charge: (("order_id", "order_ids"), ("customer_id", "customer_ids"), ("product_id", "product_ids")),
+    Purchase: (("order_id", "order_ids"), ("product_id", "product_ids")),
+    Payment: (("customer_id", "customer_ids"),),
+    PaymentApplication: (("charge_id", "charge_ids"),),
+    Customer: (("id", "customer_ids"),),
+}
+
+
+def on_before_commit(fn: Callable) -> Callable:
+    """Registra fn(session, changes), llamado dentro de la transacción antes del commit."""
+    if fn not in _before_commit_handlers:
+        _before_commit_handlers.append(fn)
+    return fn
+
+
+def on_after_commit(fn: Callable) -> Callable:
+    """Registra fn(changes), llamado una vez confirmada la transacción."""
+    if fn not in _after_commit_handlers:
+        _after_commit_handlers.append(fn)
+    return fn
+
+
+def _pending(session) -> ChangeSet:
+    changes = session.info.get(_PENDING_KEY)
+    if changes is None:
+        changes = session.info[_PENDING_KEY] = ChangeSet()
+    return changes
+
+
+def note_changes(session, order_ids: Optional[Iterable[int]] = None, customer_ids: Optional[Iterable[int]] = None,
+                 product_ids: Optional[Iterable[int]] = None, charge_ids: Optional[Iterable[int]] = None,
+                 customer_orders: Optional[Iterable[Tuple[int, Optional[int]]]] = None,
+                 tables: Optional[Iterable[str]] = None) -> None:
+    """
+    Anota ids (y tablas) afectados por sentencias masivas que no pasan por el
+    unit of work. Los cargos insertados o borrados en masa se anotan como
+    pares (cliente, pedido) en customer_orders; los modificados basta con
+    anotarlos en charge_ids.
+    """
+    changes = _pending(session)
+    changes.tables.update(tables or ())
+    changes.order_ids.update(i for i in (order_ids or ()) if i is not None)
+    changes.customer_ids.update(i for i in (customer_ids or ()) if i is not None)
+    changes.product_ids.update(i for i in (product_ids or ()) if i is not None)
+    changes.charge_ids.update(i for i in (charge_ids or ()) if i is not None)
+    changes.customer_orders.update(pair for pair in (customer_orders or ()) if pair[0] is not None)
+
+
+def _attr_values(obj, attr: str) -> set:
+    """Valor actual y anterior (si cambió en este flush) de un atributo."""
+    history = sa_inspect(obj).attrs[attr].history
+    values = set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ())
+    if not values:
+        values = {getattr(obj, attr, None)}
+    return values
+
+
+def _record(changes: ChangeSet, obj, is_new: bool) -> None:
+    table = getattr(obj, "__tablename__", None)
+    if table:
+        changes.tables.add(table)
+    if isinstance(obj, User) and sa_inspect(obj).attrs.commission_rate.history.has_changes():
+        changes.vendor_ids.add(obj.id)
+    fields = _TRACKED_FIELDS.get(type(obj))
+    if not fields:
+        return
+    for attr, target in fields:
+        values = _attr_values(obj, attr)
+        getattr(changes, target).update(v for v in values if v is not None)
+        if isinstance(obj, Purchase) and attr == "order_id" and None in values:
+            changes.orphan_product_ids.update(v for v in _attr_values(obj, "product_id") if v is not None)
+    if isinstance(obj, Charge):
+        # valores anteriores y actuales: un cargo reasignado toca ambos pares
+        changes.customer_orders.update(
+            (customer_id, order_id)
+            for customer_id in _attr_values(obj, "customer_id") if customer_id is not None
+            for order_id in _attr_values(obj, "order_id")
+        )
+    if is_new and isinstance(obj, Order):
+        changes.new_order_ids.add(obj.id)
+
+
+def _after_flush(session, flush_context) -> None:
+    changes = _pending(session)
+    for obj in session.new:
+        _record(changes, obj, is_new=True)
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            _record(changes, obj, is_new=False)
+    for obj in session.deleted:
+        _record(changes, obj, is_new=False)
+
+
+def _resolve_charges(session, changes: ChangeSet) -> None:
+    """Traduce cargos con pagos aplicados (o modificados en masa) a sus pedidos y clientes."""
+    if not changes.charge_ids:
+        return
+    rows = (
+        session.query(Charge.order_id, Charge.customer_id)
+        .filter(Charge.id.in_(changes.charge_ids))
+        .all()
+    )
+    for order_id, customer_id in rows:
+        if order_id is not None:
+            changes.order_ids.add(order_id)
+        if customer_id is not None:
+            changes.customer_ids.add(customer_id)
+            changes.customer_orders.add((customer_id, order_id))
+
+
+def _before_commit(session) -> None:
+    session.flush()
+    changes = session.info.pop(_PENDING_KEY, None)
+    if not changes:
+        return
+    _resolve_charges(session, changes)
+    for handler in _before_commit_handlers:
+        handler(session, changes)
+    committed = session.info.setdefault(_COMMITTED_KEY, ChangeSet())
+    committed.update(changes)
+
+
+def _after_commit(session) -> None:
+    changes = session.info.pop(_COMMITTED_KEY, None)
+    if not changes:
+        return
+    for handler in _after_commit_handlers:
+        handler(changes)
+
+
+def _discard(session, *args) -> None:
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_COMMITTED_KEY, None)
+
+
+def install_change_tracking() -> None:
+    """Registra los listeners de sesión (idempotente)."""
+    if event.contains(Session, "after_flush", _after_flush):
+        return
+    event.listen(Session, "after_flush", _after_flush)
+    event.listen(Session, "before_commit", _before_commit)
+    event.listen(Session, "after_commit", _after_commit)
+    event.listen(Session, "after_rollback", _discard)
+    # Restos de una transacción abortada sin rollback explícito
+    event.listen(Session, "after_begin", _discard)
@@ -0,0 +1,175 @@
+"""
+Historial de pedidos por cliente para recompra, actividad y cohortes.
+
+Una sola consulta agrupada entrega los pares (cliente, pedido, fecha) de los
+cargos, con una marca de si el pedido tiene algún cargo no cancelado, en
+orden de cliente y fecha; se recorre en streaming (yield_per) armando un
+CustomerHistory por cliente sin cargar objetos Charge. Sobre ese recorrido
+se calculan:
+
+  - customer_stats(): tasa de recompra del período (con la ventana
+    recompra_days entre pedidos consecutivos), clientes activos, histórico
+    y nuevos del mes, como en /admin/kpis/overview.
+  - retention_curves(): curvas de retención por cohorte (mes o semana del
+    primer pedido).
+
+Los pedidos "activos" son los que tienen al menos un cargo no cancelado;
+histórico y nuevos del mes consideran cualquier cargo, igual que antes.
+"""
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from itertools import groupby
+from typing import Iterator, List, Optional
+
+from sqlalchemy import case, func
+
+from ..db import db
+from ..models.charge import Charge
+from ..models.order import Order
+
+
+# Filas por lote del cursor
+_YIELD_PER = 2000
+
+PERIODS = ("month", "week")
+
+
+class CustomerHistory:
+    """Pedidos de un cliente: días de los pedidos activos y de cualquier pedido, ascendentes."""
+
+    __slots__ = ("customer_id", "orders", "any_orders")
+
+    def __init__(self, customer_id: int):
+        self.customer_id = customer_id
+        # un día por pedido (puede repetirse si hubo dos pedidos el mismo día)
+        self.orders: List[date] = []
+        self.any_orders: List[date] = []
+
+    @property
+    def first_order(self) -> Optional[date]:
+        return self.orders[0] if self.orders else None
+
+    def gaps(self) -> List[int]:
+        """Días entre pedidos activos consecutivos."""
+        return [(b - a).days for a, b in zip(self.orders, self.orders[1:])]
+
+    def orders_between(self, date_from: Optional[date], date_to: Optional[date]) -> List[date]:
+        return [d for d in self.orders if (not date_from or d >= date_from) and (not date_to or d <= date_to)]
+
+
+def iter_customer_histories() -> Iterator[CustomerHistory]:
+    """Recorre todos los clientes con cargos, en orden de id (una consulta, en streaming)."""
+    active = func.max(case((Charge.status != 'cancelled', 1), else_=0))
+    rows = (
+        db.session.query(Charge.customer_id, Charge.order_id, Order.created_at, active)
+        .outerjoin(Order, Charge.order_id == Order.id)
+        .filter(Charge.customer_id.isnot(None))
+        .group_by(Charge.customer_id, Charge.order_id, Order.created_at)
+        .order_by(Charge.customer_id.asc(), Order.created_at.asc(), Charge.order_id.asc())
+        .yield_per(_YIELD_PER)
+    )
+    for customer_id, group in groupby(rows, key=lambda r: r[0]):
+        history = CustomerHistory(customer_id)
+        for _, _, created_at, is_active in group:
+            # cargos sin pedido (o pedido sin fecha) solo cuentan para el histórico
+            if created_at is None:
+                continue
+            day = created_at.date()
+            history.any_orders.append(day)
+            if is_active:
+                history.orders.append(day)
+        yield history
+
+
+def customer_stats(date_from: Optional[date], date_to: Optional[date], recompra_days: int,
+                   fecha_limite: date, inicio_mes: date) -> dict:
+    """Bloques tasa_recompra y clientes del overview, en una pasada."""
+    total_customers = 0
+    repurchased = 0
+    repurchased_in_window = 0
+    gaps: List[int] = []
+    active = 0
+    historic = 0
+    new_this_month = 0
+    for history in iter_customer_histories():
+        historic += 1
+        if history.any_orders and history.any_orders[0] >= inicio_mes:
+            new_this_month += 1
+        if history.orders and history.orders[-1] >= fecha_limite:
+            active += 1
+        in_range = history.orders_between(date_from, date_to)
+        if not in_range:
+            continue
+        total_customers += 1
+        if len(in_range) > 1:
+            repurchased += 1
+            customer_gaps = [(b - a).days for a, b in zip(in_range, in_range[1:])]
+            gaps.extend(customer_gaps)
+            if min(customer_gaps) <= recompra_days:
+                repurchased_in_window += 1
+    return {
+        'tasa_recompra': {
+            'plazo_dias': recompra_days,
+            'total_clientes': total_customers,
+            'recompraron': repurchased,
+            'tasa_porcentaje': round((repurchased / total_customers * 100), 2) if total_customers > 0 else 0,
+            # con al menos dos pedidos del período separados por <= plazo_dias
+            'recompraron_en_plazo': repurchased_in_window,
+            'tasa_en_plazo_porcentaje': round((repurchased_in_window / total_customers * 100), 2) if total_customers > 0 else 0,
+            'dias_promedio_entre_pedidos': round(sum(gaps) / len(gaps), 2) if gaps else None,
+        },
+        'clientes': {
+            'activos': active,
+            'total_historico': historic,
+            'nuevos_mes': new_this_month,
+            'tasa_actividad_porcentaje': round((active / historic * 100), 2) if historic > 0 else 0,
+        },
+    }
+
+
+def _period_start(day: date, period: str) -> date:
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def _period_index(start: date, day: date, period: str) -> int:
+    if period == "week":
+        return (_period_start(day, period) - start).days // 7
+    return (day.year - start.year) * 12 + (day.month - start.month)
+
+
+def retention_curves(period: str = "month", date_from: Optional[date] = None, date_to: Optional[date] = None,
+                     max_periods: int = 12) -> List[dict]:
+    """
+    Cohortes por período del primer pedido activo (las que empiezan en el
+    rango): clientes de la cohorte y, para cada período posterior hasta
+    max_periods, cuántos volvieron a pedir en ese período.
+    """
+    sizes: Counter = Counter()
+    returned = defaultdict(Counter)
+    for history in iter_customer_histories():
+        first = history.first_order
+        if first is None or (date_from and first < date_from) or (date_to and first > date_to):
+            continue
+        cohort = _period_start(first, period)
+        sizes[cohort] += 1
+        periods = {_period_index(cohort, d, period) for d in history.orders}
+        for index in periods:
+            if 0 < index <= max_periods:
+                returned[cohort][index] += 1
+
+    curves = []
+    for cohort in sorted(sizes):
+        size = sizes[cohort]
+        retention = [{'periodo': 0, 'clientes': size, 'porcentaje': 100.0}]
+        for index in range(1, max_periods + 1):
+            count = returned[cohort][index]
+            retention.append({'periodo': index, 'clientes': count, 'porcentaje': round(count / size * 100, 2)})
+        curves.append({
+            'cohorte': cohort.isoformat() if period == "week" else cohort.strftime('%Y-%m'),
+            'inicio': cohort.isoformat(),
+            'clientes': size,
+            'retencion': retention,
+        })
+    return curves
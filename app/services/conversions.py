@@ -0,0 +1,186 @@
+"""
+Recálculo de conversiones kg/unidad (charged_qty, charged_unit) de pedidos.
+
+Usa las equivalencias anotadas en las compras de cada pedido (eq_qty_kg,
+eq_qty_unit) para calcular la cantidad a cobrar de sus OrderItems, y propaga
+el resultado a los Charges vinculados. Trabaja sobre un conjunto de pedidos a
+la vez: una consulta de compras, una de items, un UPDATE por clave primaria
+para los items y un UPDATE con subconsulta correlacionada para los cargos.
+"""
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func, select, update
+
+from ..db import db
+from ..models.charge import Charge
+from ..models.order_item import OrderItem
+from ..models.purchase import Purchase
+from .change_tracker import note_changes
+from .customer_balances import charge_amount
+
+
+def purchase_units_per_kg(charged_unit: str, qty_kg, qty_unit, eq_qty_kg, eq_qty_unit) -> Optional[float]:
+    """Unidades por kg observadas en una compra, o None si no hay equivalencia."""
+    if charged_unit == 'kg':
+        u = float(qty_unit or 0.0)
+        kg_eq = float(eq_qty_kg or 0.0) if eq_qty_kg is not None else 0.0
+        if u > 0 and kg_eq > 0:
+            return u / kg_eq
+    else:
+        kg = float(qty_kg or 0.0)
+        u_eq = float(eq_qty_unit or 0.0) if eq_qty_unit is not None else 0.0
+        if kg > 0 and u_eq > 0:
+            return u_eq / kg
+    return None
+
+
+def conversion_ratios(order_ids: Iterable[int]) -> Dict[int, Dict[int, dict]]:
+    """Ratios observados por pedido y producto: {order_id: {product_id: {units_per_kg, charged_unit}}}."""
+    ratios: Dict[int, Dict[int, dict]] = {}
+    rows = (
+        db.session.query(Purchase.order_id, Purchase.product_id, Purchase.charged_unit, Purchase.qty_kg,
+                         Purchase.qty_unit, Purchase.eq_qty_kg, Purchase.eq_qty_unit)
+        .filter(Purchase.order_id.in_(list(order_ids)))
+        .order_by(Purchase.id.asc())
+        .all()
+    )
+    for order_id, pid, charged_unit, qty_kg, qty_unit, eq_qty_kg, eq_qty_unit in rows:
+        charged_unit = charged_unit or 'kg'
+        units_per_kg = purchase_units_per_kg(charged_unit, qty_kg, qty_unit, eq_qty_kg, eq_qty_unit)
+        r = ratios.setdefault(order_id, {}).setdefault(pid, {})
+        # Mantener la primera equivalencia válida que encontremos
+        if units_per_kg and units_per_kg > 0 and not r.get('units_per_kg'):
+            r['units_per_kg'] = units_per_kg
+        # Registrar la unidad de cobro observada (última prevalece)
+        r['charged_unit'] = charged_unit
+    return ratios
+
+
+def converted_qty(qty, unit, charged_unit, units_per_kg) -> float:
+    """Cantidad pedida (qty en unit) expresada en charged_unit."""
+    qty_original = float(qty or 0.0)
+    unit = unit or 'kg'
+    if unit == charged_unit or not units_per_kg or units_per_kg <= 0:
+        return qty_original
+    if charged_unit == 'kg' and unit == 'unit':
+        return qty_original / units_per_kg
+    if charged_unit == 'unit' and unit == 'kg':
+        return qty_original * units_per_kg
+    return qty_original
+
+
+def _billed_by_charge(item_ids: List[int]) -> Dict[int, tuple]:
+    rows = (
+        db.session.query(Charge.id, Charge.order_id, Charge.customer_id, Charge.product_id, Charge.qty,
+                         Charge.charged_qty, Charge.unit_price, Charge.discount_amount)
+        .filter(Charge.order_item_id.in_(item_ids))
+        .all()
+    )
+    return {
+        r.id: (r.order_id, r.customer_id, r.product_id,
+               charge_amount(r.charged_qty, r.qty, r.unit_price, r.discount_amount))
+        for r in rows
+    }
+
+
+def recalc_conversions(order_ids: Iterable[int]) -> dict:
+    """
+    Recalcula charged_qty/charged_unit de los items de los pedidos y de sus
+    cargos vinculados, en la transacción actual (no hace commit).
+
+    Retorna ratios e items resultantes por pedido y, por pedido de los
+    cargos afectados, el facturado antes y después y cuántos cargos cambiaron.
+    """
+    ids = sorted({i for i in order_ids if i is not None})
+    result = {"ratios": {}, "items": {}, "orders": {}}
+    if not ids:
+        return result
+
+    db.session.flush()
+    ratios = conversion_ratios(ids)
+    items = (
+        db.session.query(OrderItem.id, OrderItem.order_id, OrderItem.customer_id, OrderItem.product_id,
+                         OrderItem.qty, OrderItem.unit, OrderItem.charged_qty, OrderItem.charged_unit)
+        .filter(OrderItem.order_id.in_(ids))
+        .order_by(OrderItem.id.asc())
+        .all()
+    )
+    item_ids = [it.id for it in items]
+    billed_before = _billed_by_charge(item_ids) if item_ids else {}
+
+    # Actualizar OrderItems: un UPDATE por clave primaria con los que cambian
+    updates = []
+    items_updated: Dict[int, int] = {}
+    for it in items:
+        charged_qty, charged_unit = it.charged_qty, it.charged_unit
+        r = ratios.get(it.order_id, {}).get(it.product_id)
+        if r:
+            charged_unit = r.get('charged_unit') or (it.charged_unit or it.unit or 'kg')
+            charged_qty = converted_qty(it.qty, it.unit, charged_unit, r.get('units_per_kg'))
+            if charged_unit != it.charged_unit or charged_qty != it.charged_qty:
+                updates.append({"id": it.id, "charged_unit": charged_unit, "charged_qty": charged_qty})
+                items_updated[it.order_id] = items_updated.get(it.order_id, 0) + 1
+        result["items"].setdefault(it.order_id, []).append({
+            'id': it.id,
+            'product_id': it.product_id,
+            'qty': it.qty,
+            'unit': it.unit,
+            'charged_qty': charged_qty,
+            'charged_unit': charged_unit,
+        })
+    if updates:
+        db.session.execute(update(OrderItem), updates)
+
+    # Actualizar Charges vinculados: charged_qty del item y total recalculado
+    if item_ids:
+        item_charged_qty = (
+            select(OrderItem.charged_qty)
+            .where(OrderItem.id == Charge.order_item_id)
+            .scalar_subquery()
+        )
+        db.session.execute(
+            update(Charge)
+            .where(Charge.order_item_id.in_(item_ids))
+            .values(
+                charged_qty=item_charged_qty,
+                total=func.coalesce(item_charged_qty, Charge.qty, 0.0) * func.coalesce(Charge.unit_price, 0.0),
+            )
+            .execution_options(synchronize_session=False)
+        )
+    # Los UPDATE masivos no refrescan los objetos ya cargados en la sesión
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, (OrderItem, Charge)):
+            db.session.expire(obj)
+    billed_after = _billed_by_charge(item_ids) if item_ids else {}
+
+    for order_id in ids:
+        result["ratios"][order_id] = ratios.get(order_id, {})
+        result["orders"][order_id] = {
+            "order_id": order_id,
+            "items_updated": items_updated.get(order_id, 0),
+            "charges_changed": 0,
+            "billed_before": 0.0,
+            "billed_after": 0.0,
+        }
+    # Los cargos se reportan en su propio pedido (puede diferir del item si fue reasignado)
+    for charge_id, (order_id, _, _, after) in billed_after.items():
+        before = billed_before.get(charge_id, (None, None, None, after))[3]
+        o = result["orders"].setdefault(order_id or 0, {
+            "order_id": order_id, "items_updated": 0, "charges_changed": 0,
+            "billed_before": 0.0, "billed_after": 0.0,
+        })
+        o["billed_before"] += before
+        o["billed_after"] += after
+        if before != after:
+            o["charges_changed"] += 1
+    for o in result["orders"].values():
+        o["billed_delta"] = o["billed_after"] - o["billed_before"]
+
+    note_changes(
+        db.session,
+        order_ids=set(ids) | {v[0] for v in billed_after.values()},
+        customer_ids={it.customer_id for it in items} | {v[1] for v in billed_after.values()},
+        product_ids={it.product_id for it in items},
+        charge_ids=billed_after.keys(),
+    )
+    return result
@@ -0,0 +1,276 @@
+"""
+Saldos corrientes por cliente (tablas customer_balances y customer_order_balances).
+
+Se mantienen dentro de la misma transacción que escribe un Charge, Payment o
+PaymentApplication, con las mismas reglas que usaba GET /accounting/customers:
+facturado = Σ max(0, cantidad × precio − descuento) sobre todos sus cargos,
+pagado = Σ pagos aplicados a esos cargos.
+
+En cada commit solo se releen los cargos de los pares (cliente, pedido)
+tocados (ChangeSet.customer_orders): la fila del par se reemplaza y la
+diferencia con su valor anterior se suma al saldo total del cliente, sin
+recorrer el resto de su historial. last_activity_at avanza con los cargos y
+pagos nuevos; no retrocede al borrarlos (customer-balances-rebuild lo
+recalcula). Los clientes nuevos parten con saldo cero y al borrar uno se
+borran sus filas.
+"""
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import func, or_
+
+from ..db import db
+from ..models.charge import Charge
+from ..models.customer import Customer
+from ..models.customer_balance import CustomerBalance, CustomerOrderBalance
+from ..models.payment import Payment, PaymentApplication
+from .change_tracker import on_before_commit
+
+
+Pair = Tuple[int, Optional[int]]
+
+
+def charge_amount(charged_qty, qty, unit_price, discount_amount) -> float:
+    """Monto facturado de un cargo usando charged_qty (incluye conversiones) si existe."""
+    qty_to_charge = charged_qty if charged_qty is not None else float(qty or 0.0)
+    return max(0.0, (qty_to_charge * float(unit_price or 0.0)) - (discount_amount or 0.0))
+
+
+def _later(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+def refresh_customer_balances(customer_ids: Iterable[int]) -> int:
+    """Recalcula desde cero saldo total y por pedido de los clientes indicados."""
+    ids = sorted({i for i in customer_ids if i is not None})
+    if not ids:
+        return 0
+    existing_customers = {cid for (cid,) in db.session.query(Customer.id).filter(Customer.id.in_(ids)).all()}
+
+    charges = (
+        db.session.query(Charge.id, Charge.customer_id, Charge.order_id, Charge.qty, Charge.charged_qty,
+                         Charge.unit_price, Charge.discount_amount, Charge.created_at)
+        .filter(Charge.customer_id.in_(ids))
+        .order_by(Charge.id.asc())
+        .all()
+    )
+    apps = (
+        db.session.query(Charge.customer_id, PaymentApplication.charge_id, PaymentApplication.amount)
+        .join(Charge, PaymentApplication.charge_id == Charge.id)
+        .filter(Charge.customer_id.in_(ids))
+        .order_by(PaymentApplication.id.asc())
+        .all()
+    )
+    last_payments = dict(
+        db.session.query(Payment.customer_id, func.max(Payment.date))
+        .filter(Payment.customer_id.in_(ids))
+        .group_by(Payment.customer_id)
+        .all()
+    )
+
+    paid_by_customer = {}
+    paid_by_charge = {}
+    for customer_id, charge_id, amount in apps:
+        paid_by_customer[customer_id] = paid_by_customer.get(customer_id, 0.0) + (amount or 0.0)
+        paid_by_charge[charge_id] = (paid_by_charge.get(charge_id) or 0.0) + (amount or 0.0)
+
+    totals = {cid: {"billed": 0.0, "last": last_payments.get(cid), "orders": {}} for cid in existing_customers}
+    for ch in charges:
+        t = totals.get(ch.customer_id)
+        if t is None:
+            continue
+        amount = charge_amount(ch.charged_qty, ch.qty, ch.unit_price, ch.discount_amount)
+        t["billed"] += amount
+        t["last"] = _later(t["last"], ch.created_at)
+        # cargos en orden de id: el primero del par fija su posición
+        o = t["orders"].setdefault(ch.order_id or 0, {"order_id": ch.order_id, "billed": 0.0, "paid": 0.0,
+                                                      "position": ch.id})
+        o["billed"] += amount
+        o["paid"] += paid_by_charge.get(ch.id, 0.0)
+
+    balances = {b.customer_id: b for b in CustomerBalance.query.filter(CustomerBalance.customer_id.in_(ids)).all()}
+    for cid in ids:
+        if cid not in existing_customers:
+            if cid in balances:
+                db.session.delete(balances[cid])
+            continue
+        t = totals[cid]
+        paid = paid_by_customer.get(cid, 0.0)
+        balance = balances.get(cid)
+        if balance is None:
+            balance = CustomerBalance(customer_id=cid)
+            db.session.add(balance)
+        balance.billed = t["billed"]
+        balance.paid = paid
+        balance.due = max(0.0, t["billed"] - paid)
+        balance.last_activity_at = t["last"]
+
+    CustomerOrderBalance.query.filter(CustomerOrderBalance.customer_id.in_(ids)).delete(synchronize_session=False)
+    db.session.add_all([
+        CustomerOrderBalance(customer_id=cid, order_id=o["order_id"], billed=o["billed"], paid=o["paid"],
+                             position=o["position"])
+        for cid, t in totals.items()
+        for o in t["orders"].values()
+    ])
+    return len(existing_customers)
+
+
+def _pairs_filter(column_customer, column_order, pairs: Set[Pair]):
+    """Condición amplia (clientes × pedidos) que cubre los pares; el filtro exacto se hace en Python."""
+    order_ids = {oid for _, oid in pairs if oid is not None}
+    orders = [column_order.in_(order_ids)] if order_ids else []
+    if any(oid is None for _, oid in pairs):
+        orders.append(column_order.is_(None))
+    return column_customer.in_({cid for cid, _ in pairs}), or_(*orders)
+
+
+def apply_customer_order_changes(pairs: Iterable[Pair]) -> int:
+    """
+    Reemplaza las filas de customer_order_balances de los pares indicados y
+    suma al saldo de cada cliente la diferencia con lo guardado. Los pares de
+    clientes que ya no existen se ignoran.
+    """
+    pairs = {(cid, oid) for cid, oid in pairs if cid is not None}
+    if not pairs:
+        return 0
+    existing = {cid for (cid,) in db.session.query(Customer.id).filter(Customer.id.in_({c for c, _ in pairs})).all()}
+    pairs = {pair for pair in pairs if pair[0] in existing}
+    if not pairs:
+        return 0
+
+    charges = (
+        db.session.query(Charge.id, Charge.customer_id, Charge.order_id, Charge.qty, Charge.charged_qty,
+                         Charge.unit_price, Charge.discount_amount, Charge.created_at)
+        .filter(*_pairs_filter(Charge.customer_id, Charge.order_id, pairs))
+        .order_by(Charge.id.asc())
+        .all()
+    )
+    paid_by_charge = dict(
+        db.session.query(PaymentApplication.charge_id, func.sum(PaymentApplication.amount))
+        .join(Charge, PaymentApplication.charge_id == Charge.id)
+        .filter(*_pairs_filter(Charge.customer_id, Charge.order_id, pairs))
+        .group_by(PaymentApplication.charge_id)
+        .all()
+    )
+    fresh = {}
+    for ch in charges:
+        pair = (ch.customer_id, ch.order_id)
+        if pair not in pairs:
+            continue
+        o = fresh.get(pair)
+        if o is None:
+            o = fresh[pair] = {"billed": 0.0, "paid": 0.0, "position": ch.id, "last": None}
+        o["billed"] += charge_amount(ch.charged_qty, ch.qty, ch.unit_price, ch.discount_amount)
+        o["paid"] += paid_by_charge.get(ch.id) or 0.0
+        o["last"] = _later(o["last"], ch.created_at)
+
+    stored = {
+        (row.customer_id, row.order_id): row
+        for row in CustomerOrderBalance.query.filter(
+            *_pairs_filter(CustomerOrderBalance.customer_id, CustomerOrderBalance.order_id, pairs)
+        ).all()
+    }
+    deltas: Dict[int, list] = {}
+    for pair in pairs:
+        row = stored.get(pair)
+        o = fresh.get(pair)
+        d = deltas.setdefault(pair[0], [0.0, 0.0, None])
+        if row is not None:
+            d[0] -= row.billed
+            d[1] -= row.paid
+        if o is None:
+            if row is not None:
+                db.session.delete(row)
+            continue
+        if row is None:
+            row = CustomerOrderBalance(customer_id=pair[0], order_id=pair[1])
+            db.session.add(row)
+        row.billed = o["billed"]
+        row.paid = o["paid"]
+        row.position = o["position"]
+        d[0] += o["billed"]
+        d[1] += o["paid"]
+        d[2] = _later(d[2], o["last"])
+
+    balances = {b.customer_id: b for b in CustomerBalance.query.filter(CustomerBalance.customer_id.in_(list(deltas))).all()}
+    for cid, (billed, paid, last) in deltas.items():
+        balance = balances.get(cid)
+        if balance is None:
+            # sin fila (anterior al primer rebuild): el cliente no tenía cargos
+            balance = CustomerBalance(customer_id=cid, billed=0.0, paid=0.0)
+            db.session.add(balance)
+        balance.billed = (balance.billed or 0.0) + billed
+        balance.paid = (balance.paid or 0.0) + paid
+        balance.due = max(0.0, balance.billed - balance.paid)
+        balance.last_activity_at = _later(balance.last_activity_at, last)
+    return len(pairs)
+
+
+def _note_payments(customer_ids: Set[int]) -> None:
+    """Avanza last_activity_at con la fecha del último pago de los clientes con pagos escritos."""
+    if not customer_ids:
+        return
+    latest = dict(
+        db.session.query(Payment.customer_id, func.max(Payment.date))
+        .filter(Payment.customer_id.in_(customer_ids))
+        .group_by(Payment.customer_id)
+        .all()
+    )
+    for balance in CustomerBalance.query.filter(CustomerBalance.customer_id.in_(latest)).all():
+        balance.last_activity_at = _later(balance.last_activity_at, latest[balance.customer_id])
+
+
+def _sync_customers(customer_ids: Set[int]) -> None:
+    """
+    Crea en cero el saldo de los clientes nuevos y borra el de los que ya no
+    existen (sin depender del ON DELETE CASCADE, que SQLite no aplica).
+    """
+    if not customer_ids:
+        return
+    existing = {cid for (cid,) in db.session.query(Customer.id).filter(Customer.id.in_(customer_ids)).all()}
+    gone = customer_ids - existing
+    if gone:
+        CustomerOrderBalance.query.filter(CustomerOrderBalance.customer_id.in_(gone)).delete(synchronize_session=False)
+        CustomerBalance.query.filter(CustomerBalance.customer_id.in_(gone)).delete(synchronize_session=False)
+    with_balance = {
+        cid for (cid,) in db.session.query(CustomerBalance.customer_id)
+        .filter(CustomerBalance.customer_id.in_(existing)).all()
+    } if existing else set()
+    db.session.add_all([
+        CustomerBalance(customer_id=cid, billed=0.0, paid=0.0, due=0.0) for cid in sorted(existing - with_balance)
+    ])
+
+
+def rebuild_customer_balances(batch_size: int = 500) -> int:
+    """Reconstruye los saldos de todos los clientes."""
+    CustomerOrderBalance.query.delete(synchronize_session=False)
+    CustomerBalance.query.delete(synchronize_session=False)
+    total = 0
+    last_id = 0
+    while True:
+        ids = [
+            cid for (cid,) in db.session.query(Customer.id)
+            .filter(Customer.id > last_id)
+            .order_by(Customer.id.asc())
+            .limit(batch_size)
+            .all()
+        ]
+        if not ids:
+            break
+        total += refresh_customer_balances(ids)
+        db.session.flush()
+        last_id = ids[-1]
+    db.session.commit()
+    return total
+
+
+@on_before_commit
+def _refresh_touched_customers(session, changes) -> None:
+    customer_ids = {i for i in changes.customer_ids if i is not None}
+    _sync_customers(customer_ids)
+    apply_customer_order_changes(changes.customer_orders)
+    if "payments" in changes.tables:
+        _note_payments(customer_ids)
@@ -0,0 +1,153 @@
+"""
+Búsqueda de clientes por nombre aproximado para los encabezados "pedido X".
+
+Como services/product_matcher, mantiene por proceso un NameIndex
+(utils/text_match) con el nombre y el apodo (nickname) de cada cliente, más
+un índice de sufijos del teléfono (solo dígitos, desde 4) para encabezados
+como "pedido 9 8765 4321". El índice se rearma cuando cambia un Customer en
+este proceso o la firma de la tabla (cantidad, id máximo, última
+actualización) por escrituras de otros workers.
+
+resolve_customers(nombres) resuelve todos los encabezados de un lote en
+memoria, con una sola consulta de firma.
+"""
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, func
+
+from ..db import db
+from ..models.customer import Customer
+from ..utils.text_match import NameIndex
+
+
+# Encabezado que es solo un teléfono: dígitos, espacios, +, -, paréntesis y puntos
+_PHONE_RE = re.compile(r"^[\d\s+\-().]+$")
+_MIN_PHONE_SUFFIX = 4
+# Puntaje de una coincidencia por sufijo de teléfono compartida por varios clientes
+_SHARED_PHONE_SCORE = 90
+
+_lock = threading.Lock()
+_index: Optional["CustomerIndex"] = None
+_signature = None
+
+
+def _digits(text: Optional[str]) -> str:
+    return re.sub(r"\D", "", text or "")
+
+
+class CustomerIndex:
+    """Nombres, apodos y sufijos de teléfono de los clientes (key = customer id)."""
+
+    def __init__(self, rows: Iterable[Tuple[int, str, Optional[str], Optional[str]]]):
+        self.names: Dict[int, str] = {}
+        entries = []
+        nicknames = []
+        self._phones: Dict[str, List[int]] = {}
+        for customer_id, name, nickname, phone in rows:
+            self.names[customer_id] = name
+            entries.append(((customer_id, "name"), name))
+            if nickname and nickname.strip():
+                nicknames.append(((customer_id, "nickname"), nickname))
+            digits = _digits(phone)
+            for size in range(_MIN_PHONE_SUFFIX, len(digits) + 1):
+                self._phones.setdefault(digits[-size:], []).append(customer_id)
+        # los nombres van después: en exact() gana el nombre sobre un apodo igual
+        self.text = NameIndex(nicknames + entries)
+
+    def by_phone(self, query: str) -> List[int]:
+        """Clientes cuyo teléfono termina en los dígitos de query (si query es un teléfono)."""
+        if not _PHONE_RE.match(query or ""):
+            return []
+        digits = _digits(query)
+        if len(digits) < _MIN_PHONE_SUFFIX:
+            return []
+        return self._phones.get(digits, [])
+
+    def resolve(self, query: str, min_score: int = 70, limit: int = 5) -> dict:
+        """
+        {match_status, customer_id?, suggestions?} de un encabezado: exact si
+        el nombre o apodo normalizado coincide o si el teléfono es de un solo
+        cliente; similar con sugerencias [{id, name, score, matched}]; none.
+        """
+        query = (query or "").strip()
+        if not query:
+            return {"match_status": "none"}
+        phone_ids = self.by_phone(query)
+        if len(phone_ids) == 1:
+            return {"match_status": "exact", "customer_id": phone_ids[0], "matched": "phone"}
+        exact = self.text.exact(query)
+        if exact is not None:
+            return {"match_status": "exact", "customer_id": exact[0], "matched": exact[1]}
+
+        suggestions = {}
+        for customer_id in phone_ids:
+            suggestions[customer_id] = (_SHARED_PHONE_SCORE, "phone")
+        # varias entradas por cliente (nombre y apodo): queda la de mejor puntaje
+        for score, (customer_id, field), _ in self.text.search(query, min_score=min_score, limit=None):
+            if customer_id not in suggestions or score > suggestions[customer_id][0]:
+                suggestions[customer_id] = (score, field)
+        ranked = sorted(suggestions.items(), key=lambda kv: -kv[1][0])[:limit]
+        if not ranked:
+            return {"match_status": "none"}
+        return {
+            "match_status": "similar",
+            "suggestions": [
+                {"id": cid, "name": self.names[cid], "score": score, "matched": field}
+                for cid, (score, field) in ranked
+            ],
+        }
+
+
+def _table_signature():
+    return tuple(
+        db.session.query(func.count(Customer.id), func.max(Customer.id), func.max(Customer.updated_at)).one()
+    )
+
+
+def _forget_customers(mapper, connection, target) -> None:
+    global _index
+    _index = None
+
+
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(Customer, _event_name, _forget_customers)
+
+
+def customer_index() -> CustomerIndex:
+    """Índice de clientes, reconstruido si cambió la tabla."""
+    global _index, _signature
+    signature = _table_signature()
+    with _lock:
+        index = _index
+        if index is None or signature != _signature:
+            rows = (
+                db.session.query(Customer.id, Customer.name, Customer.nickname, Customer.phone)
+                .order_by(Customer.id.asc())
+                .all()
+            )
+            index = CustomerIndex(rows)
+            _index, _signature = index, signature
+        return index
+
+
+def resolve_customers(names: Iterable[str], min_score: int = 70, limit: int = 5) -> Dict[str, dict]:
+    """Resolución (ver CustomerIndex.resolve) de cada nombre distinto, con un solo índice."""
+    index = customer_index()
+    result = {}
+    for name in names:
+        key = (name or "").strip()
+        if key and key not in result:
+            result[key] = index.resolve(key, min_score=min_score, limit=limit)
+    return result
+
+
+def annotate_customer(item: dict, resolution: Optional[dict]) -> dict:
+    """Agrega customer_id (si el cliente quedó resuelto) y customer_match al item parseado."""
+    if not resolution:
+        return item
+    item = {**item, "customer_match": resolution}
+    if resolution.get("customer_id") is not None:
+        item["customer_id"] = resolution["customer_id"]
+    return item
@@ -0,0 +1,94 @@
+"""
+Confirmación del borrador de pedido (POST /orders/draft/confirm).
+
+El borrador pasa a "emitido" con un UPDATE condicionado a status = 'draft':
+si dos requests confirman el mismo borrador a la vez, solo uno lo actualiza
+y genera cargos; el otro ve 0 filas y no hace nada más.
+
+Los cargos pendientes se generan en bloque: los items se leen en una
+consulta, los precios salen de un PriceBook (dos consultas) y todos los
+Charge se insertan con un solo INSERT masivo.
+"""
+from typing import Optional
+
+from ..db import db
+from ..models.charge import Charge
+from ..models.order import Order
+from ..models.order_item import OrderItem
+from ..utils.server_timing import ServerTiming
+from .change_tracker import note_changes
+from .price_book import load_price_book
+
+
+def _charge_rows(order_id: int, timing: ServerTiming) -> list:
+    with timing.measure("items"):
+        items = (
+            db.session.query(OrderItem.id, OrderItem.customer_id, OrderItem.product_id, OrderItem.qty,
+                             OrderItem.unit, OrderItem.charged_unit, OrderItem.charged_qty,
+                             OrderItem.variant_id, OrderItem.sale_unit_price)
+            .filter(OrderItem.order_id == order_id)
+            .order_by(OrderItem.id.asc())
+            .all()
+        )
+    with timing.measure("prices"):
+        book = load_price_book(it.product_id for it in items)
+    rows = []
+    for it in items:
+        qty = float(it.qty or 0)
+        unit = it.charged_unit or it.unit or "kg"
+        # Resolver precio: si viene fijado, usarlo; si no, tramo de la variante en charged_unit o catálogo
+        unit_price = book.unit_price(it.product_id, unit, qty, it.variant_id, it.sale_unit_price)
+        charged_qty = float(it.charged_qty) if it.charged_qty is not None else None
+        # Cantidad a cobrar: charged_qty si existe (si ya se compró), si no qty como placeholder
+        q_charge = charged_qty if charged_qty is not None else qty
+        rows.append({
+            "customer_id": it.customer_id,
+            "order_id": order_id,
+            "original_order_id": order_id,  # pedido original
+            "order_item_id": it.id,
+            "product_id": it.product_id,
+            "qty": qty,  # cantidad pedida original
+            "charged_qty": charged_qty,
+            "unit": unit,
+            "unit_price": unit_price or 0.0,
+            "discount_amount": 0.0,
+            "discount_reason": None,
+            "status": "pending",
+            "total": q_charge * float(unit_price or 0),
+        })
+    return rows
+
+
+def confirm_draft(order: Order, timing: Optional[ServerTiming] = None) -> bool:
+    """
+    Emite el borrador y genera sus cargos si aún no tiene (no hace commit).
+
+    Retorna False si el pedido ya no estaba en borrador (otro request lo
+    confirmó primero); en ese caso no escribe nada.
+    """
+    timing = timing or ServerTiming()
+    with timing.measure("claim"):
+        claimed = (
+            Order.query.filter(Order.id == order.id, Order.status == "draft")
+            .update({Order.status: "emitido"}, synchronize_session="evaluate")
+        )
+    if not claimed:
+        return False
+    note_changes(db.session, order_ids=[order.id], tables=["orders"])
+
+    existing = db.session.query(Charge.id).filter(Charge.order_id == order.id).first()
+    if existing:
+        return True
+    rows = _charge_rows(order.id, timing)
+    if rows:
+        with timing.measure("insert"):
+            db.session.execute(db.insert(Charge), rows)
+        note_changes(
+            db.session,
+            order_ids=[order.id],
+            customer_ids={r["customer_id"] for r in rows},
+            customer_orders={(r["customer_id"], order.id) for r in rows},
+            product_ids={r["product_id"] for r in rows},
+            tables=["charges"],
+        )
+    return True
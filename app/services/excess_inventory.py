@@ -0,0 +1,86 @@
+"""
+Inventario de excedentes (tabla excess_inventory).
+
+Guarda por (pedido, producto) lo comprado vs lo pedido en la unidad de cobro,
+calculado con services/purchase_coverage, y por producto lo comprado sin
+pedido. Se refresca dentro de la transacción cuando cambian compras o items
+de un pedido, o compras sin pedido de un producto, así GET /accounting/excess
+lee filas en vez de recalcular el historial.
+"""
+from typing import Iterable, List, Optional
+
+from ..db import db
+from ..models.excess_inventory import ExcessInventory
+from ..models.order import Order
+from .change_tracker import on_before_commit
+from .purchase_coverage import load_coverage
+
+
+def _rows_for(coverage, order_id) -> List[ExcessInventory]:
+    return [
+        ExcessInventory(
+            order_id=order_id,
+            product_id=e["product_id"],
+            unit=e["unit"],
+            needed=e["needed_qty"],
+            purchased=e["purchased_qty"],
+            excess=e["excess_qty"],
+            first_purchase_id=e["first_purchase_id"],
+        )
+        for e in coverage.excesses(order_id, only_excess=False)
+    ]
+
+
+def refresh_excess_inventory(order_ids: Iterable[int], orphan_product_ids: Optional[Iterable[int]] = None) -> int:
+    """Recalcula las filas de los pedidos y de las compras sin pedido de los productos indicados."""
+    ids = sorted({i for i in order_ids if i is not None})
+    orphan_pids = sorted({p for p in (orphan_product_ids or ()) if p is not None})
+    if not ids and not orphan_pids:
+        return 0
+    if ids:
+        ExcessInventory.query.filter(ExcessInventory.order_id.in_(ids)).delete(synchronize_session=False)
+        # Pedidos borrados: solo se eliminan sus filas
+        ids = [oid for (oid,) in db.session.query(Order.id).filter(Order.id.in_(ids)).all()]
+    coverage = load_coverage(ids, include_orphans=bool(orphan_pids), orphan_product_ids=orphan_pids)
+
+    if orphan_pids:
+        ExcessInventory.query.filter(
+            ExcessInventory.order_id.is_(None),
+            ExcessInventory.product_id.in_(orphan_pids),
+        ).delete(synchronize_session=False)
+
+    rows = [row for oid in ids for row in _rows_for(coverage, oid)]
+    if orphan_pids:
+        rows.extend(_rows_for(coverage, None))
+    db.session.add_all(rows)
+    return len(rows)
+
+
+def rebuild_excess_inventory(batch_size: int = 500) -> int:
+    """Reconstruye la tabla completa."""
+    ExcessInventory.query.delete(synchronize_session=False)
+    total = 0
+    last_id = 0
+    while True:
+        ids = [
+            oid for (oid,) in db.session.query(Order.id)
+            .filter(Order.id > last_id)
+            .order_by(Order.id.asc())
+            .limit(batch_size)
+            .all()
+        ]
+        if not ids:
+            break
+        total += refresh_excess_inventory(ids)
+        db.session.flush()
+        last_id = ids[-1]
+    coverage = load_coverage([], include_orphans=True)
+    rows = _rows_for(coverage, None)
+    db.session.add_all(rows)
+    db.session.commit()
+    return total + len(rows)
+
+
+@on_before_commit
+def _refresh_touched_excess(session, changes) -> None:
+    refresh_excess_inventory(changes.order_ids, changes.orphan_product_ids)
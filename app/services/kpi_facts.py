@@ -0,0 +1,405 @@
+"""
+Hechos diarios de KPIs (tablas kpi_daily, kpi_customer_daily, kpi_product_daily).
+
+Cada fila agrega los pedidos creados en un día: pedidos, facturado y costo
+del día, facturado y pedidos por cliente, y cantidad/ingresos/costo por
+producto, con los mismos criterios que usaba /admin/kpis al recorrer cargos
+y compras. Los reportes por período suman días en vez de recorrer filas.
+
+Refresco incremental: en cada commit que cambia el ledger de un pedido se
+anota su día (anterior y nuevo) en kpi_dirty_days. `flask kpis-refresh`
+recalcula solo esos días y borra las anotaciones que procesó; su mayor id
+queda como marca de agua en kpi_refresh_state. La primera corrida (o
+--full) reconstruye todos los días.
+
+Lectura (kpi_totals): los días ya refrescados salen de las tablas; hoy (y
+lo posterior) y los días con anotaciones pendientes se calculan en vivo con
+las mismas consultas agrupadas. Sin ninguna corrida previa todo es en vivo.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, false, func, or_
+
+from ..db import db
+from ..models.charge import Charge
+from ..models.kpi_daily import KpiCustomerDaily, KpiDaily, KpiDirtyDay, KpiProductDaily, KpiRefreshState
+from ..models.order import Order
+from ..models.product import Product
+from ..models.purchase import Purchase
+from .change_tracker import on_before_commit
+
+
+# Días por consulta al refrescar
+_DAYS_PER_QUERY = 31
+
+# (charged_qty o qty) * unit_price, con 0 como "sin valor" igual que en Python
+CHARGE_AMOUNT = (
+    func.coalesce(func.nullif(Charge.charged_qty, 0), func.nullif(Charge.qty, 0), 0)
+    * func.coalesce(Charge.unit_price, 0)
+)
+
+# price_total, o price_per_unit por la cantidad en la unidad de cobro (kg por defecto)
+PURCHASE_COST = case(
+    (func.coalesce(Purchase.price_total, 0) != 0, Purchase.price_total),
+    (
+        func.coalesce(func.nullif(Purchase.charged_unit, ""), "kg") == "kg",
+        func.coalesce(Purchase.price_per_unit, 0) * func.coalesce(Purchase.qty_kg, 0),
+    ),
+    else_=func.coalesce(Purchase.price_per_unit, 0) * func.coalesce(Purchase.qty_unit, 0),
+)
+
+_ORDER_DAY = func.date(Order.created_at)
+
+
+def _as_date(value) -> Optional[date]:
+    # func.date() devuelve texto en SQLite y date en PostgreSQL
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _day_bounds(day: date) -> Tuple[datetime, datetime]:
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+def _on_days(days: Iterable[date]):
+    """Condición sobre Order.created_at para los días indicados (usa el índice por rango)."""
+    conds = []
+    for day in sorted(days):
+        start, end = _day_bounds(day)
+        conds.append(and_(Order.created_at >= start, Order.created_at < end))
+    return or_(*conds) if conds else false()
+
+
+def in_date_range(query, date_from: Optional[date], date_to: Optional[date]):
+    """Filtra por fecha de creación del pedido, ambos extremos inclusive."""
+    if date_from:
+        query = query.filter(_ORDER_DAY >= date_from)
+    if date_to:
+        query = query.filter(_ORDER_DAY <= date_to)
+    return query
+
+
+class DayFacts:
+    """Hechos agrupados por día: días, (día, cliente) y (día, producto)."""
+
+    def __init__(self):
+        self.days: Dict[date, dict] = defaultdict(lambda: {"num_orders": 0, "billed": 0.0, "cost": 0.0})
+        self.customers: Dict[tuple, dict] = {}
+        self.products: Dict[tuple, dict] = defaultdict(
+            lambda: {"num_charges": 0, "qty": 0.0, "revenue": 0.0, "cost": 0.0}
+        )
+
+
+def _sold_query(*columns):
+    """Cargos vendidos (criterio de productos-top): cantidad de cargos, cantidad e ingresos."""
+    return (
+        db.session.query(
+            *columns, func.count(Charge.id),
+            func.sum(Charge.charged_qty), func.sum(Charge.charged_qty * Charge.unit_price),
+        )
+        .select_from(Charge)
+        .join(Order, Charge.order_id == Order.id)
+        .filter(
+            Charge.status != 'cancelled',
+            Charge.product_id.isnot(None),
+            Charge.charged_qty.isnot(None),
+            Charge.unit_price.isnot(None),
+        )
+    )
+
+
+def _bought_query(*columns):
+    """Compras de pedidos: costo con el CASE de PURCHASE_COST y suma de price_total."""
+    return (
+        db.session.query(*columns, func.sum(PURCHASE_COST), func.sum(Purchase.price_total))
+        .select_from(Purchase)
+        .join(Order, Purchase.order_id == Order.id)
+    )
+
+
+def compute_day_facts(condition, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                      products: bool = True) -> DayFacts:
+    """
+    Calcula en vivo los hechos de los pedidos que cumplen condition (cuatro
+    consultas; tres sin products, que omite los hechos por producto).
+    """
+    facts = DayFacts()
+
+    def scoped(query):
+        return in_date_range(query.filter(condition), date_from, date_to)
+
+    for day, count in scoped(db.session.query(_ORDER_DAY, func.count(Order.id))).group_by(_ORDER_DAY).all():
+        if day is not None:
+            facts.days[_as_date(day)]["num_orders"] = count
+
+    charges = scoped(
+        db.session.query(
+            _ORDER_DAY, Charge.customer_id, func.sum(CHARGE_AMOUNT), func.count(func.distinct(Charge.order_id)),
+            func.min(Charge.id),
+        )
+        .join(Order, Charge.order_id == Order.id)
+        .filter(Charge.status != 'cancelled')
+    ).group_by(_ORDER_DAY, Charge.customer_id)
+    for day, customer_id, billed, num_orders, first_charge_id in charges.all():
+        day = _as_date(day)
+        if day is None:
+            continue
+        facts.days[day]["billed"] += float(billed or 0)
+        if customer_id is not None:
+            facts.customers[(day, customer_id)] = {
+                "billed": float(billed or 0), "num_orders": num_orders, "first_charge_id": first_charge_id,
+            }
+
+    sold = scoped(_sold_query(_ORDER_DAY, Charge.product_id)).group_by(_ORDER_DAY, Charge.product_id)
+    bought = scoped(_bought_query(_ORDER_DAY, Purchase.product_id)).group_by(_ORDER_DAY, Purchase.product_id)
+    for day, product_id, cost, price_total in bought.all():
+        day = _as_date(day)
+        if day is None:
+            continue
+        facts.days[day]["cost"] += float(cost or 0)
+        if products:
+            # productos-top suma solo price_total
+            facts.products[(day, product_id)]["cost"] = float(price_total or 0)
+    if not products:
+        return facts
+    for day, product_id, num_charges, qty, revenue in sold.all():
+        day = _as_date(day)
+        if day is None:
+            continue
+        row = facts.products[(day, product_id)]
+        row.update(num_charges=num_charges, qty=float(qty or 0), revenue=float(revenue or 0))
+    return facts
+
+
+def refresh_kpi_days(days: Iterable[date]) -> int:
+    """Recalcula (reemplaza) las filas de hechos de los días indicados."""
+    days = sorted({d for d in days if d is not None})
+    for i in range(0, len(days), _DAYS_PER_QUERY):
+        chunk = days[i:i + _DAYS_PER_QUERY]
+        facts = compute_day_facts(_on_days(chunk))
+        for model in (KpiDaily, KpiCustomerDaily, KpiProductDaily):
+            db.session.execute(db.delete(model).where(model.day.in_(chunk)))
+        now = datetime.utcnow()
+        if facts.days:
+            db.session.execute(db.insert(KpiDaily), [
+                {"day": day, "updated_at": now, **vals} for day, vals in facts.days.items()
+            ])
+        if facts.customers:
+            db.session.execute(db.insert(KpiCustomerDaily), [
+                {"day": day, "customer_id": customer_id, **vals} for (day, customer_id), vals in facts.customers.items()
+            ])
+        if facts.products:
+            db.session.execute(db.insert(KpiProductDaily), [
+                {"day": day, "product_id": product_id, **vals} for (day, product_id), vals in facts.products.items()
+            ])
+    return len(days)
+
+
+def refresh_kpi_facts(full: bool = False) -> dict:
+    """
+    Refresca los días anotados desde la última corrida (o todos, con full o
+    si nunca se corrió) y hace commit. Retorna {days, full, watermark}.
+    """
+    state = db.session.get(KpiRefreshState, 1)
+    if state is None:
+        state = KpiRefreshState(id=1, watermark=0)
+        db.session.add(state)
+        full = True
+    # se borran exactamente las anotaciones leídas: las de commits concurrentes quedan para la próxima corrida
+    journal = db.session.query(KpiDirtyDay.id, KpiDirtyDay.day).all()
+    if full:
+        for model in (KpiDaily, KpiCustomerDaily, KpiProductDaily):
+            db.session.execute(db.delete(model))
+        days = {_as_date(d) for (d,) in db.session.query(_ORDER_DAY).filter(Order.created_at.isnot(None)).distinct()}
+    else:
+        days = {day for _, day in journal}
+    total = refresh_kpi_days(days)
+    ids = [journal_id for journal_id, _ in journal]
+    for i in range(0, len(ids), 500):
+        db.session.execute(db.delete(KpiDirtyDay).where(KpiDirtyDay.id.in_(ids[i:i + 500])))
+    now = datetime.utcnow()
+    state.watermark = max(ids + [state.watermark or 0])
+    state.refreshed_at = now
+    if full:
+        state.full_refreshed_at = now
+    db.session.commit()
+    return {"days": total, "full": full, "watermark": state.watermark}
+
+
+def pending_days() -> set:
+    """Días anotados y todavía no refrescados."""
+    return {_as_date(d) for (d,) in db.session.query(KpiDirtyDay.day).distinct()}
+
+
+class KpiTotals:
+    """Sumas de un período: pedidos, facturado, costo y desglose por cliente."""
+
+    def __init__(self):
+        self.num_orders = 0
+        self.billed = 0.0
+        self.cost = 0.0
+        # customer_id -> {billed, num_orders, first_charge_id}
+        self.customers: Dict[int, dict] = defaultdict(
+            lambda: {"billed": 0.0, "num_orders": 0, "first_charge_id": None}
+        )
+
+    def add_day(self, num_orders: int, billed: float, cost: float) -> None:
+        self.num_orders += num_orders or 0
+        self.billed += billed or 0.0
+        self.cost += cost or 0.0
+
+    def add_customer(self, customer_id: int, billed: float, num_orders: int,
+                     first_charge_id: Optional[int] = None) -> None:
+        row = self.customers[customer_id]
+        row["billed"] += billed or 0.0
+        row["num_orders"] += num_orders or 0
+        if first_charge_id is not None and (row["first_charge_id"] is None or first_charge_id < row["first_charge_id"]):
+            row["first_charge_id"] = first_charge_id
+
+
+def _add_stored(totals: KpiTotals, day_filter) -> None:
+    for num_orders, billed, cost in db.session.query(
+        func.sum(KpiDaily.num_orders), func.sum(KpiDaily.billed), func.sum(KpiDaily.cost),
+    ).filter(*day_filter(KpiDaily)).all():
+        totals.add_day(num_orders, billed, cost)
+    customers = (
+        db.session.query(KpiCustomerDaily.customer_id, func.sum(KpiCustomerDaily.billed),
+                         func.sum(KpiCustomerDaily.num_orders), func.min(KpiCustomerDaily.first_charge_id))
+        .filter(*day_filter(KpiCustomerDaily))
+        .group_by(KpiCustomerDaily.customer_id)
+    )
+    for customer_id, billed, num_orders, first_charge_id in customers.all():
+        totals.add_customer(customer_id, billed, num_orders, first_charge_id)
+
+
+def _sources(date_from: Optional[date], date_to: Optional[date]):
+    """
+    (day_filter, live): day_filter(model) da las condiciones sobre model.day
+    de los días que se leen de las tablas (None si nunca se refrescó) y live
+    la condición sobre Order de los que se calculan en vivo.
+    """
+    state = db.session.get(KpiRefreshState, 1)
+    if state is None:
+        return None, Order.created_at.isnot(None)
+    today = datetime.utcnow().date()
+    pending = {d for d in pending_days()
+               if d < today and (not date_from or d >= date_from) and (not date_to or d <= date_to)}
+
+    def day_filter(model):
+        conds = [model.day < today]
+        if date_from:
+            conds.append(model.day >= date_from)
+        if date_to:
+            conds.append(model.day <= date_to)
+        if pending:
+            conds.append(model.day.notin_(pending))
+        return conds
+
+    return day_filter, or_(Order.created_at >= _day_bounds(today)[0], _on_days(pending))
+
+
+def kpi_totals(date_from: Optional[date] = None, date_to: Optional[date] = None) -> KpiTotals:
+    """Totales de los pedidos creados en el rango (ambos extremos inclusive)."""
+    totals = KpiTotals()
+    day_filter, live = _sources(date_from, date_to)
+    if day_filter is not None:
+        _add_stored(totals, day_filter)
+    facts = compute_day_facts(live, date_from, date_to, products=False)
+    for vals in facts.days.values():
+        totals.add_day(vals["num_orders"], vals["billed"], vals["cost"])
+    for (_, customer_id), vals in facts.customers.items():
+        totals.add_customer(customer_id, vals["billed"], vals["num_orders"], vals["first_charge_id"])
+    return totals
+
+
+class ProductTotal:
+    """Ventas y costo de un producto en un período, con su nombre y categoría."""
+
+    __slots__ = ("product_id", "name", "category", "num_charges", "qty", "revenue", "cost")
+
+    def __init__(self, product_id: int, name: str, category: Optional[str]):
+        self.product_id = product_id
+        self.name = name
+        self.category = category
+        self.num_charges = 0
+        self.qty = 0.0
+        self.revenue = 0.0
+        self.cost = 0.0
+
+    @property
+    def profit(self) -> float:
+        return self.revenue - self.cost
+
+    @property
+    def margin(self) -> Optional[float]:
+        """Utilidad sobre ingresos, en porcentaje (None sin ingresos)."""
+        return self.profit / self.revenue * 100 if self.revenue > 0 else None
+
+
+def product_totals(date_from: Optional[date] = None, date_to: Optional[date] = None,
+                   category: Optional[str] = None) -> List[ProductTotal]:
+    """
+    Productos existentes con cargos vendidos en el rango, en orden de id. El
+    nombre y la categoría vienen en las mismas consultas agregadas (JOIN con
+    products) y category filtra en SQL (sin distinguir mayúsculas).
+    """
+    by_id: Dict[int, ProductTotal] = {}
+    meta = (Product.id, Product.name, Product.category)
+
+    def scoped(query):
+        if category:
+            query = query.filter(func.lower(Product.category) == category.strip().lower())
+        return query.group_by(*meta)
+
+    def entry(product_id, name, product_category) -> ProductTotal:
+        total = by_id.get(product_id)
+        if total is None:
+            total = by_id[product_id] = ProductTotal(product_id, name, product_category)
+        return total
+
+    day_filter, live = _sources(date_from, date_to)
+    if day_filter is not None:
+        stored = scoped(
+            db.session.query(*meta, func.sum(KpiProductDaily.num_charges), func.sum(KpiProductDaily.qty),
+                             func.sum(KpiProductDaily.revenue), func.sum(KpiProductDaily.cost))
+            .join(Product, Product.id == KpiProductDaily.product_id)
+            .filter(*day_filter(KpiProductDaily))
+        )
+        for product_id, name, product_category, num_charges, qty, revenue, cost in stored.all():
+            total = entry(product_id, name, product_category)
+            total.num_charges += num_charges or 0
+            total.qty += float(qty or 0)
+            total.revenue += float(revenue or 0)
+            total.cost += float(cost or 0)
+
+    sold = scoped(in_date_range(
+        _sold_query(*meta).join(Product, Product.id == Charge.product_id).filter(live), date_from, date_to,
+    ))
+    for product_id, name, product_category, num_charges, qty, revenue in sold.all():
+        total = entry(product_id, name, product_category)
+        total.num_charges += num_charges or 0
+        total.qty += float(qty or 0)
+        total.revenue += float(revenue or 0)
+    bought = scoped(in_date_range(
+        _bought_query(*meta).join(Product, Product.id == Purchase.product_id).filter(live), date_from, date_to,
+    ))
+    for product_id, name, product_category, _, price_total in bought.all():
+        # productos-top suma solo price_total
+        entry(product_id, name, product_category).cost += float(price_total or 0)
+    return [by_id[pid] for pid in sorted(by_id) if by_id[pid].num_charges]
+
+
+@on_before_commit
+def _note_touched_days(session, changes) -> None:
+    # después de services/order_ledger, que completa changes.order_days
+    if changes.order_days:
+        now = datetime.utcnow()
+        session.execute(db.insert(KpiDirtyDay), [{"day": day, "created_at": now} for day in sorted(changes.order_days)])
@@ -0,0 +1,71 @@
+"""
+Ticket promedio, costos y desglose por cliente de /admin/kpis/overview.
+
+Se arma con los totales del período de services/kpi_facts (hechos diarios
+ya refrescados más el cálculo en vivo de hoy y de los días pendientes): la
+memoria y el tiempo no dependen de cuántos cargos o compras tenga el
+periodo, solo de cuántos clientes aparecen en el desglose.
+"""
+from datetime import date
+from typing import Optional
+
+from ..db import db
+from ..models.customer import Customer
+from .kpi_facts import KpiTotals, kpi_totals
+
+
+def _empty() -> dict:
+    return {
+        'total': 0,
+        'utilidad': 0,
+        'costos': 0,
+        'num_pedidos': 0,
+        'num_clientes': 0,
+        'promedio_por_pedido': 0,
+        'promedio_por_cliente': 0,
+        'margen_utilidad_porcentaje': 0,
+        'desglose_clientes': []
+    }
+
+
+def ticket_overview(date_from: Optional[date] = None, date_to: Optional[date] = None,
+                    totals: Optional[KpiTotals] = None) -> dict:
+    """Bloque ticket_promedio del overview para los pedidos creados en el rango."""
+    totals = totals or kpi_totals(date_from, date_to)
+    num_orders = totals.num_orders
+    if not num_orders:
+        return _empty()
+
+    customer_ids = [cid for cid in totals.customers if cid]
+    names = dict(
+        db.session.query(Customer.id, Customer.name).filter(Customer.id.in_(customer_ids)).all()
+    ) if customer_ids else {}
+    customer_breakdown = []
+    # a igual total, en el orden de su primer cargo
+    for customer_id in sorted(customer_ids, key=lambda cid: (totals.customers[cid]['first_charge_id'] or 0, cid)):
+        data = totals.customers[customer_id]
+        total, count = data['billed'], data['num_orders']
+        customer_breakdown.append({
+            'customer_id': customer_id,
+            'customer_name': names[customer_id] if customer_id in names else f'Cliente {customer_id}',
+            'total': round(total, 2),
+            'num_pedidos': count,
+            'promedio_por_pedido': round(total / count, 2) if count > 0 else 0
+        })
+    customer_breakdown.sort(key=lambda x: x['total'], reverse=True)
+
+    total_billed = totals.billed
+    total_costs = totals.cost
+    utilidad = total_billed - total_costs
+    num_clientes = len(customer_breakdown)
+    return {
+        'total': round(total_billed, 2),
+        'utilidad': round(utilidad, 2),
+        'costos': round(total_costs, 2),
+        'num_pedidos': num_orders,
+        'num_clientes': num_clientes,
+        'promedio_por_pedido': round(total_billed / num_orders, 2),
+        'promedio_por_cliente': round(total_billed / num_clientes, 2) if num_clientes > 0 else 0,
+        'margen_utilidad_porcentaje': round((utilidad / total_billed * 100), 2) if total_billed > 0 else 0,
+        'desglose_clientes': customer_breakdown
+    }
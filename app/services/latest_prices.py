@@ -0,0 +1,121 @@
+"""
+Último precio de venta (catálogo) y último costo (compras) por producto.
+
+Cada uno se obtiene para todos los productos pedidos con una sola consulta:
+ROW_NUMBER() OVER (PARTITION BY product_id ORDER BY ...) y la fila 1 de
+cada partición. Orden: CatalogPrice por fecha y, el mismo día, el registrado
+último (id); Purchase con price_per_unit y created_at por created_at y
+luego id. Las compras sin created_at no cuentan: PostgreSQL ordena los NULL
+primero en DESC y SQLite al final, y así ambos eligen la misma compra.
+
+SQLite soporta funciones de ventana desde 3.25; con una versión anterior se
+usa el camino equivalente de MAX() agrupado + join (ver _window_supported).
+"""
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from sqlalchemy import and_, func
+
+from ..db import db
+from ..models.catalog_price import CatalogPrice
+from ..models.purchase import Purchase
+
+
+class LatestCatalogPrice(NamedTuple):
+    sale_price: float
+    unit: Optional[str]
+    date: object  # datetime.date
+
+
+class LatestCost(NamedTuple):
+    price_per_unit: float
+    charged_unit: Optional[str]
+
+
+def _window_supported() -> bool:
+    if db.engine.dialect.name != "sqlite":
+        return True
+    import sqlite3
+    return sqlite3.sqlite_version_info >= (3, 25, 0)
+
+
+def _ids(product_ids: Optional[Iterable[int]]):
+    if product_ids is None:
+        return None
+    return {int(pid) for pid in product_ids if pid is not None}
+
+
+def _latest_rows(model, columns, order_by, ids, *conditions):
+    """Fila más reciente por producto según order_by (columna de orden + id), con ventana."""
+    rank = func.row_number().over(partition_by=model.product_id, order_by=order_by).label("rank")
+    query = db.session.query(model.product_id.label("product_id"), *columns, rank).filter(*conditions)
+    if ids is not None:
+        query = query.filter(model.product_id.in_(ids))
+    ranked = query.subquery()
+    return db.session.query(*ranked.c).filter(ranked.c.rank == 1).all()
+
+
+def latest_catalog_prices(product_ids: Optional[Iterable[int]] = None) -> Dict[int, LatestCatalogPrice]:
+    """Último CatalogPrice de cada producto (todos si product_ids es None)."""
+    ids = _ids(product_ids)
+    if ids is not None and not ids:
+        return {}
+    if _window_supported():
+        rows = _latest_rows(
+            CatalogPrice,
+            (CatalogPrice.sale_price, CatalogPrice.unit, CatalogPrice.date),
+            (CatalogPrice.date.desc(), CatalogPrice.id.desc()),
+            ids,
+        )
+        return {r.product_id: LatestCatalogPrice(r.sale_price, r.unit, r.date) for r in rows}
+
+    latest = db.session.query(CatalogPrice.product_id, func.max(CatalogPrice.date).label("date"))
+    if ids is not None:
+        latest = latest.filter(CatalogPrice.product_id.in_(ids))
+    latest = latest.group_by(CatalogPrice.product_id).subquery()
+    rows = (
+        db.session.query(CatalogPrice.product_id, CatalogPrice.sale_price, CatalogPrice.unit, CatalogPrice.date)
+        .join(latest, and_(CatalogPrice.product_id == latest.c.product_id, CatalogPrice.date == latest.c.date))
+        .order_by(CatalogPrice.id.asc())
+        .all()
+    )
+    # mismo día: queda el registrado último
+    return {r.product_id: LatestCatalogPrice(r.sale_price, r.unit, r.date) for r in rows}
+
+
+def latest_costs(product_ids: Optional[Iterable[int]] = None) -> Dict[int, LatestCost]:
+    """Costo (price_per_unit y unidad) de la última compra con costo de cada producto."""
+    ids = _ids(product_ids)
+    if ids is not None and not ids:
+        return {}
+    if _window_supported():
+        rows = _latest_rows(
+            Purchase,
+            (Purchase.price_per_unit, Purchase.charged_unit),
+            (Purchase.created_at.desc(), Purchase.id.desc()),
+            ids,
+            Purchase.price_per_unit.isnot(None),
+            Purchase.created_at.isnot(None),
+        )
+        return {r.product_id: LatestCost(r.price_per_unit, r.charged_unit) for r in rows}
+
+    latest = (
+        db.session.query(Purchase.product_id, func.max(Purchase.created_at).label("created_at"))
+        .filter(Purchase.price_per_unit.isnot(None))
+    )
+    if ids is not None:
+        latest = latest.filter(Purchase.product_id.in_(ids))
+    latest = latest.group_by(Purchase.product_id).subquery()
+    rows = (
+        db.session.query(Purchase.product_id, Purchase.price_per_unit, Purchase.charged_unit)
+        .join(latest, and_(Purchase.product_id == latest.c.product_id, Purchase.created_at == latest.c.created_at))
+        .filter(Purchase.price_per_unit.isnot(None))
+        .order_by(Purchase.id.asc())
+        .all()
+    )
+    return {r.product_id: LatestCost(r.price_per_unit, r.charged_unit) for r in rows}
+
+
+def latest_sale_price(product_id: int) -> Optional[float]:
+    """Último precio de catálogo de un producto (None si no tiene)."""
+    latest = latest_catalog_prices([product_id]).get(int(product_id))
+    return latest.sale_price if latest else None
@@ -0,0 +1,237 @@
+"""
+Alta de items de pedido en lote (POST /orders, /orders/draft/items y
+/orders/<id>/items).
+
+Resuelve los clientes y productos del payload con una consulta cada uno,
+crea en lote los que faltan (productos con su precio de catálogo y variante
+kivi) y agrega todos los OrderItems en un solo flush, que SQLAlchemy envía
+como un INSERT de varias filas en PostgreSQL (SQLite inserta fila a fila
+para devolver los ids en orden). Los precios de los cargos de un pedido
+emitido salen de un solo PriceBook (services/price_book). El número de
+consultas no depende de la cantidad de líneas.
+"""
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import or_
+
+from ..db import db
+from ..models.catalog_price import CatalogPrice
+from ..models.charge import Charge
+from ..models.customer import Customer
+from ..models.order import Order
+from ..models.order_item import OrderItem
+from ..models.product import Product
+from ..models.variant import ProductVariant, VariantPriceTier
+from .price_book import load_price_book
+
+
+def _as_int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _sale_price(it: dict) -> Optional[float]:
+    try:
+        return float(it.get("sale_price")) if it.get("sale_price") is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _load_customers(items: List[dict], vendor_id: Optional[int]) -> List[Optional[Customer]]:
+    """
+    Cliente de cada línea: por customer_id (ej. resuelto por /orders/parse) o
+    por nombre exacto; los nombres que no existen se crean (sin flush) con
+    vendor_id. None si la línea no trae cliente.
+    """
+    ids = {_as_int(it.get("customer_id")) for it in items if it.get("customer_id")} - {None}
+    by_id = {c.id: c for c in Customer.query.filter(Customer.id.in_(ids)).all()} if ids else {}
+    line_customers: List[Optional[Customer]] = [by_id.get(_as_int(it.get("customer_id"))) for it in items]
+    names = []
+    for it, customer in zip(items, line_customers):
+        name = (it.get("customer") or "").strip()
+        if customer is None and name and name not in names:
+            names.append(name)
+    if names:
+        by_name = {c.name: c for c in Customer.query.filter(Customer.name.in_(names)).all()}
+        for name in names:
+            if name not in by_name:
+                by_name[name] = Customer(name=name, vendor_id=vendor_id)
+                db.session.add(by_name[name])
+        line_customers = [
+            customer or by_name.get((it.get("customer") or "").strip())
+            for it, customer in zip(items, line_customers)
+        ]
+    return line_customers
+
+
+def _load_products(items: List[dict]) -> Tuple[Dict[int, Product], Dict[str, Product]]:
+    """
+    Productos pedidos por id y por nombre, indexados por nombre en minúsculas.
+    Los nombres se buscan con ilike sobre el texto recibido (no con lower()
+    en la base: SQLite solo pasa a minúsculas ASCII y "PIÑA" no se
+    encontraría).
+    """
+    ids = {_as_int(it.get("product_id")) for it in items if it.get("product_id")} - {None}
+    names = sorted({(it.get("product") or "").strip() for it in items} - {""})
+    by_id = {p.id: p for p in Product.query.filter(Product.id.in_(ids)).all()} if ids else {}
+    by_name: Dict[str, Product] = {}
+    if names:
+        keys = {name.lower() for name in names}
+        matches = Product.query.filter(or_(*[Product.name.ilike(name) for name in names]))
+        for p in matches.order_by(Product.id.asc()).all():
+            if p.name.lower() in keys:
+                by_name.setdefault(p.name.lower(), p)
+    return by_id, by_name
+
+
+def _create_products(pending: Dict[str, tuple]) -> None:
+    """Precio de catálogo y variante kivi (con su tramo de precio) de los productos nuevos ya insertados."""
+    variants = []
+    for product, sale_price, unit in pending.values():
+        db.session.add(CatalogPrice(product_id=product.id, date=date.today(), sale_price=sale_price, unit=unit))
+        variants.append((ProductVariant(product_id=product.id, label='kivi', active=True), product, sale_price, unit))
+    db.session.add_all([v for v, _, _, _ in variants])
+    db.session.flush()
+    db.session.add_all([
+        VariantPriceTier(product_id=product.id, variant_id=variant.id, min_qty=1.0, unit=unit, sale_price=sale_price)
+        for variant, product, sale_price, unit in variants
+    ])
+
+
+def add_order_items(order: Order, items: List[dict], user=None,
+                    charged_units: bool = True) -> Tuple[List[Tuple[dict, OrderItem, Product]], List[dict]]:
+    """
+    Agrega las líneas de items al pedido (no hace commit).
+
+    Cada línea indica customer_id o customer (nombre), product_id o product (nombre),
+    qty, unit y opcionalmente variant_id, sale_unit_price, notes y, con
+    create_if_missing, sale_price/default_unit para crear el producto. Los
+    clientes nuevos quedan asignados al vendedor del pedido (o al usuario si
+    es vendedor). Con charged_units se completa charged_unit/charged_qty
+    desde la unidad del producto.
+
+    Retorna ([(línea, OrderItem, Product)], skipped) con skipped como
+    [{index, reason, product?}] en el orden de las líneas.
+    """
+    vendor_id = order.vendor_id if order.vendor_id else (user.id if user and user.role == 'vendor' else None)
+    by_id, by_name = _load_products(items)
+    line_customers = _load_customers(items, vendor_id)
+
+    pending: Dict[str, tuple] = {}  # nombre en minúsculas -> (Product nuevo, sale_price, unidad)
+    rows = []
+    skipped = []
+    for idx, it in enumerate(items):
+        line_idx = it.get("line_index", idx)
+        customer = line_customers[idx]
+        if customer is None:
+            skipped.append({"index": line_idx, "reason": "missing_customer"})
+            continue
+
+        product_id = it.get("product_id")
+        product_name = (it.get("product") or "").strip()
+        key = product_name.lower()
+        create_if_missing = bool(it.get("create_if_missing"))
+        if product_id:
+            product = by_id.get(_as_int(product_id))
+        else:
+            product = by_name.get(key) or (pending[key][0] if key in pending else None)
+        if not product and not create_if_missing:
+            skipped.append({"index": line_idx, "reason": "unresolved_product", "product": product_name})
+            continue
+        if not product and create_if_missing and product_name:
+            # Requiere precio de venta inicial cuando se crea desde pedidos
+            sale_price = _sale_price(it)
+            if sale_price is None or sale_price <= 0:
+                skipped.append({"index": line_idx, "reason": "missing_sale_price", "product": product_name})
+                continue
+            product = by_name.get(key)
+            if product is None:
+                if key not in pending:
+                    default_unit = (it.get("default_unit") or it.get("unit") or "kg")
+                    new_product = Product(name=product_name, default_unit=default_unit)
+                    pending[key] = (new_product, sale_price, default_unit)
+                product = pending[key][0]
+        if not product:
+            skipped.append({"index": line_idx, "reason": "empty_product_name"})
+            continue
+        rows.append((it, customer, product))
+
+    if pending:
+        db.session.add_all([p for p, _, _ in pending.values()])
+    if pending or any(c is not None and c.id is None for c in line_customers):
+        db.session.flush()
+    if pending:
+        _create_products(pending)
+
+    added = []
+    for it, customer, product in rows:
+        variant_id = it.get("variant_id")
+        sale_unit_price = it.get("sale_unit_price")
+        unit = (it.get("unit") or "kg")
+        fields = {}
+        if charged_units:
+            # charged_unit por defecto desde el producto reconocido/creado
+            charged_unit = (it.get("charged_unit") or getattr(product, 'default_unit', None) or it.get("unit") or "kg")
+            charged_qty = None
+            try:
+                if charged_unit and unit != charged_unit:
+                    # si viene desde frontend, úsalo; de lo contrario, deja None
+                    charged_qty = float(it.get("charged_qty")) if it.get("charged_qty") is not None else None
+            except Exception:
+                charged_qty = None
+            fields = {"charged_unit": charged_unit, "charged_qty": charged_qty}
+        added.append((it, OrderItem(
+            order_id=order.id,
+            customer_id=customer.id,
+            product_id=product.id,
+            qty=float(it.get("qty") or 0),
+            unit=unit,
+            notes=it.get("notes"),
+            variant_id=(int(variant_id) if variant_id else None),
+            sale_unit_price=(float(sale_unit_price) if sale_unit_price is not None else None),
+            **fields,
+        ), product))
+    if added:
+        db.session.add_all([order_item for _, order_item, _ in added])
+        db.session.flush()
+    return added, skipped
+
+
+def add_item_charges(order: Order, added: List[Tuple[dict, OrderItem, Product]]) -> None:
+    """
+    Cargos pendientes de los items recién agregados a un pedido emitido.
+
+    El precio es sale_unit_price si viene fijado; si no, el tramo de la
+    variante en la unidad de cobro con el mayor min_qty <= qty y, en último
+    caso, el último precio de catálogo del producto (services/price_book).
+    """
+    if not added:
+        return
+    book = load_price_book(product.id for _, _, product in added)
+    charges = []
+    for it, order_item, product in added:
+        qty = float(it.get("qty") or 0)
+        charged_unit = order_item.charged_unit
+        unit_price = book.unit_price(product.id, charged_unit, qty, order_item.variant_id, order_item.sale_unit_price)
+
+        charged_qty = order_item.charged_qty
+        q_charge = float(charged_qty) if (charged_qty is not None) else qty
+        charges.append(Charge(
+            customer_id=order_item.customer_id,
+            order_id=order.id,
+            original_order_id=order.id,
+            order_item_id=order_item.id,
+            product_id=product.id,
+            qty=qty,
+            charged_qty=charged_qty,
+            unit=charged_unit,
+            unit_price=unit_price or 0.0,
+            discount_amount=0.0,
+            discount_reason=None,
+            status="pending",
+            total=q_charge * float(unit_price or 0),
+        ))
+    db.session.add_all(charges)
@@ -0,0 +1,224 @@
+"""
+Libro contable materializado por pedido (tabla order_ledger).
+
+Cada fila guarda facturado, costo, pagado, utilidad, comisión del vendedor y
+estado de compra de un pedido, calculados con el motor de contabilidad. Las
+filas se refrescan dentro de la misma transacción cuando se escribe un
+Charge, Purchase, PaymentApplication u OrderItem del pedido (ver
+services/change_tracker). Los comandos `flask ledger-rebuild` y
+`flask ledger-verify` reconstruyen y verifican la tabla completa.
+
+También guarda el facturado por cliente y las etiquetas de compra, de modo
+que GET /accounting/orders (sin include_details) se sirve solo desde el
+ledger con ledger_summary().
+"""
+import json
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from ..db import db
+from ..models.order import Order
+from ..models.order_ledger import OrderLedger
+from ..models.user import User
+from .accounting_engine import AccountingContext, order_totals, summary_row
+from .change_tracker import on_before_commit
+
+
+# Tolerancia para comparar montos al verificar
+_EPSILON = 0.005
+
+_AMOUNT_FIELDS = ("billed", "cost", "paid", "profit", "vendor_commission", "kivi_amount")
+
+
+def compute_ledger_values(orders: List[Order]) -> Dict[int, dict]:
+    """Valores del ledger para una lista de pedidos, calculados en vivo."""
+    ctx = AccountingContext([o.id for o in orders]).load(orders)
+    values = {}
+    for order in orders:
+        totals = order_totals(order, ctx)
+        vendor = totals["vendor"]
+        values[order.id] = {
+            "vendor_id": order.vendor_id,
+            "order_status": order.status,
+            "order_created_at": order.created_at,
+            "billed": totals["billed"],
+            "cost": totals["cost"],
+            "paid": totals["paid"],
+            "profit": totals["profit_amount"],
+            "commission_rate": vendor.commission_rate if vendor else None,
+            "vendor_commission": totals["vendor_commission_amount"],
+            "kivi_amount": totals["kivi_amount"],
+            "purchase_status": totals["purchase_status"],
+            "billed_by_customer": json.dumps(totals["billed_by_customer"]),
+            "bought_tags": json.dumps(totals["bought_tags"]),
+            "missing_tags": json.dumps(totals["missing_tags"]),
+        }
+    return values
+
+
+def ledger_totals(row: OrderLedger, vendor: Optional[User]) -> dict:
+    """Totales de un pedido leídos del ledger, con las claves de order_totals que usa summary_row."""
+    stored = row.to_dict()
+    return {
+        "billed": row.billed,
+        "billed_by_customer": stored["billed_by_customer"],
+        "cost": row.cost,
+        "paid": row.paid,
+        "purchase_status": row.purchase_status,
+        "bought_tags": stored["bought_tags"],
+        "missing_tags": stored["missing_tags"],
+        "profit_amount": row.profit,
+        "vendor": vendor,
+        "vendor_commission_amount": row.vendor_commission,
+        "vendor_commission_pct": row.commission_rate * 100 if row.commission_rate is not None else 0.0,
+        "kivi_amount": row.kivi_amount,
+    }
+
+
+def ledger_summary(rows: List[Tuple[Order, OrderLedger]]) -> List[dict]:
+    """Filas de GET /accounting/orders (sin detalle) para pares (pedido, ledger), con una consulta de vendedores."""
+    vendor_ids = {order.vendor_id for order, _ in rows if order.vendor_id}
+    vendors = {u.id: u for u in User.query.filter(User.id.in_(vendor_ids)).all()} if vendor_ids else {}
+    result = []
+    for order, ledger in rows:
+        row = summary_row(order, ledger_totals(ledger, vendors.get(order.vendor_id)))
+        if row is not None:
+            result.append(row)
+    return result
+
+
+def _vendor_day(vendor_id, created_at):
+    if vendor_id is None or created_at is None:
+        return None
+    return (vendor_id, created_at.date())
+
+
+def _day(created_at):
+    return created_at.date() if created_at is not None else None
+
+
+def refresh_order_ledger(order_ids: Iterable[int], vendor_days: Optional[Set[tuple]] = None,
+                         order_days: Optional[Set] = None) -> int:
+    """
+    Recalcula (upsert) las filas del ledger de los pedidos indicados.
+
+    Si se entrega vendor_days, se agregan los (vendor_id, día) anteriores y
+    nuevos de cada fila, para refrescar las comisiones diarias; order_days
+    recibe los días anteriores y nuevos de creación del pedido (KPIs diarios).
+    """
+    ids = sorted({i for i in order_ids if i is not None})
+    if not ids:
+        return 0
+    orders = Order.query.filter(Order.id.in_(ids)).all()
+    values = compute_ledger_values(orders)
+    existing = {row.order_id: row for row in OrderLedger.query.filter(OrderLedger.order_id.in_(ids)).all()}
+    for order_id, vals in values.items():
+        row = existing.pop(order_id, None)
+        if vendor_days is not None:
+            vendor_days.add(_vendor_day(vals["vendor_id"], vals["order_created_at"]))
+            if row is not None:
+                vendor_days.add(_vendor_day(row.vendor_id, row.order_created_at))
+        if order_days is not None:
+            order_days.add(_day(vals["order_created_at"]))
+            if row is not None:
+                order_days.add(_day(row.order_created_at))
+        if row is None:
+            db.session.add(OrderLedger(order_id=order_id, **vals))
+        else:
+            for key, value in vals.items():
+                setattr(row, key, value)
+    # Pedidos que ya no existen
+    for row in existing.values():
+        if vendor_days is not None:
+            vendor_days.add(_vendor_day(row.vendor_id, row.order_created_at))
+        if order_days is not None:
+            order_days.add(_day(row.order_created_at))
+        db.session.delete(row)
+    if vendor_days is not None:
+        vendor_days.discard(None)
+    if order_days is not None:
+        order_days.discard(None)
+    return len(values)
+
+
+def apply_vendor_rates(vendor_ids: Iterable[int], vendor_days: Optional[Set[tuple]] = None) -> int:
+    """
+    Recalcula comisión y monto Kivi de las filas del ledger de vendedores
+    cuyo commission_rate cambió (la utilidad no cambia: un UPDATE por
+    vendedor). vendor_days recibe todos sus días, para las comisiones diarias.
+    """
+    ids = {i for i in vendor_ids if i is not None}
+    if not ids:
+        return 0
+    total = 0
+    for vendor_id, rate in db.session.query(User.id, User.commission_rate).filter(User.id.in_(ids)).all():
+        commission = OrderLedger.profit * rate
+        total += (
+            OrderLedger.query.filter(OrderLedger.vendor_id == vendor_id)
+            .update({
+                OrderLedger.commission_rate: rate,
+                OrderLedger.vendor_commission: commission,
+                OrderLedger.kivi_amount: OrderLedger.profit - commission,
+            }, synchronize_session=False)
+        )
+        if vendor_days is not None:
+            vendor_days.update(
+                _vendor_day(vendor_id, created_at) for (created_at,) in
+                db.session.query(OrderLedger.order_created_at)
+                .filter(OrderLedger.vendor_id == vendor_id, OrderLedger.order_created_at.isnot(None))
+                .all()
+            )
+    return total
+
+
+def _order_id_batches(batch_size: int):
+    last_id = 0
+    while True:
+        ids = [
+            oid for (oid,) in db.session.query(Order.id)
+            .filter(Order.id > last_id)
+            .order_by(Order.id.asc())
+            .limit(batch_size)
+            .all()
+        ]
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def rebuild_order_ledger(batch_size: int = 500) -> int:
+    """Reconstruye el ledger completo desde los datos crudos."""
+    OrderLedger.query.delete(synchronize_session=False)
+    total = 0
+    for ids in _order_id_batches(batch_size):
+        total += refresh_order_ledger(ids)
+        db.session.flush()
+    db.session.commit()
+    return total
+
+
+def verify_order_ledger(batch_size: int = 500) -> List[dict]:
+    """Compara el ledger con el recálculo en vivo y retorna las diferencias."""
+    mismatches = []
+    for ids in _order_id_batches(batch_size):
+        orders = Order.query.filter(Order.id.in_(ids)).all()
+        live = compute_ledger_values(orders)
+        stored = {row.order_id: row for row in OrderLedger.query.filter(OrderLedger.order_id.in_(ids)).all()}
+        for order_id, vals in live.items():
+            row = stored.get(order_id)
+            if row is None:
+                mismatches.append({"order_id": order_id, "field": "missing", "ledger": None, "live": None})
+                continue
+            for field in _AMOUNT_FIELDS:
+                if abs((getattr(row, field) or 0.0) - (vals[field] or 0.0)) > _EPSILON:
+                    mismatches.append({"order_id": order_id, "field": field, "ledger": getattr(row, field), "live": vals[field]})
+            for field in ("purchase_status", "order_status", "vendor_id", "bought_tags", "missing_tags"):
+                if getattr(row, field) != vals[field]:
+                    mismatches.append({"order_id": order_id, "field": field, "ledger": getattr(row, field), "live": vals[field]})
+    return mismatches
+
+
+@on_before_commit
+def _refresh_touched_orders(session, changes) -> None:
+    refresh_order_ledger(changes.order_ids, vendor_days=changes.vendor_days, order_days=changes.order_days)
+    apply_vendor_rates(changes.vendor_ids, vendor_days=changes.vendor_days)
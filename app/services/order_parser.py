@@ -1,5 +1,5 @@
 import re
-from typing import List, Dict, Optional
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Union
 
 UNIT_SYNONYMS = {
     "k": "kg",
@@ -18,19 +18,42 @@ UNIT_SYNONYMS = {
 ZERO_WIDTH = "\u200B\u200C\u200D\u2060\uFEFF"
 BULLETS = "\u2022\u2023\u25E6\u2043\u2219•-*"
 
+# Patrones compilados una sola vez al importar
+_ZERO_WIDTH_TABLE = {ord(ch): None for ch in ZERO_WIDTH}
+_LEADING_BULLETS_RE = re.compile(rf"^[{re.escape(BULLETS)}\s]+")
+_PAREN_NOTES_RE = re.compile(r"\(([^)]*)\)")
+_HEADER_RE = re.compile(r"^pedido\s+(.+)$", re.IGNORECASE)
+
+_QTY = r"[0-9]+(?:[\.,][0-9]+)?"
+_UNIT = r"(?:k|kg|kilo|kilos|u|uni|unidad|unidades|unit|gr|g)\.?"
+
+# Clasificación de una línea de producto en un solo match; las alternativas
+# se prueban en orden, igual que los patrones sueltos de antes:
+# 1) cantidad (+ unidad) al inicio, opcional 'de'    ej. "2k de palta", "3 limones"
+# 2) cantidad + unidad al final, opcional 'de'       ej. "palta 2 kg"
+# 3) producto + cantidad sin unidad => 'unit'         ej. "lechuga 2"
+# 4) solo cantidad al inicio => 'unit'
+# Si ninguna calza, la línea completa es el producto con cantidad 1 unit.
+_ITEM_RE = re.compile(
+    rf"^(?:(?P<q1>{_QTY})\s*(?P<u1>{_UNIT})?\b\s*(?:de\s+)?(?P<p1>.+)"
+    rf"|(?P<p2>.+?)\s+(?:de\s+)?(?P<q2>{_QTY})\s*(?P<u2>{_UNIT})\b\s*"
+    rf"|(?P<p3>.+?)\s+(?P<q3>{_QTY})\s*"
+    rf"|(?P<q4>{_QTY})\s+(?P<p4>.+)"
+    rf")$",
+    re.IGNORECASE,
+)
+
 
 def _clean_line(text: str) -> str:
     if not text:
         return ""
-    for ch in ZERO_WIDTH:
-        text = text.replace(ch, "")
-    text = text.strip()
-    text = re.sub(rf"^[{re.escape(BULLETS)}\s]+", "", text)
+    text = text.translate(_ZERO_WIDTH_TABLE).strip()
+    text = _LEADING_BULLETS_RE.sub("", text)
     return text.strip()
 
 
 def _extract_paren_notes(text: str) -> (str, str):
-    m = re.search(r"\(([^)]*)\)", text)
+    m = _PAREN_NOTES_RE.search(text)
     if not m:
         return text.strip(), ""
     note = m.group(1).strip()
@@ -53,62 +76,45 @@ def _to_float(s: str) -> float:
 
 
 def _parse_line(line: str) -> Dict:
-    original = line
-    line = _clean_line(line)
+    """Parsea una línea ya limpia (ver _clean_line)."""
     if not line:
         return {}
 
     without_paren, paren_notes = _extract_paren_notes(line)
+    item = {"product": without_paren, "qty": 1.0, "unit": "unit", "notes": paren_notes, "_raw": line}
 
-    unit_group = r"(?P<u>(?:k|kg|kilo|kilos|u|uni|unidad|unidades|unit|gr|g)\.? )?"
-    unit_group_end = r"(?P<uend>(?:k|kg|kilo|kilos|u|uni|unidad|unidades|unit|gr|g)\.? )?"
-
-    # 1) Cantidad + unidad al inicio (incluye "2k"/"2 uni."/opcional 'de')
-    m = re.match(rf"^(?P<qty>[0-9]+(?:[\.,][0-9]+)?)\s*(?P<u1>(?:k|kg|kilo|kilos|u|uni|unidad|unidades|unit|gr|g)\.?)?\b\s*(?:de\s+)?(?P<rest>.+)$", without_paren, re.IGNORECASE)
-    if m:
-        qty = _to_float(m.group("qty"))
-        unit = _norm_unit(m.group("u1") or "unit")
-        product = m.group("rest").strip()
-        return {"product": product, "qty": qty, "unit": unit, "notes": paren_notes, "_raw": original}
-
-    # 2) Cantidad + unidad al final (opcional 'de')
-    m = re.match(rf"^(?P<p>.+?)\s+(?:de\s+)?(?P<qty>[0-9]+(?:[\.,][0-9]+)?)\s*(?P<u3>(?:k|kg|kilo|kilos|u|uni|unidad|unidades|unit|gr|g)\.?)\b\s*$", without_paren, re.IGNORECASE)
-    if m:
-        product = m.group("p").strip()
-        qty = _to_float(m.group("qty"))
-        unit = _norm_unit(m.group("u3"))
-        return {"product": product, "qty": qty, "unit": unit, "notes": paren_notes, "_raw": original}
-
-    # 2b) Producto + cantidad (sin unidad) => unidad por defecto 'unit'
-    m = re.match(r"^(?P<p>.+?)\s+(?P<qty>[0-9]+(?:[\.,][0-9]+)?)\s*$", without_paren)
-    if m:
-        product = m.group("p").strip()
-        qty = _to_float(m.group("qty"))
-        return {"product": product, "qty": qty, "unit": "unit", "notes": paren_notes, "_raw": original}
-
-    # 3) Solo cantidad al inicio -> unidad por defecto unit
-    m = re.match(r"^(?P<qty>[0-9]+(?:[\.,][0-9]+)?)\s+(?P<rest>.+)$", without_paren)
+    m = _ITEM_RE.match(without_paren)
     if m:
-        qty = _to_float(m.group("qty"))
-        product = m.group("rest").strip()
-        return {"product": product, "qty": qty, "unit": "unit", "notes": paren_notes, "_raw": original}
-
-    # 4) Palabras clave
-    if re.search(r"\b(paquete|bandeja)\b", without_paren, re.IGNORECASE):
-        return {"product": without_paren, "qty": 1.0, "unit": "unit", "notes": paren_notes, "_raw": original}
-
-    return {"product": without_paren, "qty": 1.0, "unit": "unit", "notes": paren_notes, "_raw": original}
-
-
-def parse_orders_text(text: str) -> List[Dict]:
-    items: List[Dict] = []
+        if m.group("q1") is not None:
+            qty, unit, product = m.group("q1"), _norm_unit(m.group("u1") or "unit"), m.group("p1")
+        elif m.group("q2") is not None:
+            qty, unit, product = m.group("q2"), _norm_unit(m.group("u2")), m.group("p2")
+        elif m.group("q3") is not None:
+            qty, unit, product = m.group("q3"), "unit", m.group("p3")
+        else:
+            qty, unit, product = m.group("q4"), "unit", m.group("p4")
+        item.update(product=product.strip(), qty=_to_float(qty), unit=unit)
+    return item
+
+
+def iter_parse_orders(lines: Union[str, Iterable[str], IO[str]]) -> Iterator[Dict]:
+    """
+    Parsea un pedido línea a línea y entrega cada item a medida que se lee.
+
+    Acepta el texto completo, un iterable de líneas o un archivo abierto en
+    modo texto (ej. una exportación de WhatsApp), sin cargarlo entero en
+    memoria. Las líneas "pedido <cliente>" cambian el cliente de los items
+    siguientes; line_index es la posición de la línea en la entrada.
+    """
+    if isinstance(lines, str):
+        lines = lines.splitlines()
     current_customer: Optional[str] = None
 
-    for idx, raw_line in enumerate(text.splitlines()):
+    for idx, raw_line in enumerate(lines):
         line = _clean_line(raw_line)
         if not line:
             continue
-        mb = re.match(r"^pedido\s+(.+)$", line, re.IGNORECASE)
+        mb = _HEADER_RE.match(line)
         if mb:
             current_customer = mb.group(1).strip()
             continue
@@ -118,6 +124,8 @@ def parse_orders_text(text: str) -> List[Dict]:
             continue
         parsed["customer"] = current_customer or (parsed.get("customer") or "")
         parsed["line_index"] = idx
-        items.append(parsed)
+        yield parsed
+
 
-    return items
+def parse_orders_text(text: str) -> List[Dict]:
+    return list(iter_parse_orders(text or ""))
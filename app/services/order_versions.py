@@ -0,0 +1,45 @@
+"""
+Versión por pedido para respuestas condicionales (ETag) del detalle.
+
+En cada commit que toca un pedido (escrituras de Order, OrderItem, Purchase,
+Charge o pagos aplicados, según services/change_tracker) se incrementa su
+fila en order_versions dentro de la misma transacción. El detalle del pedido
+expone la versión en su ETag; la caché de respuestas (services/response_cache)
+descarta la entrada del pedido con el mismo conjunto de cambios, así que un
+ETag guardado en la caché siempre corresponde a la versión vigente.
+"""
+from typing import Iterable, Optional
+
+from ..db import db
+from ..models.order import Order
+from ..models.order_version import OrderVersion
+from .change_tracker import on_before_commit
+
+
+def bump_order_versions(order_ids: Iterable[int]) -> None:
+    """Incrementa (o crea en 1) la versión de los pedidos que siguen existiendo."""
+    ids = {i for i in order_ids if i is not None}
+    if not ids:
+        return
+    live = {oid for (oid,) in db.session.query(Order.id).filter(Order.id.in_(ids)).all()}
+    existing = {row.order_id: row for row in OrderVersion.query.filter(OrderVersion.order_id.in_(live)).all()} if live else {}
+    for order_id in sorted(live):
+        row = existing.get(order_id)
+        if row is None:
+            db.session.add(OrderVersion(order_id=order_id, version=1))
+        else:
+            # version = version + 1 en SQL: no se pierden incrementos concurrentes
+            row.version = OrderVersion.version + 1
+
+
+def order_version(order_id: int) -> int:
+    """Versión actual del pedido (0 si nunca se escribió desde que existe la tabla)."""
+    version: Optional[int] = (
+        db.session.query(OrderVersion.version).filter(OrderVersion.order_id == order_id).scalar()
+    )
+    return version or 0
+
+
+@on_before_commit
+def _bump_touched_orders(session, changes) -> None:
+    bump_order_versions(changes.order_ids | changes.new_order_ids)
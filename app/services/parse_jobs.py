@@ -0,0 +1,220 @@
+"""
+Parseo de pedidos en segundo plano (POST/GET /orders/parse-jobs).
+
+Una exportación completa de WhatsApp puede tener decenas de miles de líneas;
+parsearla y buscar cada producto dentro del request ocupa un worker de
+gunicorn hasta el timeout. submit_parse_job() registra un ParseJob y lo
+procesa en un ThreadPoolExecutor del proceso (PARSE_JOB_WORKERS hilos): los
+items se anotan como en /orders/parse (producto y cliente) y se guardan en
+ParseJobItem por lotes, actualizando el progreso del job en el mismo commit.
+Así cualquier worker puede informar progreso y resultados parciales mientras
+el job corre.
+
+Cada job guarda el proceso que lo tiene (worker, host:pid) y ese proceso
+avanza su updated_at como latido mientras el job espera en la cola o corre
+(un hilo cada PARSE_JOB_STALE_SECONDS / 4). Si el proceso se reinició, el
+latido se detiene: pasados PARSE_JOB_STALE_SECONDS el job se marca failed al
+consultarlo (fail_if_stale) y el cliente puede volver a enviarlo.
+"""
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Set
+
+from flask import current_app
+
+from ..db import db
+from ..models.parse_job import ParseJob, ParseJobItem
+from ..utils.pagination import encode_cursor
+from .customer_matcher import annotate_customer, customer_index
+from .order_parser import iter_parse_orders
+from .product_matcher import annotate_parsed_item, product_index
+
+
+# Items por lote guardado (un INSERT + un UPDATE del job por lote)
+_BATCH_SIZE = 200
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+# Jobs en cola o corriendo en el pool de este proceso
+_active_jobs: Set[int] = set()
+
+
+def _worker_id() -> str:
+    # se calcula al usarlo: con preload, gunicorn importa la app antes de crear los workers
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _get_executor(app) -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, int(app.config.get("PARSE_JOB_WORKERS") or 1)),
+                thread_name_prefix="parse-job",
+            )
+            stale_seconds = int(app.config.get("PARSE_JOB_STALE_SECONDS") or 0)
+            if stale_seconds:
+                threading.Thread(
+                    target=_heartbeat_loop, args=(app, max(1.0, stale_seconds / 4)),
+                    name="parse-job-heartbeat", daemon=True,
+                ).start()
+        return _executor
+
+
+def _heartbeat_loop(app, interval: float) -> None:
+    """Avanza updated_at de los jobs que este proceso tiene en cola o corriendo."""
+    while True:
+        time.sleep(interval)
+        with _executor_lock:
+            job_ids = sorted(_active_jobs)
+        if not job_ids:
+            continue
+        with app.app_context():
+            try:
+                ParseJob.query.filter(
+                    ParseJob.id.in_(job_ids), ParseJob.status.in_(("queued", "running")),
+                ).update({ParseJob.updated_at: datetime.utcnow()}, synchronize_session=False)
+                db.session.commit()
+            except Exception:
+                app.logger.exception("no se pudo registrar el latido de los parse jobs")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+
+def submit_parse_job(text: str, user=None) -> ParseJob:
+    """Crea el job (commit incluido) y lo encola en el pool de hilos."""
+    job = ParseJob(status="queued", user_id=(user.id if user else None), total_lines=len(text.splitlines()),
+                   worker=_worker_id())
+    db.session.add(job)
+    db.session.commit()
+    app = current_app._get_current_object()
+    executor = _get_executor(app)
+    with _executor_lock:
+        _active_jobs.add(job.id)
+    executor.submit(_run_job, app, job.id, text)
+    return job
+
+
+def _save_batch(job: ParseJob, batch: List[dict], processed_lines: int) -> None:
+    if batch:
+        db.session.execute(db.insert(ParseJobItem), batch)
+        job.items_count += len(batch)
+    job.processed_lines = processed_lines
+    db.session.commit()
+    batch.clear()
+
+
+def _run_job(app, job_id: int, text: str) -> None:
+    with app.app_context():
+        try:
+            job = db.session.get(ParseJob, job_id)
+            if job is None or job.status != "queued":
+                # ya marcado failed por fail_if_stale mientras esperaba en la cola
+                return
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            db.session.commit()
+
+            customers = customer_index()
+            products = product_index()
+            resolved: Dict[str, dict] = {}
+            batch: List[dict] = []
+            position = 0
+            for item in iter_parse_orders(text):
+                header = item["customer"].strip()
+                if header and header not in resolved:
+                    resolved[header] = customers.resolve(header)
+                item = annotate_customer(annotate_parsed_item(item, products), resolved.get(header))
+                batch.append({
+                    "job_id": job_id,
+                    "position": position,
+                    "data": json.dumps(item, ensure_ascii=False),
+                })
+                position += 1
+                if len(batch) >= _BATCH_SIZE:
+                    _save_batch(job, batch, item["line_index"] + 1)
+            _save_batch(job, batch, job.total_lines)
+            # solo si sigue corriendo: no pisar un failed puesto mientras tanto
+            ParseJob.query.filter(ParseJob.id == job_id, ParseJob.status == "running").update(
+                {ParseJob.status: "done", ParseJob.finished_at: datetime.utcnow()}, synchronize_session=False,
+            )
+            db.session.commit()
+        except Exception as e:
+            current_app.logger.exception("parse job %s falló", job_id)
+            db.session.rollback()
+            job = db.session.get(ParseJob, job_id)
+            if job is not None:
+                job.status = "failed"
+                job.error = str(e)
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+        finally:
+            db.session.remove()
+            with _executor_lock:
+                _active_jobs.discard(job_id)
+
+
+def fail_if_stale(job: ParseJob) -> ParseJob:
+    """
+    Marca failed un job sin terminar cuyo latido (updated_at) no avanza hace
+    PARSE_JOB_STALE_SECONDS, es decir, que ningún proceso vivo tiene en su
+    pool (commit incluido).
+    """
+    stale_seconds = int(current_app.config.get("PARSE_JOB_STALE_SECONDS") or 0)
+    last_update = job.updated_at or job.created_at
+    if job.finished or not stale_seconds or last_update is None:
+        return job
+    if job.worker == _worker_id() and job.id in _active_jobs:
+        return job
+    now = datetime.utcnow()
+    if now - last_update < timedelta(seconds=stale_seconds):
+        return job
+    job.status = "failed"
+    job.error = "interrumpido: el proceso que lo ejecutaba se reinició"
+    job.finished_at = now
+    db.session.commit()
+    return job
+
+
+def job_items(job_id: int, after: int = -1, limit: Optional[int] = None) -> List[ParseJobItem]:
+    """Items ya guardados del job con position > after, en orden."""
+    query = (
+        ParseJobItem.query.filter(ParseJobItem.job_id == job_id, ParseJobItem.position > after)
+        .order_by(ParseJobItem.position.asc())
+    )
+    if limit:
+        query = query.limit(limit)
+    return query.all()
+
+
+def follow_job(job_id: int, after: int = -1, poll_interval: float = 0.5,
+               timeout: Optional[float] = None) -> Iterator[dict]:
+    """
+    Items del job a medida que se guardan, hasta que termine o pasen timeout
+    segundos (PARSE_JOB_STREAM_SECONDS): el stream es corto para no retener
+    un worker de gunicorn. La última fila es {"job": estado del job,
+    "next_cursor": ...}; si el job sigue corriendo, el cliente vuelve a
+    pedir desde ese cursor.
+    """
+    if timeout is None:
+        timeout = float(current_app.config.get("PARSE_JOB_STREAM_SECONDS") or 0)
+    deadline = time.monotonic() + timeout
+    while True:
+        # estado leído antes que los items: si ya terminó, los items están completos
+        db.session.expire_all()
+        job = fail_if_stale(db.session.get(ParseJob, job_id))
+        for row in job_items(job_id, after):
+            after = row.position
+            yield row.to_dict()
+        if job.finished or time.monotonic() >= deadline:
+            yield {"job": job.to_dict(), "next_cursor": encode_cursor(after)}
+            return
+        # no dejar la transacción de lectura abierta mientras se espera
+        db.session.rollback()
+        time.sleep(poll_interval)
@@ -0,0 +1,164 @@
+"""
+Libro de precios de venta: tramos por variante y último precio de catálogo.
+
+load_price_book(product_ids) lee con una consulta los VariantPriceTier de
+esos productos y con otra su último CatalogPrice (latest_prices). Los tramos quedan
+ordenados por min_qty para cada (producto, variante, unidad) y el tramo que
+corresponde a una cantidad se busca con bisect.
+
+Caché opcional entre requests (PRICE_BOOK_CACHE_TTL > 0, en segundos): los
+datos de cada producto se guardan en memoria del proceso y se descartan
+después de cualquier commit que escriba variant_price_tiers, catalog_prices
+o product_variants (POST/PUT /variants/tiers, POST /prices/catalog, alta de
+productos). Las escrituras de otros workers se ven al vencer el TTL.
+"""
+import threading
+import time
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app, has_app_context
+
+from ..db import db
+from ..models.variant import VariantPriceTier
+from .change_tracker import on_after_commit
+from .latest_prices import latest_catalog_prices
+
+
+# Tablas cuyas escrituras invalidan la caché
+PRICE_TABLES = frozenset({"variant_price_tiers", "catalog_prices", "product_variants"})
+
+# Clave de variante que agrupa los tramos de todas las variantes del producto
+_ANY_VARIANT = "*"
+
+# (variant_id, unit, min_qty, sale_price) en orden de id
+TierRow = Tuple[Optional[int], str, float, float]
+
+_lock = threading.Lock()
+_cache: Dict[int, Tuple[List[TierRow], Optional[float]]] = {}
+_cache_expires = 0.0
+# sube con cada invalidación; evita guardar lecturas anteriores a ella
+_generation = 0
+
+
+class PriceBook:
+    """Precios de venta de un conjunto de productos, ya cargados."""
+
+    def __init__(self, tiers: Dict[int, List[TierRow]], catalog: Dict[int, Optional[float]]):
+        self._catalog = catalog
+        # (producto, variante, unidad) -> (min_qty ascendentes, precios)
+        self._tiers: Dict[tuple, Tuple[List[float], List[float]]] = {}
+        grouped: Dict[tuple, Dict[float, float]] = {}
+        for product_id, rows in tiers.items():
+            for variant_id, unit, min_qty, sale_price in rows:
+                for key in ((product_id, variant_id, unit), (product_id, _ANY_VARIANT, unit)):
+                    # con el mismo min_qty gana el tramo más antiguo
+                    grouped.setdefault(key, {}).setdefault(min_qty, sale_price)
+        for key, by_qty in grouped.items():
+            thresholds = sorted(by_qty)
+            self._tiers[key] = (thresholds, [by_qty[q] for q in thresholds])
+
+    def _tier(self, key: tuple, qty: float) -> Optional[Tuple[float, float]]:
+        entry = self._tiers.get(key)
+        if not entry:
+            return None
+        thresholds, prices = entry
+        pos = bisect_right(thresholds, qty)
+        if not pos:
+            return None
+        return thresholds[pos - 1], prices[pos - 1]
+
+    def tier_price(self, product_id: int, unit: str, qty: float, variant_id: Optional[int] = None) -> float:
+        """
+        Precio del tramo con mayor min_qty <= qty en esa unidad. Con variant_id
+        se consideran los tramos de esa variante y los sin variante (gana la
+        variante si empatan); sin ella, los de cualquier variante. 0.0 si no hay.
+        """
+        if variant_id is None:
+            found = self._tier((product_id, _ANY_VARIANT, unit), qty)
+        else:
+            found = self._tier((product_id, variant_id, unit), qty)
+            generic = self._tier((product_id, None, unit), qty)
+            if generic and (not found or generic[0] > found[0]):
+                found = generic
+        return float(found[1] or 0.0) if found else 0.0
+
+    def catalog_price(self, product_id: int) -> float:
+        """Último precio de catálogo del producto (0.0 si no tiene)."""
+        return float(self._catalog.get(product_id) or 0.0)
+
+    def unit_price(self, product_id: int, unit: str, qty: float, variant_id: Optional[int] = None,
+                   sale_unit_price: Optional[float] = None) -> float:
+        """Precio fijado en el item, si no el del tramo y, en último caso, el de catálogo."""
+        price = float(sale_unit_price) if sale_unit_price is not None else 0.0
+        if price <= 0:
+            price = self.tier_price(product_id, unit, qty, variant_id)
+        if price <= 0:
+            price = self.catalog_price(product_id)
+        return price
+
+
+def _fetch(product_ids: set) -> Dict[int, Tuple[List[TierRow], Optional[float]]]:
+    data: Dict[int, Tuple[List[TierRow], Optional[float]]] = {pid: ([], None) for pid in product_ids}
+    tiers = (
+        db.session.query(VariantPriceTier.product_id, VariantPriceTier.variant_id, VariantPriceTier.unit,
+                         VariantPriceTier.min_qty, VariantPriceTier.sale_price)
+        .filter(VariantPriceTier.product_id.in_(product_ids))
+        .order_by(VariantPriceTier.id.asc())
+        .all()
+    )
+    for product_id, variant_id, unit, min_qty, sale_price in tiers:
+        data[product_id][0].append((variant_id, unit, float(min_qty or 0), sale_price))
+
+    # mismo día: el precio registrado último
+    for product_id, latest in latest_catalog_prices(product_ids).items():
+        data[product_id] = (data[product_id][0], latest.sale_price)
+    return data
+
+
+def _cache_ttl() -> int:
+    if not has_app_context():
+        return 0
+    return int(current_app.config.get("PRICE_BOOK_CACHE_TTL") or 0)
+
+
+def load_price_book(product_ids: Iterable[int]) -> PriceBook:
+    """PriceBook de los productos indicados (dos consultas, o ninguna si están en caché)."""
+    global _cache_expires
+    ids = {int(pid) for pid in product_ids if pid is not None}
+    ttl = _cache_ttl()
+    data: Dict[int, Tuple[List[TierRow], Optional[float]]] = {}
+    generation = None
+    if ttl > 0:
+        with _lock:
+            if time.monotonic() >= _cache_expires:
+                _cache.clear()
+                _cache_expires = time.monotonic() + ttl
+            data = {pid: _cache[pid] for pid in ids if pid in _cache}
+            generation = _generation
+    missing = ids - data.keys()
+    if missing:
+        fetched = _fetch(missing)
+        data.update(fetched)
+        if generation is not None:
+            with _lock:
+                if generation == _generation:
+                    _cache.update(fetched)
+    return PriceBook(
+        {pid: tiers for pid, (tiers, _) in data.items()},
+        {pid: price for pid, (_, price) in data.items()},
+    )
+
+
+def invalidate_price_book() -> None:
+    """Descarta la caché de precios del proceso."""
+    global _generation
+    with _lock:
+        _cache.clear()
+        _generation += 1
+
+
+@on_after_commit
+def _invalidate_committed(changes) -> None:
+    if changes.tables & PRICE_TABLES:
+        invalidate_price_book()
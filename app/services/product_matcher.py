@@ -0,0 +1,111 @@
+"""
+Búsqueda de productos por nombre aproximado (parseo de pedidos, sugerencias).
+
+Mantiene por proceso:
+
+- el nombre normalizado y los tokens de cada producto (_prepared), que se
+  descartan al insertar, actualizar o borrar ese Product, y
+- un NameIndex (utils/text_match) del catálogo armado con esos datos.
+
+Las escrituras de Product en este proceso marcan el índice como viejo. Para
+las de otros workers se compara además una firma barata de la tabla
+(cantidad, id máximo y última actualización); en ambos casos el índice se
+rearma en el siguiente uso sin volver a normalizar los nombres que no
+cambiaron.
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, func
+
+from ..db import db
+from ..models.product import Product
+from ..utils.text_match import NameIndex, name_tokens, normalize_text, prepare_name
+
+
+_lock = threading.Lock()
+_index: Optional[NameIndex] = None
+_signature = None
+# product_id -> (nombre, nombre normalizado, tokens)
+_prepared: Dict[int, Tuple[str, str, frozenset]] = {}
+
+
+def _catalog_signature():
+    return tuple(
+        db.session.query(func.count(Product.id), func.max(Product.id), func.max(Product.updated_at)).one()
+    )
+
+
+def _prepare(product_id: int, name: str) -> Tuple[str, frozenset]:
+    cached = _prepared.get(product_id)
+    if cached is None or cached[0] != name:
+        norm, tokens = prepare_name(name)
+        cached = _prepared[product_id] = (name, norm, tokens)
+    return cached[1], cached[2]
+
+
+def _forget_product(mapper, connection, target) -> None:
+    global _index
+    _prepared.pop(target.id, None)
+    _index = None
+
+
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(Product, _event_name, _forget_product)
+
+
+def product_index() -> NameIndex:
+    """Índice de nombres de productos (key = product id), reconstruido si cambió el catálogo."""
+    global _index, _signature
+    signature = _catalog_signature()
+    with _lock:
+        index = _index
+        if index is None or signature != _signature:
+            rows = db.session.query(Product.id, Product.name).order_by(Product.id.asc()).all()
+            index = NameIndex(rows, prepare=_prepare)
+            for product_id in set(_prepared) - {pid for pid, _ in rows}:
+                del _prepared[product_id]
+            _index, _signature = index, signature
+        return index
+
+
+def exact_product_id(name: str) -> Optional[int]:
+    """Id del producto cuyo nombre normalizado coincide con name."""
+    return product_index().exact(name)
+
+
+def suggest_products(name: str, min_score: int = 70, limit: int = 5) -> List[dict]:
+    """Sugerencias [{id, name, score}] ordenadas por similarity_score."""
+    return [
+        {"id": pid, "name": pname, "score": score}
+        for score, pid, pname in product_index().search(name, min_score=min_score, limit=limit)
+    ]
+
+
+def candidate_products(name: str, min_score: int) -> List[Tuple[int, str]]:
+    """(id, nombre) de los productos que pueden tener similarity_score >= min_score."""
+    index = product_index()
+    qa = normalize_text(name)
+    return [(index.keys[pos], index.names[pos]) for pos in index.candidates(qa, name_tokens(qa), min_score)]
+
+
+def annotate_parsed_item(item: dict, index: Optional[NameIndex] = None) -> dict:
+    """
+    Item de parse_orders_text con match_status: exact (+ product_id),
+    similar (+ suggestions) o none. Para anotar un lote, pasar el mismo
+    product_index() a cada llamada evita revisar la firma del catálogo por línea.
+    """
+    name = (item.get("product") or "").strip()
+    if not name:
+        return {**item, "match_status": "none"}
+    index = index or product_index()
+    product_id = index.exact(name)
+    if product_id is not None:
+        return {**item, "match_status": "exact", "product_id": product_id}
+    suggestions = [
+        {"id": pid, "name": pname, "score": score}
+        for score, pid, pname in index.search(name, min_score=70, limit=5)
+    ]
+    if suggestions:
+        return {**item, "match_status": "similar", "suggestions": suggestions}
+    return {**item, "match_status": "none"}
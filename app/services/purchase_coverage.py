@@ -0,0 +1,343 @@
+"""
+Cobertura de compras por pedido y producto: lo necesario vs lo comprado.
+
+Carga items y compras de un conjunto de pedidos con dos consultas agrupadas
+y acumula en columnas array('d') indexadas por fila (pedido, producto).
+Expone dos bases de cálculo:
+
+- pedida: lo pedido en la unidad del item vs lo comprado en kg y unidades
+  (cantidad + equivalencias). Es la que define el estado de compra de
+  GET /accounting/orders.
+- de cobro: lo pedido en la unidad de cobro (charged_qty) vs lo comprado en
+  la unidad de cobro de cada compra. Es la que usan los excedentes y el
+  detalle de pedido; este último solo suma una equivalencia (eq_qty_kg /
+  eq_qty_unit) si la compra trae la otra medida.
+
+El motor de contabilidad, que ya tiene cargados items y compras, los
+acumula con add_items/add_purchases en vez de volver a consultarlos.
+"""
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, func, or_
+
+from ..db import db
+from ..models.order_item import OrderItem
+from ..models.purchase import Purchase
+
+
+# Diferencia mínima para considerar excedente
+EXCESS_EPSILON = 0.01
+
+
+def _unit_or(column, default):
+    return func.coalesce(func.nullif(column, ""), default)
+
+
+def _sorted_groups(groups: dict) -> list:
+    """Filas (clave..., sumas..., id mínimo) en orden de id mínimo, como las consultas agrupadas."""
+    return sorted((key + tuple(values) for key, values in groups.items()), key=lambda row: row[-1])
+
+
+class PurchaseCoverage:
+    """Cantidades necesarias y compradas por (pedido, producto)."""
+
+    def __init__(self):
+        self._rows: Dict[Tuple[Optional[int], int], int] = {}
+        self._by_order: Dict[Optional[int], List[int]] = {}
+        self.order_ids: List[Optional[int]] = []
+        self.product_ids: List[int] = []
+        # Base pedida
+        self.need_kg = array("d")
+        self.need_unit = array("d")
+        self.need_other: Dict[int, Dict[str, float]] = {}  # fila -> {unidad: qty} (g, etc.)
+        self.got_kg = array("d")
+        self.got_unit = array("d")
+        # Base de cobro
+        self.charged_need = array("d")
+        self.charged_got_kg = array("d")
+        self.charged_got_unit = array("d")
+        self.charged_got_other = array("d")  # compras con unidad de cobro distinta de kg/unit
+        # Detalle de pedido: equivalencias solo de compras que traen la otra medida
+        self.detail_got_kg = array("d")
+        self.detail_got_unit = array("d")
+        self.need_charged_unit: List[Optional[str]] = []  # unidad de cobro del primer item
+        self.purchase_charged_unit: List[Optional[str]] = []  # unidad de cobro de la primera compra
+        # Id del primer item / compra de la fila (0 = sin items / sin compras), para el orden de salida
+        self.first_item_id = array("q")
+        self.first_purchase_id = array("q")
+
+    def _row(self, order_id: Optional[int], product_id: int) -> int:
+        key = (order_id, product_id)
+        row = self._rows.get(key)
+        if row is not None:
+            return row
+        row = self._rows[key] = len(self.product_ids)
+        self._by_order.setdefault(order_id, []).append(row)
+        self.order_ids.append(order_id)
+        self.product_ids.append(product_id)
+        for col in (self.need_kg, self.need_unit, self.got_kg, self.got_unit, self.charged_need,
+                    self.charged_got_kg, self.charged_got_unit, self.charged_got_other,
+                    self.detail_got_kg, self.detail_got_unit):
+            col.append(0.0)
+        self.first_item_id.append(0)
+        self.first_purchase_id.append(0)
+        self.need_charged_unit.append(None)
+        self.purchase_charged_unit.append(None)
+        return row
+
+    def load(self, order_ids: Iterable[int], include_orphans: bool = False,
+             orphan_product_ids: Optional[Iterable[int]] = None) -> "PurchaseCoverage":
+        """
+        Carga items y compras de los pedidos. Con include_orphans también las
+        compras sin pedido (solo de orphan_product_ids, si se indica).
+        """
+        ids = sorted({i for i in order_ids if i is not None})
+        orphan_pids = None if orphan_product_ids is None else sorted(set(orphan_product_ids))
+        if ids:
+            self._load_items(ids)
+        if ids or (include_orphans and orphan_pids != []):
+            self._load_purchases(ids, include_orphans, orphan_pids)
+        return self
+
+    def _load_items(self, ids: List[int]) -> None:
+        unit = _unit_or(OrderItem.unit, "kg")
+        charged_unit = func.coalesce(func.nullif(OrderItem.charged_unit, ""), unit)
+        first_id = func.min(OrderItem.id)
+        rows = (
+            db.session.query(
+                OrderItem.order_id,
+                OrderItem.product_id,
+                unit,
+                charged_unit,
+                func.coalesce(func.sum(OrderItem.qty), 0.0),
+                func.coalesce(func.sum(func.coalesce(OrderItem.charged_qty, OrderItem.qty, 0.0)), 0.0),
+                first_id,
+            )
+            .filter(OrderItem.order_id.in_(ids))
+            .group_by(OrderItem.order_id, OrderItem.product_id, unit, charged_unit)
+            .order_by(first_id)
+            .all()
+        )
+        self._add_item_groups(rows)
+
+    def add_items(self, items: Iterable[OrderItem]) -> "PurchaseCoverage":
+        """Acumula OrderItems ya cargados (en orden de id) con las mismas reglas que la consulta."""
+        groups: Dict[tuple, list] = {}
+        for it in items:
+            unit = it.unit or "kg"
+            key = (it.order_id, it.product_id, unit, it.charged_unit or unit)
+            g = groups.get(key)
+            if g is None:
+                g = groups[key] = [0.0, 0.0, it.id]
+            g[0] += it.qty or 0.0
+            g[1] += it.charged_qty if it.charged_qty is not None else (it.qty or 0.0)
+            g[2] = min(g[2], it.id)
+        self._add_item_groups(_sorted_groups(groups))
+        return self
+
+    def _add_item_groups(self, rows) -> None:
+        for order_id, product_id, item_unit, item_charged_unit, qty, charged_qty, min_id in rows:
+            row = self._row(order_id, product_id)
+            if not self.first_item_id[row]:
+                self.first_item_id[row] = min_id
+                self.need_charged_unit[row] = item_charged_unit
+            if item_unit == "kg":
+                self.need_kg[row] += qty
+            elif item_unit == "unit":
+                self.need_unit[row] += qty
+            else:
+                other = self.need_other.setdefault(row, {})
+                other[item_unit] = other.get(item_unit, 0.0) + qty
+            self.charged_need[row] += charged_qty
+
+    def _load_purchases(self, ids: List[int], include_orphans: bool, orphan_pids: Optional[List[int]]) -> None:
+        charged_unit = _unit_or(Purchase.charged_unit, "kg")
+        first_id = func.min(Purchase.id)
+        conds = []
+        if ids:
+            conds.append(Purchase.order_id.in_(ids))
+        if include_orphans:
+            # usa el índice parcial ix_purchases_orphan_product
+            orphan = Purchase.order_id.is_(None)
+            if orphan_pids is not None:
+                orphan = and_(orphan, Purchase.product_id.in_(orphan_pids))
+            conds.append(orphan)
+        rows = (
+            db.session.query(
+                Purchase.order_id,
+                Purchase.product_id,
+                charged_unit,
+                func.coalesce(func.sum(Purchase.qty_kg), 0.0),
+                func.coalesce(func.sum(Purchase.eq_qty_kg), 0.0),
+                func.coalesce(func.sum(Purchase.qty_unit), 0.0),
+                func.coalesce(func.sum(Purchase.eq_qty_unit), 0.0),
+                func.coalesce(func.sum(case((Purchase.qty_unit != 0, Purchase.eq_qty_kg), else_=0.0)), 0.0),
+                func.coalesce(func.sum(case((Purchase.qty_kg != 0, Purchase.eq_qty_unit), else_=0.0)), 0.0),
+                first_id,
+            )
+            .filter(or_(*conds))
+            .group_by(Purchase.order_id, Purchase.product_id, charged_unit)
+            .order_by(first_id)
+            .all()
+        )
+        self._add_purchase_groups(rows)
+
+    def add_purchases(self, purchases: Iterable[Purchase]) -> "PurchaseCoverage":
+        """Acumula compras ya cargadas (en orden de id) con las mismas reglas que la consulta."""
+        groups: Dict[tuple, list] = {}
+        for p in purchases:
+            key = (p.order_id, p.product_id, p.charged_unit or "kg")
+            g = groups.get(key)
+            if g is None:
+                g = groups[key] = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, p.id]
+            g[0] += p.qty_kg or 0.0
+            g[1] += p.eq_qty_kg or 0.0
+            g[2] += p.qty_unit or 0.0
+            g[3] += p.eq_qty_unit or 0.0
+            g[4] += (p.eq_qty_kg or 0.0) if p.qty_unit else 0.0
+            g[5] += (p.eq_qty_unit or 0.0) if p.qty_kg else 0.0
+            g[6] = min(g[6], p.id)
+        self._add_purchase_groups(_sorted_groups(groups))
+        return self
+
+    def _add_purchase_groups(self, rows) -> None:
+        for order_id, product_id, unit, qty_kg, eq_kg, qty_unit, eq_unit, paired_eq_kg, paired_eq_unit, min_id in rows:
+            row = self._row(order_id, product_id)
+            if not self.first_purchase_id[row]:
+                self.first_purchase_id[row] = min_id
+                self.purchase_charged_unit[row] = unit
+            kg = qty_kg + eq_kg
+            units = qty_unit + eq_unit
+            self.got_kg[row] += kg
+            self.got_unit[row] += units
+            if unit == "kg":
+                self.charged_got_kg[row] += kg
+                self.detail_got_kg[row] += qty_kg + paired_eq_kg
+            elif unit == "unit":
+                self.charged_got_unit[row] += units
+                self.detail_got_unit[row] += qty_unit + paired_eq_unit
+            else:
+                self.charged_got_other[row] += units
+
+    # --- Filas por pedido ---
+
+    def _item_rows(self, order_id) -> List[int]:
+        rows = [r for r in self._by_order.get(order_id, ()) if self.first_item_id[r]]
+        rows.sort(key=self.first_item_id.__getitem__)
+        return rows
+
+    def _purchase_rows(self, order_id) -> List[int]:
+        rows = [r for r in self._by_order.get(order_id, ()) if self.first_purchase_id[r]]
+        rows.sort(key=self.first_purchase_id.__getitem__)
+        return rows
+
+    def has_purchases(self, order_id) -> bool:
+        return any(self.first_purchase_id[r] for r in self._by_order.get(order_id, ()))
+
+    def purchased_product_ids(self, order_id) -> List[int]:
+        return [self.product_ids[r] for r in self._purchase_rows(order_id)]
+
+    # --- Base pedida ---
+
+    def requested(self, order_id) -> Tuple[dict, dict]:
+        """(needed_by_product, purchased_by_product) en kg/unit según lo pedido."""
+        needed = {}
+        for r in self._item_rows(order_id):
+            d = needed[self.product_ids[r]] = {"kg": self.need_kg[r], "unit": self.need_unit[r]}
+            d.update(self.need_other.get(r, {}))
+        purchased = {
+            self.product_ids[r]: {"kg": self.got_kg[r], "unit": self.got_unit[r]}
+            for r in self._purchase_rows(order_id)
+        }
+        return needed, purchased
+
+    def requested_status(self, order_id) -> Tuple[str, list, list]:
+        """
+        Estado de compra del pedido: 'complete', 'incomplete' o 'over'
+        (completo con algún producto sobre-comprado), más etiquetas de
+        lo comprado y lo faltante por producto.
+        """
+        status = "complete"
+        has_excess = False
+        bought_tags = []
+        missing_tags = []
+        for r in self._item_rows(order_id):
+            pid = self.product_ids[r]
+            need_kg, need_unit = self.need_kg[r], self.need_unit[r]
+            got_kg, got_unit = self.got_kg[r], self.got_unit[r]
+
+            kg_ok = (need_kg == 0 or got_kg >= need_kg)
+            unit_ok = (need_unit == 0 or got_unit >= need_unit)
+            if not (kg_ok and unit_ok):
+                status = "incomplete"
+            if (need_kg > 0 and got_kg > need_kg) or (need_unit > 0 and got_unit > need_unit):
+                has_excess = True
+
+            if got_kg > 0 or got_unit > 0:
+                bought_tags.append({"product_id": pid, "kg": got_kg, "unit": got_unit})
+            missing_kg = max(0.0, need_kg - got_kg)
+            missing_unit = max(0.0, need_unit - got_unit)
+            if missing_kg > 0 or missing_unit > 0:
+                missing_tags.append({"product_id": pid, "kg": missing_kg, "unit": missing_unit})
+
+        if status == "complete" and has_excess:
+            status = "over"
+        return status, bought_tags, missing_tags
+
+    # --- Base de cobro ---
+
+    def _charged_purchased(self, r: int) -> float:
+        return self.charged_got_kg[r] + self.charged_got_unit[r] + self.charged_got_other[r]
+
+    def charged(self, order_id) -> Tuple[dict, dict]:
+        """(needed_by_product, purchased_by_product) como {pid: {"unit", "qty"}} en la unidad de cobro."""
+        needed = {
+            self.product_ids[r]: {"unit": self.need_charged_unit[r], "qty": self.charged_need[r]}
+            for r in self._item_rows(order_id)
+        }
+        purchased = {
+            self.product_ids[r]: {"unit": self.purchase_charged_unit[r], "qty": self._charged_purchased(r)}
+            for r in self._purchase_rows(order_id)
+        }
+        return needed, purchased
+
+    def purchased_by_charged_unit(self, order_id) -> dict:
+        """
+        Comprado por producto separado por unidad de cobro: {pid: {"kg", "unit", "g"}}.
+        Cada equivalencia cuenta solo si la compra trae la otra medida.
+        """
+        return {
+            self.product_ids[r]: {"kg": self.detail_got_kg[r], "unit": self.detail_got_unit[r], "g": 0.0}
+            for r in self._purchase_rows(order_id)
+        }
+
+    def excesses(self, order_id, only_excess: bool = True) -> List[dict]:
+        """
+        Comprado vs pedido en la unidad de cobro por cada producto comprado.
+
+        Con only_excess=True retorna solo productos con excedente > EXCESS_EPSILON.
+        """
+        result = []
+        for r in self._purchase_rows(order_id):
+            purchased = self._charged_purchased(r)
+            needed = self.charged_need[r] if self.first_item_id[r] else 0.0
+            excess = purchased - needed
+            if only_excess and excess <= EXCESS_EPSILON:
+                continue
+            result.append({
+                "product_id": self.product_ids[r],
+                "unit": self.purchase_charged_unit[r],
+                "needed_qty": needed,
+                "purchased_qty": purchased,
+                "excess_qty": excess,
+                "missing_qty": max(0.0, -excess),
+                "first_purchase_id": self.first_purchase_id[r],
+            })
+        return result
+
+
+def load_coverage(order_ids: Iterable[int], include_orphans: bool = False,
+                  orphan_product_ids: Optional[Iterable[int]] = None) -> PurchaseCoverage:
+    """Cobertura de compras de los pedidos indicados (dos consultas)."""
+    return PurchaseCoverage().load(order_ids, include_orphans=include_orphans, orphan_product_ids=orphan_product_ids)
@@ -0,0 +1,327 @@
+"""
+Caché de respuestas GET invalidada por escrituras.
+
+Cada respuesta se guarda con una clave (endpoint, alcance del usuario, query
+params) y un conjunto de etiquetas que declara la vista con cache_tags():
+
+- order:<id> / customer:<id>: filas de ese pedido / cliente
+- orders:new: la lista de pedidos cambia al crear uno
+- orders:any / customers:any: cualquier cambio contable de pedidos / clientes
+- orphans: compras sin pedido
+- table:<nombre>: cualquier escritura en esa tabla (ej. table:products)
+
+Los ids afectados los anota services/change_tracker en after_flush; la
+invalidación se aplica después del commit, para no volver a guardar datos
+sin confirmar. Backends: "memory" (LRU por proceso) o "sqlite" (archivo
+compartido por todos los workers de gunicorn), configurados en AppConfig.
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Iterable, Optional, Tuple
+
+from flask import current_app, g, has_app_context, request
+
+from ..utils.pagination import NEXT_CURSOR_HEADER, wants_ndjson
+from .change_tracker import on_after_commit
+
+
+_EXTENSION_KEY = "response_cache"
+# Headers de la respuesta que se guardan junto al cuerpo
+_STORED_HEADERS = ("Content-Type", "ETag", NEXT_CURSOR_HEADER)
+
+Entry = Tuple[bytes, dict]
+
+
+class MemoryBackend:
+    """LRU en memoria del proceso, con índice de etiquetas."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 256, ttl: int = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tags = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def epoch(self) -> int:
+        return self._epoch
+
+    def get(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.time() - entry[3] > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def set(self, key: str, body: bytes, headers: dict, tags: Iterable[str], if_epoch: int) -> bool:
+        with self._lock:
+            if self._epoch != if_epoch:
+                return False
+            self._drop(key)
+            tags = frozenset(tags)
+            self._entries[key] = (body, headers, tags, time.time())
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+            return True
+
+    def invalidate(self, tags: Iterable[str]) -> int:
+        with self._lock:
+            self._epoch += 1
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.get(tag, set())
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class SqliteBackend:
+    """Caché en un archivo SQLite compartido entre procesos (mismo host)."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = "", max_entries: int = 256, ttl: int = 300):
+        self.path = path or os.path.join(tempfile.gettempdir(), "kivi-response-cache.db")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, body BLOB NOT NULL, headers TEXT NOT NULL, created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entry_tags (tag TEXT NOT NULL, key TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS ix_entry_tags_tag ON entry_tags (tag);
+            CREATE INDEX IF NOT EXISTS ix_entry_tags_key ON entry_tags (key);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO meta (name, value) VALUES ('epoch', 0);
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def epoch(self) -> int:
+        return self._conn().execute("SELECT value FROM meta WHERE name = 'epoch'").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Entry]:
+        row = self._conn().execute("SELECT body, headers, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or (self.ttl and time.time() - row[2] > self.ttl):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return bytes(row[0]), json.loads(row[1])
+
+    def set(self, key: str, body: bytes, headers: dict, tags: Iterable[str], if_epoch: int) -> bool:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT value FROM meta WHERE name = 'epoch'").fetchone()[0] != if_epoch:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute("DELETE FROM entry_tags WHERE key = ?", (key,))
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, body, headers, created_at) VALUES (?, ?, ?, ?)",
+                (key, body, json.dumps(headers), time.time()),
+            )
+            conn.executemany("INSERT INTO entry_tags (tag, key) VALUES (?, ?)", [(t, key) for t in set(tags)])
+            # Desalojar las más antiguas sobre el máximo
+            old = [r[0] for r in conn.execute(
+                "SELECT key FROM entries ORDER BY created_at DESC LIMIT -1 OFFSET ?", (self.max_entries,)
+            )]
+            if old:
+                conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k in old])
+                conn.executemany("DELETE FROM entry_tags WHERE key = ?", [(k,) for k in old])
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def invalidate(self, tags: Iterable[str]) -> int:
+        tags = list(set(tags))
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'epoch'")
+            keys = set()
+            for i in range(0, len(tags), 500):
+                chunk = tags[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                keys.update(r[0] for r in conn.execute(f"SELECT key FROM entry_tags WHERE tag IN ({marks})", chunk))
+            conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k in keys])
+            conn.executemany("DELETE FROM entry_tags WHERE key = ?", [(k,) for k in keys])
+            conn.execute("COMMIT")
+            return len(keys)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self) -> None:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'epoch'")
+        conn.execute("DELETE FROM entries")
+        conn.execute("DELETE FROM entry_tags")
+        conn.execute("COMMIT")
+
+    def size(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+def init_response_cache(app) -> None:
+    """Crea el backend configurado (RESPONSE_CACHE_BACKEND) y lo deja en app.extensions."""
+    kind = (app.config.get("RESPONSE_CACHE_BACKEND") or "memory").lower()
+    max_entries = app.config.get("RESPONSE_CACHE_MAX_ENTRIES", 256)
+    ttl = app.config.get("RESPONSE_CACHE_TTL", 300)
+    if kind == "sqlite":
+        backend = SqliteBackend(app.config.get("RESPONSE_CACHE_PATH") or "", max_entries=max_entries, ttl=ttl)
+    elif kind == "memory":
+        backend = MemoryBackend(max_entries=max_entries, ttl=ttl)
+    else:
+        backend = None
+    app.extensions[_EXTENSION_KEY] = backend
+
+
+def get_response_cache():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get(_EXTENSION_KEY)
+
+
+def cache_tags(*tags: str) -> None:
+    """Declara etiquetas de invalidación para la respuesta en curso."""
+    pending = g.get("response_cache_tags")
+    if pending is not None:
+        pending.update(tags)
+
+
+def order_tags(order_ids: Iterable[int]) -> list:
+    return [f"order:{i}" for i in order_ids if i is not None]
+
+
+def customer_tags(customer_ids: Iterable[int]) -> list:
+    return [f"customer:{i}" for i in customer_ids if i is not None]
+
+
+def _cache_key(view_args: dict) -> str:
+    user = getattr(request, "current_user", None)
+    scope = f"{user.role}:{user.id}" if user else "anon"
+    args = sorted(request.args.items(multi=True))
+    return json.dumps([request.endpoint, scope, sorted(view_args.items()), args], separators=(",", ":"))
+
+
+def cached_response(fn):
+    """
+    Sirve la respuesta desde la caché si existe. Solo se guardan respuestas
+    200 de vistas que declararon etiquetas; NDJSON no pasa por la caché.
+
+    Si la vista pone un ETag, un If-None-Match que coincide recibe 304; con
+    la entrada en caché eso se responde sin ejecutar la vista.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        cache = get_response_cache()
+        if cache is None or request.method != "GET" or wants_ndjson():
+            return fn(*args, **kwargs)
+
+        key = _cache_key(kwargs)
+        hit = cache.get(key)
+        if hit is not None:
+            body, headers = hit
+            response = current_app.response_class(body, headers=headers)
+            response.headers["X-Cache"] = "hit"
+            return response.make_conditional(request)
+
+        epoch = cache.epoch()
+        g.response_cache_tags = set()
+        response = current_app.make_response(fn(*args, **kwargs))
+        tags = g.pop("response_cache_tags", None)
+        if response.status_code == 200 and not response.is_streamed and tags:
+            headers = {h: response.headers[h] for h in _STORED_HEADERS if h in response.headers}
+            cache.set(key, response.get_data(), headers, tags, if_epoch=epoch)
+        response.headers["X-Cache"] = "miss"
+        return response.make_conditional(request) if response.status_code == 200 else response
+
+    return wrapper
+
+
+def cache_stats() -> dict:
+    cache = get_response_cache()
+    if cache is None:
+        return {"backend": None}
+    total = cache.hits + cache.misses
+    return {
+        "backend": cache.name,
+        "pid": os.getpid(),  # contadores por proceso (worker)
+        "hits": cache.hits,
+        "misses": cache.misses,
+        "hit_ratio": round(cache.hits / total, 4) if total else None,
+        "entries": cache.size(),
+        "max_entries": cache.max_entries,
+        "ttl": cache.ttl,
+    }
+
+
+@on_after_commit
+def _invalidate_committed(changes) -> None:
+    cache = get_response_cache()
+    if cache is None:
+        return
+    tags = set(order_tags(changes.order_ids)) | set(customer_tags(changes.customer_ids))
+    tags.update(f"table:{t}" for t in changes.tables)
+    if changes.order_ids:
+        tags.add("orders:any")
+    if changes.customer_ids:
+        tags.add("customers:any")
+    if changes.new_order_ids:
+        tags.add("orders:new")
+    if changes.orphan_product_ids:
+        tags.add("orphans")
+    if tags:
+        cache.invalidate(tags)
@@ -0,0 +1,156 @@
+"""
+Comisiones diarias por vendedor (tabla vendor_commission_daily).
+
+Cada fila agrega los pedidos 'emitido' de un vendedor en un día a partir del
+order_ledger. Se refresca dentro de la misma transacción que el ledger (el
+manejador se registra después del de services/order_ledger) y los reportes
+por período suman días en vez de recorrer pedidos.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import and_, func, or_
+
+from ..db import db
+from ..models.order_ledger import OrderLedger
+from ..models.user import User
+from ..models.vendor_commission_daily import VendorCommissionDaily
+from .change_tracker import on_before_commit
+
+
+# Claves (vendor_id, día) por consulta al refrescar
+_KEYS_PER_QUERY = 200
+
+
+def _day_bounds(day: date) -> Tuple[datetime, datetime]:
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+def _aggregate(rows) -> Dict[tuple, dict]:
+    """Agrupa filas (vendor_id, order_created_at, billed, cost) por vendedor y día."""
+    days = defaultdict(lambda: {"num_orders": 0, "billed": 0.0, "cost": 0.0})
+    for vendor_id, created_at, billed, cost in rows:
+        d = days[(vendor_id, created_at.date())]
+        d["num_orders"] += 1
+        d["billed"] += billed or 0.0
+        d["cost"] += cost or 0.0
+    return days
+
+
+def _apply(keys: Iterable[tuple], days: Dict[tuple, dict], rates: Dict[int, float]) -> None:
+    """Upsert de las filas diarias de keys; las que quedan sin pedidos se borran."""
+    keys = set(keys) | set(days)
+    if not keys:
+        return
+    existing = {}
+    vendor_ids = {k[0] for k in keys}
+    day_values = {k[1] for k in keys}
+    for row in VendorCommissionDaily.query.filter(
+        VendorCommissionDaily.vendor_id.in_(vendor_ids),
+        VendorCommissionDaily.day.in_(day_values),
+    ).all():
+        existing[(row.vendor_id, row.day)] = row
+    for key in keys:
+        row = existing.get(key)
+        vals = days.get(key)
+        if vals is None:
+            if row is not None:
+                db.session.delete(row)
+            continue
+        if row is None:
+            row = VendorCommissionDaily(vendor_id=key[0], day=key[1])
+            db.session.add(row)
+        profit = vals["billed"] - vals["cost"]
+        commission = max(0.0, profit) * rates.get(key[0], 0.0)
+        row.num_orders = vals["num_orders"]
+        row.billed = vals["billed"]
+        row.cost = vals["cost"]
+        row.profit = profit
+        row.commission = commission
+        row.kivi_amount = max(0.0, profit) - commission
+
+
+def _rates(vendor_ids) -> Dict[int, float]:
+    if not vendor_ids:
+        return {}
+    return dict(db.session.query(User.id, User.commission_rate).filter(User.id.in_(vendor_ids)).all())
+
+
+def refresh_vendor_days(keys: Iterable[tuple]) -> int:
+    """Recalcula las filas diarias de los pares (vendor_id, día) indicados."""
+    keys = sorted({k for k in keys if k and k[0] is not None and k[1] is not None})
+    for i in range(0, len(keys), _KEYS_PER_QUERY):
+        chunk = keys[i:i + _KEYS_PER_QUERY]
+        conds = []
+        for vendor_id, day in chunk:
+            start, end = _day_bounds(day)
+            conds.append(and_(
+                OrderLedger.vendor_id == vendor_id,
+                OrderLedger.order_created_at >= start,
+                OrderLedger.order_created_at < end,
+            ))
+        rows = (
+            db.session.query(OrderLedger.vendor_id, OrderLedger.order_created_at, OrderLedger.billed, OrderLedger.cost)
+            .filter(OrderLedger.order_status == 'emitido', or_(*conds))
+            .all()
+        )
+        _apply(chunk, _aggregate(rows), _rates({k[0] for k in chunk}))
+    return len(keys)
+
+
+def rebuild_vendor_commissions(batch_size: int = 500) -> int:
+    """Reconstruye la tabla completa desde order_ledger."""
+    VendorCommissionDaily.query.delete(synchronize_session=False)
+    rows = []
+    last_id = 0
+    while True:
+        batch = (
+            db.session.query(OrderLedger.order_id, OrderLedger.vendor_id, OrderLedger.order_created_at,
+                             OrderLedger.billed, OrderLedger.cost)
+            .filter(
+                OrderLedger.order_id > last_id,
+                OrderLedger.order_status == 'emitido',
+                OrderLedger.vendor_id.isnot(None),
+                OrderLedger.order_created_at.isnot(None),
+            )
+            .order_by(OrderLedger.order_id.asc())
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+        rows.extend(r[1:] for r in batch)
+        last_id = batch[-1][0]
+    days = _aggregate(rows)
+    _apply(days.keys(), days, _rates({k[0] for k in days}))
+    db.session.commit()
+    return len(days)
+
+
+def commissions_by_vendor(date_from: Optional[date] = None, date_to: Optional[date] = None):
+    """
+    Totales por vendedor activo sumando días (ambos extremos inclusive).
+
+    Retorna filas (vendor_id, num_orders, billed, cost).
+    """
+    query = db.session.query(
+        VendorCommissionDaily.vendor_id,
+        func.coalesce(func.sum(VendorCommissionDaily.num_orders), 0),
+        func.coalesce(func.sum(VendorCommissionDaily.billed), 0.0),
+        func.coalesce(func.sum(VendorCommissionDaily.cost), 0.0),
+    ).join(User, User.id == VendorCommissionDaily.vendor_id).filter(
+        User.role == 'vendor',
+        User.active.is_(True),
+    )
+    if date_from:
+        query = query.filter(VendorCommissionDaily.day >= date_from)
+    if date_to:
+        query = query.filter(VendorCommissionDaily.day <= date_to)
+    return query.group_by(VendorCommissionDaily.vendor_id).all()
+
+
+@on_before_commit
+def _refresh_touched_vendor_days(session, changes) -> None:
+    refresh_vendor_days(changes.vendor_days)
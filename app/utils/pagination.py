@@ -0,0 +1,79 @@
+"""
+Paginación por cursor (keyset) y respuestas NDJSON en streaming.
+
+El cursor es opaco para el cliente: base64 de los valores de la última fila
+entregada en las columnas de orden. La siguiente página filtra las filas
+estrictamente posteriores a esos valores, así que el costo no crece con el
+número de páginas saltadas como con OFFSET.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Iterable, Optional, Sequence
+
+from flask import Response, current_app, request, stream_with_context
+from sqlalchemy import and_, or_
+
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values) -> str:
+    raw = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(raw, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, types: Sequence[type]) -> list:
+    """Decodifica un cursor a los tipos indicados. Lanza ValueError si es inválido."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception as e:
+        raise ValueError("cursor inválido") from e
+    if not isinstance(raw, list) or len(raw) != len(types):
+        raise ValueError("cursor inválido")
+    values = []
+    for value, typ in zip(raw, types):
+        if value is None:
+            values.append(None)
+        elif typ is datetime:
+            values.append(datetime.fromisoformat(value))
+        else:
+            values.append(typ(value))
+    return values
+
+
+def keyset_filter(columns: Sequence, values: Sequence, descending: bool = False):
+    """Condición "fila posterior a values" para un orden por columns (todas asc o todas desc)."""
+    conds = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        step = column < value if descending else column > value
+        conds.append(and_(*[c == v for c, v in zip(columns[:i], values[:i])], step))
+    return or_(*conds)
+
+
+def page_limit(default: Optional[int], maximum: Optional[int] = None) -> Optional[int]:
+    """Lee ?limit= acotado a maximum. Lanza ValueError si no es un entero positivo."""
+    raw = request.args.get("limit")
+    if not raw:
+        return default
+    limit = int(raw)
+    if limit <= 0:
+        raise ValueError("limit debe ser positivo")
+    return min(limit, maximum) if maximum else limit
+
+
+def wants_ndjson() -> bool:
+    """True si el cliente pidió explícitamente Accept: application/x-ndjson."""
+    best = request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def ndjson_response(rows: Iterable[dict], headers: Optional[dict] = None) -> Response:
+    """Respuesta que serializa y envía una fila por línea a medida que se generan."""
+    def generate():
+        for row in rows:
+            yield current_app.json.dumps(row) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE, headers=headers)
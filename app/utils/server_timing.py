@@ -0,0 +1,37 @@
+"""
+Header Server-Timing con la duración de las etapas de un request.
+
+Los navegadores lo muestran en la pestaña de red (Timing), así que sirve para
+ver qué parte de un endpoint lento se lleva el tiempo sin instrumentar el
+cliente. Formato: "etapa;dur=12.3, otra;dur=4.0" (milisegundos).
+"""
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+
+
+SERVER_TIMING_HEADER = "Server-Timing"
+
+
+class ServerTiming:
+    """Acumula (etapa, ms) y los escribe en la respuesta."""
+
+    def __init__(self):
+        self.metrics: List[Tuple[str, float]] = []
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.metrics.append((name, (time.perf_counter() - start) * 1000))
+
+    def header(self) -> str:
+        metrics = self.metrics + [("total", (time.perf_counter() - self._start) * 1000)]
+        return ", ".join(f"{name};dur={ms:.1f}" for name, ms in metrics)
+
+    def apply(self, response):
+        response.headers[SERVER_TIMING_HEADER] = self.header()
+        return response
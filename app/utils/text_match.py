@@ -1,6 +1,15 @@
 import unicodedata
+from collections import Counter
+from functools import lru_cache
+from typing import Callable, Hashable, Iterable, List, Optional, Tuple
 
 
+# Bounded memo sizes: product names plus recent order lines
+_NORMALIZE_CACHE_SIZE = 8192
+_TOKEN_CACHE_SIZE = 8192
+
+
+@lru_cache(maxsize=_NORMALIZE_CACHE_SIZE)
 def normalize_text(s: str) -> str:
     if not s:
         return ""
@@ -31,32 +40,105 @@ def levenshtein(a: str, b: str) -> int:
     return prev[-1]
 
 
-def similarity_score(query: str, target: str) -> int:
-    qa = normalize_text(query)
-    ta = normalize_text(target)
+def _banded_distance(a: str, b: str, k: int, prev: list, curr: list) -> int:
+    # Levenshtein limited to the diagonal band |i - j| <= k; k + 1 means "more than k".
+    # prev/curr are reusable buffers of at least len(b) + 2 items.
+    n, m = len(a), len(b)
+    big = k + 1
+    for j in range(min(m, k) + 1):
+        prev[j] = j
+    if k < m:
+        prev[k + 1] = big
+    for i in range(1, n + 1):
+        lo = i - k if i > k else 1
+        hi = i + k if i + k < m else m
+        left = curr[lo - 1] = i if lo == 1 else big
+        row_min = left
+        ca = a[i - 1]
+        for j in range(lo, hi + 1):
+            v = prev[j - 1] + (ca != b[j - 1])
+            if prev[j] + 1 < v:
+                v = prev[j] + 1
+            if left + 1 < v:
+                v = left + 1
+            if v > big:
+                v = big
+            curr[j] = left = v
+            if v < row_min:
+                row_min = v
+        if hi < m:
+            curr[hi + 1] = big
+        if row_min > k:
+            return big
+        prev, curr = curr, prev
+    return prev[m] if prev[m] <= k else big
+
+
+def levenshtein_bounded(a: str, b: str, max_dist: int, _buffers: Optional[list] = None) -> int:
+    """levenshtein(a, b) if it is <= max_dist, otherwise max_dist + 1 (stops early)."""
+    if max_dist < 0:
+        return 0 if a == b else max_dist + 1
+    if abs(len(a) - len(b)) > max_dist:
+        return max_dist + 1
+    # Common prefix and suffix do not change the distance
+    start = 0
+    end_a, end_b = len(a), len(b)
+    while start < end_a and start < end_b and a[start] == b[start]:
+        start += 1
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+    if len(a) > len(b):
+        a, b = b, a
+    if not a:
+        return len(b) if len(b) <= max_dist else max_dist + 1
+    if _buffers is None:
+        _buffers = [[0] * (len(b) + 2), [0] * (len(b) + 2)]
+    elif len(_buffers[0]) < len(b) + 2:
+        for buf in _buffers:
+            buf.extend([0] * (len(b) + 2 - len(buf)))
+    return _banded_distance(a, b, min(max_dist, len(b)), _buffers[0], _buffers[1])
+
+
+_SINGULAR_EXCEPTIONS = {"hass"}
+
+
+@lru_cache(maxsize=_TOKEN_CACHE_SIZE)
+def singularize_token(tok: str) -> str:
+    # Simple plural handling (es/ s) with exceptions
+    if not tok or len(tok) < 3:
+        return tok
+    if tok in _SINGULAR_EXCEPTIONS:
+        return tok
+    if tok.endswith("es") and len(tok) > 4:
+        return tok[:-2]
+    if tok.endswith("s") and len(tok) > 3:
+        return tok[:-1]
+    return tok
+
+
+@lru_cache(maxsize=_NORMALIZE_CACHE_SIZE)
+def name_tokens(normalized: str) -> frozenset:
+    return frozenset(singularize_token(t) for t in normalized.split())
+
+
+def prepare_name(name: str) -> Tuple[str, frozenset]:
+    """(normalized text, singularized token set) of a name."""
+    norm = normalize_text(name)
+    return norm, name_tokens(norm)
+
+
+def _normalized_score(qa: str, qs: frozenset, ta: str, ts: frozenset, min_score: int = 0,
+                      buffers: Optional[list] = None) -> int:
+    # similarity_score over already normalized text and token sets.
+    # With min_score > 0, edit-distance scores below min_score come back as 0.
     if not qa or not ta:
         return 0
     if qa == ta:
         return 100
     if qa in ta:
         return 90 if len(qa) >= 3 else 80
-    # Token-based overlap with simple plural handling (es/ s) and exceptions
-    def singularize_token(tok: str) -> str:
-        if not tok or len(tok) < 3:
-            return tok
-        exceptions = {"hass"}
-        if tok in exceptions:
-            return tok
-        if tok.endswith("es") and len(tok) > 4:
-            return tok[:-2]
-        if tok.endswith("s") and len(tok) > 3:
-            return tok[:-1]
-        return tok
-
-    q_tokens = [singularize_token(t) for t in qa.split()]
-    t_tokens = [singularize_token(t) for t in ta.split()]
-    qs = set(q_tokens)
-    ts = set(t_tokens)
     if qs and ts:
         inter = len(qs & ts)
         union = len(qs | ts) or 1
@@ -66,8 +148,136 @@ def similarity_score(query: str, target: str) -> int:
             return 85
         if jacc >= 0.4:
             return 75
-    dist = levenshtein(qa, ta)
     max_len = max(len(qa), len(ta)) or 1
+    if min_score > 0:
+        max_dist = max_len * (100 - min_score) // 100
+        dist = levenshtein_bounded(qa, ta, max_dist, buffers)
+        if dist > max_dist:
+            return 0
+    else:
+        dist = levenshtein(qa, ta)
     sim = int(100 * (1 - dist / max_len))
     return sim
 
+
+def similarity_score(query: str, target: str) -> int:
+    qa = normalize_text(query)
+    ta = normalize_text(target)
+    return _normalized_score(qa, name_tokens(qa), ta, name_tokens(ta))
+
+
+def score_many(query: str, names: Iterable[str], min_score: int = 0) -> List[int]:
+    """
+    similarity_score(query, name) for each name, normalizing the query once
+    and reusing the edit-distance buffers. With min_score > 0 scores below
+    it are returned as 0 (the edit distance stops early).
+    """
+    qa = normalize_text(query)
+    qs = name_tokens(qa)
+    buffers = [[], []]
+    scores = []
+    for name in names:
+        ta = normalize_text(name)
+        scores.append(_normalized_score(qa, qs, ta, name_tokens(ta), min_score, buffers))
+    return scores
+
+
+def _trigrams(normalized: str) -> Counter:
+    padded = f"$${normalized}$$"
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class NameIndex:
+    """
+    In-memory index of names for similarity_score lookups.
+
+    Candidates come from shared singularized tokens and shared padded
+    trigrams. Each edit changes at most 3 trigrams, so a name within
+    Levenshtein distance d shares at least len(query) + 2 - 3d of them, and
+    at least max(len) - d characters (bag distance). Names failing both
+    bounds cannot reach min_score, so the result is the same as scoring
+    every name, only cheaper.
+    """
+
+    def __init__(self, items: Iterable[Tuple[Hashable, str]],
+                 prepare: Callable[[Hashable, str], Tuple[str, frozenset]] = None):
+        self.keys: List[Hashable] = []
+        self.names: List[str] = []
+        self.normalized: List[str] = []
+        self.tokens: List[frozenset] = []
+        self._chars: List[Counter] = []
+        self._exact = {}
+        self._by_token = {}
+        self._by_gram = {}
+        self._by_length = {}
+        for key, name in items:
+            pos = len(self.keys)
+            norm, tokens = prepare(key, name) if prepare else prepare_name(name)
+            self.keys.append(key)
+            self.names.append(name)
+            self.normalized.append(norm)
+            self.tokens.append(tokens)
+            self._chars.append(Counter(norm))
+            if norm:
+                self._exact[norm] = pos  # last one wins, like {normalize_text(p.name): p}
+            for tok in tokens:
+                self._by_token.setdefault(tok, []).append(pos)
+            for gram, n in _trigrams(norm).items():
+                self._by_gram.setdefault(gram, []).append((pos, n))
+            self._by_length.setdefault(len(norm), []).append(pos)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def exact(self, name: str) -> Optional[Hashable]:
+        """Key whose normalized name equals normalize_text(name), if any."""
+        pos = self._exact.get(normalize_text(name))
+        return None if pos is None else self.keys[pos]
+
+    def candidates(self, qa: str, qs: frozenset, min_score: int) -> List[int]:
+        """Positions of every name that can score >= min_score against qa (normalized)."""
+        n = len(qa)
+        if not qa or n < 3 or min_score <= 0:
+            return list(range(len(self.keys))) if qa else []
+        found = set()
+        if min_score <= 85 and qs:
+            # Token overlap scores (85/75) need a subset or Jaccard >= 0.4
+            common = Counter()
+            for tok in qs:
+                common.update(self._by_token.get(tok, ()))
+            for pos, k in common.items():
+                size = len(self.tokens[pos])
+                if k == len(qs) or k == size or (min_score <= 75 and k / (len(qs) + size - k) >= 0.4):
+                    found.add(pos)
+        shared = Counter()
+        for gram, qn in _trigrams(qa).items():
+            for pos, tn in self._by_gram.get(gram, ()):
+                shared[pos] += min(qn, tn)
+        # Substrings of the name keep all n - 2 inner trigrams of the query
+        found.update(pos for pos, c in shared.items() if c >= n - 2)
+        chars = Counter(qa)
+        for length, positions in self._by_length.items():
+            longest = max(n, length)
+            max_dist = longest * (100 - min_score) // 100
+            if abs(length - n) > max_dist:
+                continue
+            bound = n + 2 - 3 * max_dist
+            for pos in positions:
+                if pos in found or (bound > 0 and shared.get(pos, 0) < bound):
+                    continue
+                if longest - sum((chars & self._chars[pos]).values()) <= max_dist:
+                    found.add(pos)
+        return sorted(found)
+
+    def search(self, query: str, min_score: int = 70, limit: Optional[int] = 5) -> List[Tuple[int, Hashable, str]]:
+        """(score, key, name) with score >= min_score, best first (ties keep index order)."""
+        qa = normalize_text(query)
+        qs = name_tokens(qa)
+        scored = []
+        buffers = [[], []]
+        for pos in self.candidates(qa, qs, min_score):
+            s = _normalized_score(qa, qs, self.normalized[pos], self.tokens[pos], min_score, buffers)
+            if s >= min_score:
+                scored.append((s, self.keys[pos], self.names[pos]))
+        scored.sort(key=lambda x: -x[0])
+        return scored if limit is None else scored[:limit]
@@ -0,0 +1,13 @@
+"""
+Benchmarks de la API con datos sintéticos.
+
+- seed: crea una base (SQLite o PostgreSQL local) con volúmenes configurables
+  de clientes, productos, pedidos, items, compras, cargos y pagos.
+- run: recorre los endpoints de contabilidad y KPIs con el test client de
+  Flask y guarda percentiles de latencia y cantidad de sentencias SQL por
+  request en un JSON comparable entre commits.
+
+Uso:
+    python -m benchmarks.run --orders 2000 --out bench.json
+    python -m benchmarks.run --orders 2000 --compare bench.json
+"""
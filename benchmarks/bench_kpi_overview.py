@@ -0,0 +1,343 @@
+"""
+Benchmark: ticket promedio de /admin/kpis/overview con agregados en SQL
+(services/kpi_overview) vs la versión que cargaba pedidos, cargos y compras
+en Python y buscaba cada cliente con Customer.query.get.
+
+Crea una base SQLite temporal con N pedidos sintéticos (cargos cancelados,
+charged_qty en 0/NULL, compras sin price_total, clientes borrados), verifica
+que ambos cálculos coincidan en varios rangos de fechas y reporta tiempos y
+sentencias SQL. Se compara en tres etapas: todo en vivo (sin `kpis-refresh`
+previo), desde los hechos diarios recién refrescados y con días pendientes
+(cargos cancelados después del refresco); en cada etapa también compara
+/admin/kpis/productos-top (orden por ingresos, top 10). Al final compara los
+bloques de recompra y clientes (services/cohorts) con las consultas
+anteriores.
+
+Uso:
+    python benchmarks/bench_kpi_overview.py [--orders 2000] [--repeat 3]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# (desde, hasta) de los rangos comparados; None = sin límite
+RANGES = [
+    (None, None),
+    (date(2025, 1, 1), date(2025, 1, 31)),
+    (date(2025, 2, 10), None),
+    (None, date(2025, 1, 15)),
+    (date(2030, 1, 1), date(2030, 1, 31)),
+]
+
+
+def _setup(num_orders: int, seed: int = 11):
+    db_path = os.path.join(tempfile.mkdtemp(prefix="kivi-bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+    import app.models.user  # noqa: F401 (create_app necesita users antes que orders)
+    from app import create_app
+    from app.db import db
+    from app.models.charge import Charge
+    from app.models.customer import Customer
+    from app.models.order import Order
+    from app.models.product import Product
+    from app.models.purchase import Purchase
+
+    flask_app = create_app()
+    rnd = random.Random(seed)
+    start = datetime(2024, 12, 1, 9, 0)
+    with flask_app.app_context():
+        db.session.execute(db.insert(Product), [{"id": i, "name": f"Producto {i}"} for i in range(1, 81)])
+        # los ids 191..200 quedan sin cliente (cargos de clientes borrados)
+        db.session.execute(db.insert(Customer), [{"id": i, "name": f"Cliente {i}"} for i in range(1, 191)])
+        db.session.execute(db.insert(Order), [
+            {"id": i, "title": f"Pedido {i}", "status": rnd.choice(("emitido", "emitido", "draft")),
+             "created_at": start + timedelta(hours=i * 24 * 120 // num_orders + rnd.randint(0, 48))}
+            for i in range(1, num_orders + 1)
+        ])
+        charges, purchases = [], []
+        for order_id in range(1, num_orders + 1):
+            for _ in range(rnd.randint(0, 3)):
+                charges.append({
+                    # los clientes se van sumando con el tiempo (nuevos, recompra y activos varían por rango)
+                    "order_id": order_id, "customer_id": rnd.randint(1, min(200, 5 + order_id * 200 // num_orders)),
+                    "product_id": rnd.randint(1, 80),
+                    "qty": rnd.choice((0.0, 0.5, 1.0, 2.0, 3.0)), "charged_qty": rnd.choice((None, 0.0, 1.25, 2.5)),
+                    "unit": "kg", "unit_price": rnd.choice((0.0, 990.0, 1490.0, 2300.0)),
+                    "status": rnd.choice(("pending", "pending", "paid", "cancelled")),
+                })
+            for _ in range(rnd.randint(0, 5)):
+                purchases.append({
+                    "order_id": order_id, "product_id": rnd.randint(1, 80),
+                    "charged_unit": rnd.choice((None, "", "kg", "unit")),
+                    "qty_kg": rnd.choice((None, 1.0, 2.0, 4.0)), "qty_unit": rnd.choice((None, 2.0, 6.0)),
+                    "price_total": rnd.choice((None, 0.0, 1500.0, 4200.0)),
+                    "price_per_unit": rnd.choice((None, 700.0, 1100.0)),
+                })
+        db.session.execute(db.insert(Charge), charges)
+        db.session.execute(db.insert(Purchase), purchases)
+        db.session.commit()
+    return flask_app, len(charges), len(purchases)
+
+
+def run_legacy(date_from, date_to):
+    # Copia de la versión anterior del bloque "1. TICKET PROMEDIO" de get_kpis_overview
+    from sqlalchemy import func
+    from app.models.charge import Charge
+    from app.models.customer import Customer
+    from app.models.order import Order
+    from app.models.purchase import Purchase
+
+    orders_query = Order.query
+    if date_from:
+        orders_query = orders_query.filter(func.date(Order.created_at) >= date_from)
+    if date_to:
+        orders_query = orders_query.filter(func.date(Order.created_at) <= date_to)
+    orders = orders_query.all()
+    order_ids = [o.id for o in orders]
+    if not orders:
+        return {
+            'total': 0, 'utilidad': 0, 'costos': 0, 'num_pedidos': 0, 'num_clientes': 0,
+            'promedio_por_pedido': 0, 'promedio_por_cliente': 0, 'margen_utilidad_porcentaje': 0,
+            'desglose_clientes': []
+        }
+    charges = Charge.query.filter(Charge.order_id.in_(order_ids), Charge.status != 'cancelled').all()
+    total_billed = sum((c.charged_qty or c.qty or 0) * (c.unit_price or 0) for c in charges)
+    purchases = Purchase.query.filter(Purchase.order_id.in_(order_ids)).all()
+    total_costs = 0
+    for p in purchases:
+        if p.price_total:
+            total_costs += float(p.price_total)
+        else:
+            unit = p.charged_unit or 'kg'
+            qty = float(p.qty_kg or 0) if unit == 'kg' else float(p.qty_unit or 0)
+            total_costs += float(p.price_per_unit or 0) * qty
+    utilidad = total_billed - total_costs
+    customer_totals = {}
+    for c in charges:
+        if c.customer_id:
+            amount = (c.charged_qty or c.qty or 0) * (c.unit_price or 0)
+            data = customer_totals.setdefault(c.customer_id, {'total': 0, 'num_pedidos': set()})
+            data['total'] += amount
+            data['num_pedidos'].add(c.order_id)
+    customer_breakdown = []
+    for cid, data in customer_totals.items():
+        customer = Customer.query.get(cid)
+        customer_breakdown.append({
+            'customer_id': cid,
+            'customer_name': customer.name if customer else f'Cliente {cid}',
+            'total': round(data['total'], 2),
+            'num_pedidos': len(data['num_pedidos']),
+            'promedio_por_pedido': round(data['total'] / len(data['num_pedidos']), 2) if len(data['num_pedidos']) > 0 else 0
+        })
+    customer_breakdown.sort(key=lambda x: x['total'], reverse=True)
+    num_clientes = len(customer_totals)
+    return {
+        'total': round(total_billed, 2),
+        'utilidad': round(utilidad, 2),
+        'costos': round(total_costs, 2),
+        'num_pedidos': len(orders),
+        'num_clientes': num_clientes,
+        'promedio_por_pedido': round(total_billed / len(orders), 2) if len(orders) > 0 else 0,
+        'promedio_por_cliente': round(total_billed / num_clientes, 2) if num_clientes > 0 else 0,
+        'margen_utilidad_porcentaje': round((utilidad / total_billed * 100), 2) if total_billed > 0 else 0,
+        'desglose_clientes': customer_breakdown
+    }
+
+
+def run_legacy_customers(date_from, date_to, fecha_limite, inicio_mes):
+    # Copia de la versión anterior de los bloques "2. TASA DE RECOMPRA" y "3. CLIENTES ACTIVOS"
+    from sqlalchemy import func
+    from app.db import db
+    from app.models.charge import Charge
+    from app.models.order import Order
+
+    query = db.session.query(
+        Charge.customer_id, func.count(func.distinct(Charge.order_id)).label('num_orders')
+    ).join(Order, Charge.order_id == Order.id).filter(Charge.status != 'cancelled', Charge.customer_id.isnot(None))
+    if date_from:
+        query = query.filter(func.date(Order.created_at) >= date_from)
+    if date_to:
+        query = query.filter(func.date(Order.created_at) <= date_to)
+    customers_with_orders = query.group_by(Charge.customer_id).all()
+    activos = db.session.query(func.count(func.distinct(Charge.customer_id))).join(
+        Order, Charge.order_id == Order.id
+    ).filter(
+        func.date(Order.created_at) >= fecha_limite, Charge.status != 'cancelled', Charge.customer_id.isnot(None)
+    ).scalar() or 0
+    historico = db.session.query(func.count(func.distinct(Charge.customer_id))).filter(
+        Charge.customer_id.isnot(None)
+    ).scalar() or 0
+    este_mes = set(c.customer_id for c in Charge.query.join(Order, Charge.order_id == Order.id).filter(
+        func.date(Order.created_at) >= inicio_mes, Charge.customer_id.isnot(None)).all())
+    antes_mes = set(c.customer_id for c in Charge.query.join(Order, Charge.order_id == Order.id).filter(
+        func.date(Order.created_at) < inicio_mes, Charge.customer_id.isnot(None)).all())
+    return (len(customers_with_orders), len([c for c in customers_with_orders if c.num_orders > 1]),
+            activos, historico, len(este_mes - antes_mes))
+
+
+def run_service_customers(date_from, date_to, fecha_limite, inicio_mes):
+    from app.services.cohorts import customer_stats
+    stats = customer_stats(date_from, date_to, 15, fecha_limite, inicio_mes)
+    recompra, clientes = stats['tasa_recompra'], stats['clientes']
+    return (recompra['total_clientes'], recompra['recompraron'],
+            clientes['activos'], clientes['total_historico'], clientes['nuevos_mes'])
+
+
+def run_legacy_top(date_from, date_to, limit=10):
+    # Copia de la versión anterior de get_top_products (sort_by=revenue)
+    from sqlalchemy import func
+    from app.db import db
+    from app.models.charge import Charge
+    from app.models.order import Order
+    from app.models.product import Product
+    from app.models.purchase import Purchase
+
+    query = db.session.query(
+        Charge.product_id, func.sum(Charge.charged_qty), func.sum(Charge.charged_qty * Charge.unit_price)
+    ).join(Order, Charge.order_id == Order.id).filter(
+        Charge.status != 'cancelled', Charge.product_id.isnot(None),
+        Charge.charged_qty.isnot(None), Charge.unit_price.isnot(None)
+    )
+    costs_query = db.session.query(Purchase.product_id, func.sum(Purchase.price_total)).join(
+        Order, Purchase.order_id == Order.id
+    ).filter(Purchase.product_id.isnot(None))
+    if date_from:
+        query = query.filter(func.date(Order.created_at) >= date_from)
+        costs_query = costs_query.filter(func.date(Order.created_at) >= date_from)
+    if date_to:
+        query = query.filter(func.date(Order.created_at) <= date_to)
+        costs_query = costs_query.filter(func.date(Order.created_at) <= date_to)
+    costs_data = {pid: float(cost or 0) for pid, cost in costs_query.group_by(Purchase.product_id).all()}
+    result = []
+    for product_id, qty, revenue in query.group_by(Charge.product_id).all():
+        product = db.session.get(Product, product_id)
+        if product:
+            cost = costs_data.get(product_id, 0)
+            result.append((product_id, product.name, round(float(qty or 0), 2), round(float(revenue or 0), 2),
+                           round(cost, 2), round(float(revenue or 0) - cost, 2)))
+    result.sort(key=lambda x: x[3], reverse=True)
+    return result[:limit]
+
+
+def run_service_top(date_from, date_to, limit=10):
+    import heapq
+    from app.services.kpi_facts import product_totals
+    top = heapq.nlargest(limit, product_totals(date_from, date_to), key=lambda t: round(t.revenue, 2))
+    return [(t.product_id, t.name, round(t.qty, 2), round(t.revenue, 2), round(t.cost, 2), round(t.profit, 2))
+            for t in top]
+
+
+def _cancel_some_charges(db):
+    # escritura por la sesión: anota los días en kpi_dirty_days sin refrescarlos
+    from app.models.charge import Charge
+    for charge in Charge.query.filter(Charge.status == 'pending', Charge.id % 37 == 0).all():
+        charge.status = 'cancelled'
+    db.session.commit()
+
+
+def run_service(date_from, date_to):
+    from app.services.kpi_overview import ticket_overview
+    return ticket_overview(date_from, date_to)
+
+
+def _close(a, b, tol=0.011) -> bool:
+    # los montos se redondean a 2 decimales: sumas en otro orden pueden diferir en el último
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_close(a[k], b[k], tol) for k in a)
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(_close(x, y, tol) for x, y in zip(a, b))
+    if isinstance(a, float) or isinstance(b, float):
+        return abs(a - b) <= tol
+    return a == b
+
+
+def _breakdown_key(result):
+    # empates de total (ya redondeado) pueden quedar en otro orden
+    result = dict(result)
+    result['desglose_clientes'] = sorted(result['desglose_clientes'], key=lambda x: (-x['total'], x['customer_id']))
+    return result
+
+
+def _timed(fn, repeat, engine):
+    from sqlalchemy import event
+    statements = [0]
+
+    def count(*_):
+        statements[0] += 1
+
+    best = None
+    result = None
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        for _ in range(repeat):
+            statements[0] = 0
+            start = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    return best, statements[0], result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    flask_app, num_charges, num_purchases = _setup(args.orders)
+    print(f"pedidos={args.orders} cargos={num_charges} compras={num_purchases}")
+    mismatches = []
+    with flask_app.app_context():
+        from app.db import db
+        from app.services.kpi_facts import refresh_kpi_facts
+        for stage in ("vivo", "hechos", "pendientes"):
+            if stage == "hechos":
+                start = time.perf_counter()
+                result = refresh_kpi_facts()
+                print(f"kpis-refresh: {result['days']} días en {(time.perf_counter() - start) * 1000:.1f} ms")
+            elif stage == "pendientes":
+                _cancel_some_charges(db)
+            print(f"-- {stage}")
+            for date_from, date_to in RANGES:
+                db.session.expire_all()
+                legacy_time, legacy_sql, legacy = _timed(lambda: run_legacy(date_from, date_to), args.repeat, db.engine)
+                db.session.expire_all()
+                service_time, service_sql, service = _timed(lambda: run_service(date_from, date_to), args.repeat, db.engine)
+                if not _close(_breakdown_key(legacy), _breakdown_key(service)):
+                    mismatches.append((stage, date_from, date_to))
+                label = f"{date_from or '-'}..{date_to or '-'}"
+                print(f"{label:24s} python {legacy_time * 1000:8.1f} ms ({legacy_sql:4d} SQL)"
+                      f"   sql {service_time * 1000:8.1f} ms ({service_sql:2d} SQL)"
+                      f"   clientes={service['num_clientes']}")
+                if not _close(run_legacy_top(date_from, date_to), run_service_top(date_from, date_to)):
+                    mismatches.append((stage, "productos-top", date_from, date_to))
+        print("-- clientes (recompra, activos, histórico, nuevos del mes)")
+        for (date_from, date_to), limit in zip(RANGES, (date(2025, 3, 1), date(2025, 1, 20), date(2025, 2, 1),
+                                                        date(2024, 12, 15), date(2030, 1, 1))):
+            db.session.expire_all()
+            legacy_time, legacy_sql, legacy = _timed(
+                lambda: run_legacy_customers(date_from, date_to, limit, limit), args.repeat, db.engine)
+            db.session.expire_all()
+            service_time, service_sql, service = _timed(
+                lambda: run_service_customers(date_from, date_to, limit, limit), args.repeat, db.engine)
+            if legacy != service:
+                mismatches.append(("clientes", date_from, date_to))
+            label = f"{date_from or '-'}..{date_to or '-'}"
+            print(f"{label:24s} python {legacy_time * 1000:8.1f} ms ({legacy_sql:4d} SQL)"
+                  f"   cohortes {service_time * 1000:8.1f} ms ({service_sql:2d} SQL)   {service}")
+    print(f"diferencias: {len(mismatches)}" + (f" (rangos {mismatches})" if mismatches else ""))
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmark: parser de pedidos (services/order_parser) vs la versión anterior.
+
+Genera un texto tipo exportación de WhatsApp con N líneas, verifica que
+ambos parsers entreguen los mismos items y reporta throughput en líneas/s.
+También lee el mismo texto desde un archivo con iter_parse_orders y mide el
+pico de memoria (tracemalloc) sin acumular los items.
+
+Uso:
+    python benchmarks/bench_order_parser.py [--lines 50000] [--repeat 3]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app.services.order_parser import (  # noqa: E402
+    BULLETS, ZERO_WIDTH, _norm_unit, _to_float, iter_parse_orders, parse_orders_text,
+)
+
+
+# --- Copia de la versión anterior de parse_orders_text ---
+
+def _legacy_clean_line(text):
+    if not text:
+        return ""
+    for ch in ZERO_WIDTH:
+        text = text.replace(ch, "")
+    text = text.strip()
+    text = re.sub(rf"^[{re.escape(BULLETS)}\s]+", "", text)
+    return text.strip()
+
+
+def _legacy_parse_line(line):
+    original = line
+    line = _legacy_clean_line(line)
+    if not line:
+        return {}
+    m = re.search(r"\(([^)]*)\)", line)
+    if m:
+        without_paren, paren_notes = (line[: m.start()] + line[m.end():]).strip(), m.group(1).strip()
+    else:
+        without_paren, paren_notes = line.strip(), ""
+    m = re.match(rf"^(?P<qty>[0-9]+(?:[\.,][0-9]+)?)\s*(?P<u1>(?:k|kg|kilo|kilos|u|uni|unidad|unidades|unit|gr|g)\.?)?\b\s*(?:de\s+)?(?P<rest>.+)$", without_paren, re.IGNORECASE)
+    if m:
+        return {"product": m.group("rest").strip(), "qty": _to_float(m.group("qty")),
+                "unit": _norm_unit(m.group("u1") or "unit"), "notes": paren_notes, "_raw": original}
+    m = re.match(rf"^(?P<p>.+?)\s+(?:de\s+)?(?P<qty>[0-9]+(?:[\.,][0-9]+)?)\s*(?P<u3>(?:k|kg|kilo|kilos|u|uni|unidad|unidades|unit|gr|g)\.?)\b\s*$", without_paren, re.IGNORECASE)
+    if m:
+        return {"product": m.group("p").strip(), "qty": _to_float(m.group("qty")),
+                "unit": _norm_unit(m.group("u3")), "notes": paren_notes, "_raw": original}
+    m = re.match(r"^(?P<p>.+?)\s+(?P<qty>[0-9]+(?:[\.,][0-9]+)?)\s*$", without_paren)
+    if m:
+        return {"product": m.group("p").strip(), "qty": _to_float(m.group("qty")),
+                "unit": "unit", "notes": paren_notes, "_raw": original}
+    m = re.match(r"^(?P<qty>[0-9]+(?:[\.,][0-9]+)?)\s+(?P<rest>.+)$", without_paren)
+    if m:
+        return {"product": m.group("rest").strip(), "qty": _to_float(m.group("qty")),
+                "unit": "unit", "notes": paren_notes, "_raw": original}
+    if re.search(r"\b(paquete|bandeja)\b", without_paren, re.IGNORECASE):
+        return {"product": without_paren, "qty": 1.0, "unit": "unit", "notes": paren_notes, "_raw": original}
+    return {"product": without_paren, "qty": 1.0, "unit": "unit", "notes": paren_notes, "_raw": original}
+
+
+def legacy_parse_orders_text(text):
+    items = []
+    current_customer = None
+    for idx, raw_line in enumerate(text.splitlines()):
+        line = _legacy_clean_line(raw_line)
+        if not line:
+            continue
+        mb = re.match(r"^pedido\s+(.+)$", line, re.IGNORECASE)
+        if mb:
+            current_customer = mb.group(1).strip()
+            continue
+        parsed = _legacy_parse_line(line)
+        if not parsed:
+            continue
+        parsed["customer"] = current_customer or (parsed.get("customer") or "")
+        parsed["line_index"] = idx
+        items.append(parsed)
+    return items
+
+
+# --- Datos ---
+
+PRODUCTS = ["palta hass", "tomate", "limones", "manzana verde", "lechuga costina", "cebolla morada", "papas",
+            "frutilla", "plátano", "zanahoria", "ají verde", "cilantro", "uva sin semilla", "bandeja de champiñones"]
+
+
+def whatsapp_export(num_lines: int, seed: int = 7) -> str:
+    rnd = random.Random(seed)
+    lines = []
+    while len(lines) < num_lines:
+        lines.append(f"Pedido Cliente {rnd.randint(1, 500)}")
+        for _ in range(rnd.randint(3, 12)):
+            product = rnd.choice(PRODUCTS)
+            qty = rnd.choice(("1", "2", "1,5", "0.5", "3", "500"))
+            unit = rnd.choice(("kg", "k", "kilos", "u", "unidades", "gr", ""))
+            fmt = rnd.random()
+            if fmt < 0.4:
+                line = f"{qty} {unit} de {product}" if unit else f"{qty} {product}"
+            elif fmt < 0.7:
+                line = f"{product} {qty}{unit}"
+            else:
+                line = f"{product}"
+            if rnd.random() < 0.2:
+                line += " (bien maduros)"
+            if rnd.random() < 0.3:
+                line = rnd.choice(("\u2022 ", "- ", "* ", "\u200b")) + line
+            lines.append(line)
+        lines.append("")
+    return "\n".join(lines[:num_lines])
+
+
+def _best(fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    text = whatsapp_export(args.lines)
+    legacy_time, legacy = _best(lambda: legacy_parse_orders_text(text), args.repeat)
+    new_time, new = _best(lambda: parse_orders_text(text), args.repeat)
+
+    path = os.path.join(tempfile.mkdtemp(prefix="kivi-bench-"), "chat.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    tracemalloc.start()
+    start = time.perf_counter()
+    with open(path, encoding="utf-8") as f:
+        streamed = sum(1 for _ in iter_parse_orders(f))
+    stream_time = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"líneas={args.lines} items={len(new)}")
+    print(f"parser anterior      : {args.lines / legacy_time:12,.0f} líneas/s")
+    print(f"parse_orders_text    : {args.lines / new_time:12,.0f} líneas/s  ({legacy_time / new_time:.1f}x)")
+    print(f"iter_parse_orders(f) : {args.lines / stream_time:12,.0f} líneas/s  (tracemalloc, pico {peak / 1024:.0f} KiB)")
+    print(f"diferencias: {sum(1 for a, b in zip(legacy, new) if a != b) + abs(len(legacy) - len(new))}"
+          f" (streaming: {streamed - len(new)})")
+
+
+if __name__ == "__main__":
+    main()
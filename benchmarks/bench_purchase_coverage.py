@@ -0,0 +1,205 @@
+"""
+Benchmark: cobertura de compras (services/purchase_coverage) vs los loops
+por pedido que usaban /accounting/orders y /accounting/excess.
+
+Crea una base SQLite temporal con N pedidos sintéticos, verifica que ambos
+cálculos coincidan y reporta tiempos.
+
+Uso:
+    python benchmarks/bench_purchase_coverage.py [--orders 1000] [--repeat 3]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _setup(num_orders: int, seed: int = 7):
+    db_path = os.path.join(tempfile.mkdtemp(prefix="kivi-bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+    import app.models.user  # noqa: F401 (create_app necesita users antes que orders)
+    from app import create_app
+    from app.db import db
+    from app.models.customer import Customer
+    from app.models.order import Order
+    from app.models.order_item import OrderItem
+    from app.models.product import Product
+    from app.models.purchase import Purchase
+
+    flask_app = create_app()
+    rnd = random.Random(seed)
+    with flask_app.app_context():
+        db.session.execute(db.insert(Product), [{"id": i, "name": f"Producto {i}"} for i in range(1, 81)])
+        db.session.execute(db.insert(Customer), [{"id": i, "name": f"Cliente {i}"} for i in range(1, 201)])
+        db.session.execute(db.insert(Order), [{"id": i, "title": f"Pedido {i}", "status": "emitido"} for i in range(1, num_orders + 1)])
+        items, purchases = [], []
+        for order_id in range(1, num_orders + 1):
+            products = rnd.sample(range(1, 81), 6)
+            for pid in products:
+                for _ in range(rnd.randint(1, 3)):
+                    unit = rnd.choice(("kg", "kg", "unit"))
+                    items.append({
+                        "order_id": order_id, "customer_id": rnd.randint(1, 200), "product_id": pid,
+                        "qty": rnd.choice((0.5, 1.0, 1.5, 2.0, 3.0)), "unit": unit,
+                        "charged_unit": rnd.choice((unit, "kg")),
+                        "charged_qty": rnd.choice((None, 1.0, 2.5)),
+                    })
+            for pid in products[:rnd.randint(0, 6)] + rnd.sample(range(1, 81), 1):
+                charged_unit = rnd.choice(("kg", "unit"))
+                purchases.append({
+                    "order_id": order_id, "product_id": pid, "charged_unit": charged_unit,
+                    "qty_kg": rnd.choice((None, 1.0, 2.0, 4.0)), "qty_unit": rnd.choice((None, 2.0, 6.0)),
+                    "eq_qty_kg": rnd.choice((None, 0.5)), "eq_qty_unit": rnd.choice((None, 3.0)),
+                    "price_total": 1000.0,
+                })
+        db.session.execute(db.insert(OrderItem), items)
+        db.session.execute(db.insert(Purchase), purchases)
+        db.session.commit()
+    return flask_app, len(items), len(purchases)
+
+
+def _legacy_requested(items, purchases):
+    # Copia de la versión anterior de accounting_engine._purchase_coverage
+    needed_by_product = {}
+    for item in items:
+        pid = item.product_id
+        unit = item.unit or "kg"
+        if pid not in needed_by_product:
+            needed_by_product[pid] = {"kg": 0.0, "unit": 0.0}
+        needed_by_product[pid][unit] = needed_by_product[pid].get(unit, 0.0) + float(item.qty or 0.0)
+    purchased_by_product = {}
+    for purchase in purchases:
+        pid = purchase.product_id
+        if pid not in purchased_by_product:
+            purchased_by_product[pid] = {"kg": 0.0, "unit": 0.0}
+        if purchase.qty_kg:
+            purchased_by_product[pid]["kg"] += float(purchase.qty_kg or 0.0)
+        if purchase.eq_qty_kg is not None:
+            purchased_by_product[pid]["kg"] += float(purchase.eq_qty_kg or 0.0)
+        if purchase.qty_unit:
+            purchased_by_product[pid]["unit"] += float(purchase.qty_unit or 0.0)
+        if purchase.eq_qty_unit is not None:
+            purchased_by_product[pid]["unit"] += float(purchase.eq_qty_unit or 0.0)
+    status = "complete"
+    has_excess = False
+    for pid, needed in needed_by_product.items():
+        purchased = purchased_by_product.get(pid, {"kg": 0.0, "unit": 0.0})
+        need_kg, need_unit = needed.get("kg", 0.0), needed.get("unit", 0.0)
+        got_kg, got_unit = purchased.get("kg", 0.0), purchased.get("unit", 0.0)
+        if not ((need_kg == 0 or got_kg >= need_kg) and (need_unit == 0 or got_unit >= need_unit)):
+            status = "incomplete"
+        if (need_kg > 0 and got_kg > need_kg) or (need_unit > 0 and got_unit > need_unit):
+            has_excess = True
+    if status == "complete" and has_excess:
+        status = "over"
+    return status, needed_by_product, purchased_by_product
+
+
+def _legacy_charged(items, purchases):
+    # Copia de la versión anterior de calculate_excess (sin nombres de producto)
+    needed_by_product = {}
+    for item in items:
+        pid = item.product_id
+        charged_unit = item.charged_unit or item.unit or "kg"
+        charged_qty = item.charged_qty if item.charged_qty is not None else float(item.qty or 0.0)
+        if pid not in needed_by_product:
+            needed_by_product[pid] = {"unit": charged_unit, "qty": 0.0}
+        needed_by_product[pid]["qty"] += charged_qty
+    purchased_by_product = {}
+    for purchase in purchases:
+        pid = purchase.product_id
+        charged_unit = purchase.charged_unit or "kg"
+        if pid not in purchased_by_product:
+            purchased_by_product[pid] = {"unit": charged_unit, "qty": 0.0}
+        if charged_unit == "kg":
+            purchased_by_product[pid]["qty"] += float(purchase.qty_kg or 0.0)
+            if purchase.eq_qty_kg:
+                purchased_by_product[pid]["qty"] += float(purchase.eq_qty_kg or 0.0)
+        else:
+            purchased_by_product[pid]["qty"] += float(purchase.qty_unit or 0.0)
+            if purchase.eq_qty_unit:
+                purchased_by_product[pid]["qty"] += float(purchase.eq_qty_unit or 0.0)
+    excesses = []
+    for pid, purchased in purchased_by_product.items():
+        needed = needed_by_product.get(pid, {"unit": purchased["unit"], "qty": 0.0})
+        excess_qty = purchased["qty"] - needed["qty"]
+        if excess_qty > 0.01:
+            excesses.append((pid, round(excess_qty, 2)))
+    return excesses
+
+
+def run_legacy(order_ids):
+    from app.models.order_item import OrderItem
+    from app.models.purchase import Purchase
+    out = {}
+    for order_id in order_ids:
+        items = OrderItem.query.filter_by(order_id=order_id).all()
+        purchases = Purchase.query.filter_by(order_id=order_id).all()
+        out[order_id] = (_legacy_requested(items, purchases), _legacy_charged(items, purchases))
+    return out
+
+
+def run_service(order_ids):
+    from app.services.purchase_coverage import load_coverage
+    coverage = load_coverage(order_ids)
+    out = {}
+    for order_id in order_ids:
+        status, _, _ = coverage.requested_status(order_id)
+        needed, purchased = coverage.requested(order_id)
+        excesses = [(e["product_id"], round(e["excess_qty"], 2)) for e in coverage.excesses(order_id)]
+        out[order_id] = ((status, needed, purchased), excesses)
+    return out
+
+
+def _close(a, b, tol=1e-9) -> bool:
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_close(a[k], b[k], tol) for k in a)
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(_close(x, y, tol) for x, y in zip(a, b))
+    if isinstance(a, float) or isinstance(b, float):
+        return abs(a - b) <= tol
+    return a == b
+
+
+def _timed(fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    flask_app, num_items, num_purchases = _setup(args.orders)
+    with flask_app.app_context():
+        from app.db import db
+        from app.models.order import Order
+        order_ids = [oid for (oid,) in db.session.query(Order.id).order_by(Order.id).all()]
+
+        legacy_time, legacy = _timed(lambda: run_legacy(order_ids), args.repeat)
+        service_time, service = _timed(lambda: run_service(order_ids), args.repeat)
+
+    mismatches = [oid for oid in order_ids if not _close(legacy[oid], service[oid])]
+    print(f"pedidos={len(order_ids)} items={num_items} compras={num_purchases}")
+    print(f"loops por pedido : {legacy_time * 1000:9.1f} ms")
+    print(f"purchase_coverage: {service_time * 1000:9.1f} ms  ({legacy_time / service_time:.1f}x)")
+    print(f"diferencias: {len(mismatches)}" + (f" (pedidos {mismatches[:10]})" if mismatches else ""))
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
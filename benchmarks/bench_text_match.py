@@ -0,0 +1,122 @@
+"""
+Benchmark: búsqueda de productos por nombre aproximado (utils/text_match).
+
+Sobre un catálogo sintético de N productos compara, para cada consulta con
+errores de tipeo:
+
+- similarity_score contra todo el catálogo (como hacían /orders/parse y
+  /orders/validate)
+- score_many contra todo el catálogo, con corte en min_score
+- NameIndex.search (candidatos por trigramas/tokens + score_many)
+
+y levenshtein completo vs levenshtein_bounded sobre los mismos pares.
+Verifica que las sugerencias (top 5 con score >= min_score) coincidan.
+
+Uso:
+    python benchmarks/bench_text_match.py [--products 2000] [--queries 100] [--min-score 70]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app.utils.text_match import (  # noqa: E402
+    NameIndex, levenshtein, levenshtein_bounded, normalize_text, score_many, similarity_score,
+)
+
+
+WORDS = [
+    "palta", "hass", "tomate", "cherry", "limón", "sutil", "manzana", "verde", "roja", "fuji", "pera", "cebolla",
+    "morada", "papa", "nueva", "lechuga", "española", "costina", "ají", "zanahoria", "frutilla", "plátano",
+    "naranja", "jugo", "uva", "sin", "semilla", "kiwi", "choclo", "zapallo", "italiano", "pimentón", "rojo",
+    "amarillo", "brócoli", "coliflor", "apio", "espárragos", "betarraga", "pepino", "ensalada", "cilantro",
+    "perejil", "albahaca", "orgánico", "granel", "malla", "bandeja", "cajón", "chico", "grande", "extra",
+]
+
+
+def catalogue(size: int, rnd: random.Random) -> list:
+    names = set()
+    while len(names) < size:
+        names.add(" ".join(rnd.sample(WORDS, rnd.randint(1, 4))).capitalize())
+    return sorted(names)
+
+
+def typo(name: str, rnd: random.Random) -> str:
+    chars = list(name.lower())
+    for _ in range(rnd.randint(0, 3)):
+        i = rnd.randrange(len(chars) + 1)
+        op = rnd.random()
+        if op < 0.33 and i < len(chars):
+            del chars[i]
+        elif op < 0.66:
+            chars.insert(i, rnd.choice("aeilmnoprstu"))
+        elif i < len(chars):
+            chars[i] = rnd.choice("aeilmnoprstu")
+    return "".join(chars)
+
+
+def top(scored, min_score, limit=5):
+    ranked = sorted(scored, key=lambda x: -x[0])
+    return [(s, i) for s, i in ranked if s >= min_score][:limit]
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--min-score", type=int, default=70)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    names = catalogue(args.products, rnd)
+    queries = [typo(rnd.choice(names), rnd) for _ in range(args.queries)]
+    # Consultas de una palabra, como las líneas cortas de un pedido
+    queries += [typo(rnd.choice(WORDS), rnd) for _ in range(args.queries // 2)]
+    ms = args.min_score
+
+    full_time, full = _timed(lambda: [
+        top(((similarity_score(q, n), i) for i, n in enumerate(names)), ms) for q in queries
+    ])
+    many_time, many = _timed(lambda: [
+        top(zip(score_many(q, names, min_score=ms), range(len(names))), ms) for q in queries
+    ])
+    build_time, index = _timed(lambda: NameIndex(enumerate(names)))
+    index_time, indexed = _timed(lambda: [
+        [(s, key) for s, key, _ in index.search(q, min_score=ms)] for q in queries
+    ])
+
+    pairs = [(normalize_text(q), normalize_text(n)) for q in queries[:50] for n in names[:200]]
+    lev_time, lev = _timed(lambda: [levenshtein(a, b) for a, b in pairs])
+    bounded_time, bounded = _timed(lambda: [
+        levenshtein_bounded(a, b, max(len(a), len(b)) * (100 - ms) // 100) for a, b in pairs
+    ])
+    lev_mismatches = sum(
+        1 for (a, b), d, bd in zip(pairs, lev, bounded)
+        if min(d, max(len(a), len(b)) * (100 - ms) // 100 + 1) != bd
+    )
+
+    print(f"productos={len(names)} consultas={len(queries)} min_score={ms}")
+    print(f"similarity_score x catálogo : {full_time * 1000:9.1f} ms")
+    print(f"score_many x catálogo       : {many_time * 1000:9.1f} ms  ({full_time / many_time:.1f}x)")
+    print(f"NameIndex.search            : {index_time * 1000:9.1f} ms  ({full_time / index_time:.1f}x)"
+          f"  + construcción {build_time * 1000:.1f} ms")
+    print(f"levenshtein completo        : {lev_time * 1000:9.1f} ms  ({len(pairs)} pares)")
+    print(f"levenshtein_bounded         : {bounded_time * 1000:9.1f} ms  ({lev_time / bounded_time:.1f}x)")
+    print(f"diferencias: score_many={sum(a != b for a, b in zip(full, many))} "
+          f"index={sum(a != b for a, b in zip(full, indexed))} levenshtein={lev_mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Benchmark de endpoints de contabilidad y KPIs sobre datos sintéticos.
+
+Llena una base (ver benchmarks/seed), hace N requests por endpoint con el
+test client de Flask y reporta p50/p90/p99 de latencia y sentencias SQL por
+request. Con --out guarda el resultado en JSON; con --compare lo contrasta
+con un JSON anterior (ej. generado en otro commit).
+
+Uso:
+    python -m benchmarks.run [--orders 1000] [--repeat 20] [--out bench.json]
+    python -m benchmarks.run --database-url postgresql://localhost/kivi_bench --orders 5000
+    python -m benchmarks.run --database-url sqlite:////tmp/kivi-bench.db --no-seed --compare bench.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from dataclasses import asdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.seed import add_volume_arguments, create_bench_app, default_database_url, seed, volumes_from_args  # noqa: E402
+
+
+# (nombre, url); todas se piden con el token del admin
+ENDPOINTS = [
+    ("accounting.orders", "/api/accounting/orders"),
+    ("accounting.orders.details", "/api/accounting/orders?include_details=1"),
+    ("accounting.customers", "/api/accounting/customers"),
+    ("accounting.customers.orders", "/api/accounting/customers?include_orders=1&limit=100"),
+    ("accounting.excess", "/api/accounting/excess"),
+    ("accounting.vendors.commissions", "/api/accounting/vendors/commissions"),
+    ("kpis.overview", "/api/admin/kpis/overview"),
+    ("kpis.productos_top", "/api/admin/kpis/productos-top"),
+]
+
+
+def percentile(values, p: float) -> float:
+    """Percentil con interpolación lineal (p en 0..100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100.0
+    lo, hi = math.floor(k), math.ceil(k)
+    if lo == hi:
+        return ordered[lo]
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+class StatementCounter:
+    """Cuenta sentencias SQL ejecutadas por el engine."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_endpoints(flask_app, repeat: int, warmup: int = 1, only=None) -> dict:
+    from app.api.auth import _generate_token
+    from app.db import db
+    from app.models.user import User
+
+    client = flask_app.test_client()
+    with flask_app.app_context():
+        admin = User.query.filter_by(role="admin").order_by(User.id).first()
+        headers = {"Authorization": "Bearer " + _generate_token(admin)}
+        counter = StatementCounter(db.engine)
+
+    results = {}
+    for name, url in ENDPOINTS:
+        if only and name not in only:
+            continue
+        response = client.get(url, headers=headers)
+        if response.status_code == 404:
+            # endpoint no registrado en create_app
+            results[name] = {"url": url, "status": 404, "available": False}
+            continue
+        for _ in range(max(0, warmup - 1)):
+            client.get(url, headers=headers)
+
+        latencies, statements, sizes = [], [], []
+        status = response.status_code
+        for _ in range(repeat):
+            before = counter.count
+            start = time.perf_counter()
+            response = client.get(url, headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000.0)
+            statements.append(counter.count - before)
+            sizes.append(len(response.data))
+            status = response.status_code
+        results[name] = {
+            "url": url,
+            "status": status,
+            "available": True,
+            "requests": repeat,
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p90_ms": round(percentile(latencies, 90), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "max_ms": round(max(latencies), 3),
+            "sql_per_request": round(sum(statements) / len(statements), 1),
+            "sql_max": max(statements),
+            "response_bytes": sizes[-1],
+        }
+    return results
+
+
+def print_results(results: dict, baseline: dict = None) -> None:
+    base = (baseline or {}).get("results", {})
+    print(f"{'endpoint':32s} {'status':>6s} {'p50 ms':>9s} {'p90 ms':>9s} {'p99 ms':>9s} {'sql/req':>8s}"
+          + ("  p50 vs base" if base else ""))
+    for name, r in results.items():
+        if not r.get("available"):
+            print(f"{name:32s} {r['status']:6d}  no disponible")
+            continue
+        line = (f"{name:32s} {r['status']:6d} {r['p50_ms']:9.2f} {r['p90_ms']:9.2f} {r['p99_ms']:9.2f} "
+                f"{r['sql_per_request']:8.1f}")
+        b = base.get(name)
+        if b and b.get("available") and b.get("p50_ms"):
+            line += f"  {r['p50_ms'] / b['p50_ms']:5.2f}x (sql {b['sql_per_request']:.1f})"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None, help="Por defecto un SQLite temporal")
+    parser.add_argument("--no-seed", action="store_true", help="Usar los datos existentes de --database-url")
+    parser.add_argument("--repeat", type=int, default=20, help="Requests medidos por endpoint")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--endpoint", action="append", help="Medir solo estos endpoints (repetible)")
+    parser.add_argument("--response-cache", default="none", help="Backend de caché de respuestas (none|memory|sqlite)")
+    parser.add_argument("--out", help="Guardar resultados en este JSON")
+    parser.add_argument("--compare", help="JSON de una corrida anterior para comparar")
+    add_volume_arguments(parser)
+    args = parser.parse_args()
+
+    if args.no_seed and not args.database_url:
+        parser.error("--no-seed requiere --database-url")
+    database_url = args.database_url or default_database_url()
+    flask_app = create_bench_app(database_url, response_cache=args.response_cache)
+
+    volumes = volumes_from_args(args)
+    counts = None
+    if not args.no_seed:
+        start = time.perf_counter()
+        counts = seed(flask_app, volumes, seed=args.seed)
+        print(f"seed: {time.perf_counter() - start:.1f}s {counts}")
+
+    results = run_endpoints(flask_app, args.repeat, warmup=args.warmup, only=args.endpoint)
+    with flask_app.app_context():
+        from app.db import db
+        dialect = db.engine.dialect.name
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "dialect": dialect,
+            "response_cache": args.response_cache,
+            "volumes": None if args.no_seed else asdict(volumes),
+            "rows": counts,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"resultados en {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Datos sintéticos para benchmarks.
+
+Inserta con INSERT masivos (sin pasar por el ORM) y al final reconstruye las
+tablas derivadas (ledger, saldos, comisiones diarias, excedentes), igual que
+build.sh después de migrar.
+
+Uso:
+    python -m benchmarks.seed --database-url sqlite:////tmp/kivi-bench.db --orders 2000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+BENCH_PASSWORD = "bench"
+
+
+@dataclass
+class Volumes:
+    customers: int = 300
+    products: int = 120
+    vendors: int = 5
+    orders: int = 1000
+    items_per_order: int = 12
+    purchases_per_order: int = 8
+    # Fracción de cargos con pago aplicado
+    paid_ratio: float = 0.6
+    # Compras sin pedido (excedentes) por cada 100 pedidos
+    orphan_purchases_per_100: int = 5
+    days: int = 180
+
+
+def default_database_url() -> str:
+    return "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="kivi-bench-"), "bench.db")
+
+
+def create_bench_app(database_url: str, response_cache: str = "none"):
+    """create_app() apuntando a database_url. La caché de respuestas se desactiva por defecto."""
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["RESPONSE_CACHE_BACKEND"] = response_cache
+    import app.models.user  # noqa: F401 (create_app necesita users antes que orders)
+    from app import create_app
+    return create_app()
+
+
+def seed(flask_app, volumes: Volumes, seed: int = 7) -> dict:
+    """Llena la base de flask_app y retorna la cantidad de filas por tabla."""
+    from werkzeug.security import generate_password_hash
+
+    from app.db import db
+    from app.models.charge import Charge
+    from app.models.customer import Customer
+    from app.models.order import Order
+    from app.models.order_item import OrderItem
+    from app.models.payment import Payment, PaymentApplication
+    from app.models.product import Product
+    from app.models.purchase import Purchase
+    from app.models.user import User
+
+    rnd = random.Random(seed)
+    v = volumes
+    now = datetime.utcnow().replace(microsecond=0)
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+
+    with flask_app.app_context():
+        users = [{"id": 1, "email": "admin@bench.local", "password_hash": password_hash, "name": "Admin Bench",
+                  "role": "admin", "active": True, "commission_rate": 0.0}]
+        users += [
+            {"id": i + 1, "email": f"vendor{i}@bench.local", "password_hash": password_hash,
+             "name": f"Vendedor {i}", "role": "vendor", "active": True, "commission_rate": rnd.choice((0.3, 0.5))}
+            for i in range(1, v.vendors + 1)
+        ]
+        vendor_ids = [u["id"] for u in users if u["role"] == "vendor"] or [1]
+        db.session.execute(db.insert(User), users)
+
+        categories = ("fruta", "verdura", "otro")
+        db.session.execute(db.insert(Product), [
+            {"id": i, "name": f"Producto {i}", "default_unit": rnd.choice(("kg", "kg", "unit")),
+             "category": rnd.choice(categories)}
+            for i in range(1, v.products + 1)
+        ])
+        db.session.execute(db.insert(Customer), [
+            {"id": i, "name": f"Cliente {i}", "vendor_id": rnd.choice(vendor_ids)}
+            for i in range(1, v.customers + 1)
+        ])
+
+        orders, items, purchases, charges = [], [], [], []
+        product_ids = range(1, v.products + 1)
+        item_id = purchase_id = charge_id = 0
+        for order_id in range(1, v.orders + 1):
+            created_at = now - timedelta(days=v.days * (v.orders - order_id) / max(1, v.orders),
+                                         minutes=rnd.randint(0, 600))
+            orders.append({"id": order_id, "title": f"Pedido {order_id}", "status": "emitido",
+                           "vendor_id": rnd.choice(vendor_ids), "created_at": created_at})
+            ordered = rnd.sample(product_ids, min(v.products, max(1, v.items_per_order // 2)))
+            for _ in range(v.items_per_order):
+                item_id += 1
+                pid = rnd.choice(ordered)
+                unit = rnd.choice(("kg", "kg", "unit"))
+                qty = rnd.choice((0.5, 1.0, 1.5, 2.0, 3.0, 6.0))
+                charged_unit = rnd.choice((unit, "kg"))
+                charged_qty = qty if charged_unit == unit else round(qty * rnd.uniform(0.2, 0.4), 3)
+                price = float(rnd.randrange(500, 5000, 50))
+                customer_id = rnd.randint(1, v.customers)
+                items.append({"id": item_id, "order_id": order_id, "customer_id": customer_id, "product_id": pid,
+                              "qty": qty, "unit": unit, "charged_unit": charged_unit, "charged_qty": charged_qty,
+                              "sale_unit_price": price})
+                charge_id += 1
+                charges.append({"id": charge_id, "customer_id": customer_id, "order_id": order_id,
+                                "original_order_id": order_id, "order_item_id": item_id, "product_id": pid,
+                                "qty": qty, "charged_qty": charged_qty, "unit": unit, "unit_price": price,
+                                "discount_amount": 0.0, "status": "pending", "total": charged_qty * price,
+                                "created_at": created_at})
+            for pid in ordered[:v.purchases_per_order]:
+                purchase_id += 1
+                charged_unit = rnd.choice(("kg", "unit"))
+                qty_kg = rnd.choice((1.0, 2.0, 4.0, 8.0))
+                purchases.append({"id": purchase_id, "order_id": order_id, "product_id": pid,
+                                  "charged_unit": charged_unit, "qty_kg": qty_kg,
+                                  "qty_unit": rnd.choice((None, 4.0, 12.0)),
+                                  "eq_qty_kg": rnd.choice((None, 0.5)), "eq_qty_unit": rnd.choice((None, 3.0)),
+                                  "price_total": round(qty_kg * rnd.randrange(300, 3000, 50), 2),
+                                  "vendor": "Lo Valledor", "created_at": created_at})
+        for _ in range(v.orders * v.orphan_purchases_per_100 // 100):
+            purchase_id += 1
+            purchases.append({"id": purchase_id, "order_id": None, "product_id": rnd.choice(product_ids),
+                              "charged_unit": "kg", "qty_kg": rnd.choice((1.0, 2.0)),
+                              "price_total": 1000.0, "created_at": now})
+
+        payments, applications = [], []
+        for ch in charges:
+            if rnd.random() >= v.paid_ratio:
+                continue
+            amount = round(ch["total"], 2)
+            payments.append({"id": len(payments) + 1, "customer_id": ch["customer_id"], "amount": amount,
+                             "method": "transferencia", "date": ch["created_at"], "created_at": ch["created_at"]})
+            applications.append({"payment_id": len(payments), "charge_id": ch["id"], "amount": amount})
+            ch["status"] = "paid"
+            ch["paid_at"] = ch["created_at"]
+
+        for model, rows in ((Order, orders), (OrderItem, items), (Charge, charges), (Purchase, purchases),
+                            (Payment, payments), (PaymentApplication, applications)):
+            for i in range(0, len(rows), 5000):
+                db.session.execute(db.insert(model), rows[i:i + 5000])
+        db.session.commit()
+
+        from app.services.customer_balances import rebuild_customer_balances
+        from app.services.excess_inventory import rebuild_excess_inventory
+        from app.services.kpi_facts import refresh_kpi_facts
+        from app.services.order_ledger import rebuild_order_ledger
+        from app.services.vendor_commissions import rebuild_vendor_commissions
+        rebuild_order_ledger()
+        rebuild_customer_balances()
+        rebuild_vendor_commissions()
+        rebuild_excess_inventory()
+        # como `flask kpis-refresh` en el deploy: los KPIs leen las tablas diarias
+        refresh_kpi_facts(full=True)
+
+    return {
+        "users": len(users), "products": v.products, "customers": v.customers, "orders": len(orders),
+        "order_items": len(items), "charges": len(charges), "purchases": len(purchases),
+        "payments": len(payments), "payment_applications": len(applications),
+    }
+
+
+def add_volume_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = Volumes()
+    for name, value in asdict(defaults).items():
+        parser.add_argument("--" + name.replace("_", "-"), dest=name, type=type(value), default=value)
+    parser.add_argument("--seed", type=int, default=7)
+
+
+def volumes_from_args(args) -> Volumes:
+    return Volumes(**{name: getattr(args, name) for name in asdict(Volumes())})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None, help="Base vacía a llenar (por defecto un SQLite temporal)")
+    add_volume_arguments(parser)
+    args = parser.parse_args()
+
+    database_url = args.database_url or default_database_url()
+    counts = seed(create_bench_app(database_url), volumes_from_args(args), seed=args.seed)
+    print(database_url)
+    for table, n in counts.items():
+        print(f"  {table:22s} {n:8d}")
+
+
+if __name__ == "__main__":
+    main()
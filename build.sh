@@ -28,6 +28,16 @@ python migrate_add_weekly_offer_dates.py 2>/dev/null || echo "Migración ya apli
 python migrate_add_social_tables.py 2>/dev/null || echo "Migración ya aplicada o error menor"
 # Migración de story tables - solo crea tablas si no existen
 python migrate_add_story_tables.py 2>/dev/null || echo "Migración ya aplicada o error menor"
+# Índice parcial de compras sin pedido (excedentes) - solo crea el índice si no existe
+python migrate_add_orphan_purchase_index.py 2>/dev/null || echo "Migración ya aplicada o error menor"
+# Tablas contables derivadas (se mantienen en cada commit; se reconstruyen por si hubo escrituras fuera de la app)
+flask --app app.wsgi ledger-rebuild || echo "No se pudo reconstruir el ledger contable"
+flask --app app.wsgi vendor-commissions-backfill || echo "No se pudo reconstruir las comisiones diarias"
+flask --app app.wsgi customer-balances-rebuild || echo "No se pudo reconstruir los saldos de clientes"
+flask --app app.wsgi excess-rebuild || echo "No se pudo reconstruir el inventario de excedentes"
+# Hechos diarios de KPIs: solo los días escritos desde la última corrida (la primera vez, todos).
+# Programar también como cron (ej. cada hora) para que /admin/kpis calcule en vivo solo hoy.
+flask --app app.wsgi kpis-refresh || echo "No se pudo refrescar los KPIs diarios"
 # NOTA: migrate_update_weekly_offers_product_id.py NO se ejecuta automáticamente
 # porque podría borrar datos. Solo ejecutar manualmente si es necesario.
 
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Migración para agregar el índice parcial ix_purchases_orphan_product
+(compras sin pedido por producto) a la tabla purchases.
+
+db.create_all() solo crea índices de tablas nuevas; en bases existentes hay
+que crearlo aquí. Funciona en PostgreSQL y SQLite.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from sqlalchemy import text
+
+def migrate():
+    app = create_app()
+    with app.app_context():
+        from app.db import db
+
+        print("🔄 Creando índice 'ix_purchases_orphan_product' en la tabla 'purchases'...")
+
+        try:
+            db.session.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_purchases_orphan_product
+                ON purchases (product_id)
+                WHERE order_id IS NULL;
+            """))
+            db.session.commit()
+            print("   ✅ Índice 'ix_purchases_orphan_product' listo")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"   ❌ Error: {e}")
+            raise
+
+if __name__ == "__main__":
+    migrate()